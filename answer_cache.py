@@ -0,0 +1,206 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from prompts import build_prompt, normalize_question
+
+
+def cache_key(question, tier):
+    prompt = build_prompt(normalize_question(question))
+    return hashlib.sha256(f"{tier}\x00{prompt}".encode('utf-8')).hexdigest()
+
+
+def _entry_size(key, value):
+    return len(key) + len(value.encode('utf-8'))
+
+
+class MemoryBackend:
+    """Per-process LRU dict with TTL expiry and a byte budget."""
+
+    def __init__(self, ttl=86400, max_bytes=8 * 1024 * 1024, max_entries=10000):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = _entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time() + self.ttl)
+            self.size += size
+            while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        value, _ = self._entries.pop(key)
+        self.size -= _entry_size(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class SQLiteBackend:
+    """On-disk table shared by every gunicorn worker on the host.
+
+    Triggers keep the entry count and byte total in a one-row table, so a
+    write only evicts (least recently used first, through the accessed_at
+    index) when the cache is actually over budget.
+    """
+
+    def __init__(self, path, ttl=86400, max_bytes=64 * 1024 * 1024, max_entries=100000):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        # One transaction, so workers starting together count existing rows exactly once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answer_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_answer_cache_accessed_at ON answer_cache (accessed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_answer_cache_expires_at ON answer_cache (expires_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS answer_cache_totals ("
+                         " id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, bytes INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO answer_cache_totals (id, entries, bytes)"
+                         " SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM answer_cache")
+            conn.execute("CREATE TRIGGER IF NOT EXISTS answer_cache_inserted AFTER INSERT ON answer_cache BEGIN"
+                         " UPDATE answer_cache_totals SET entries = entries + 1, bytes = bytes + new.size; END")
+            conn.execute("CREATE TRIGGER IF NOT EXISTS answer_cache_deleted AFTER DELETE ON answer_cache BEGIN"
+                         " UPDATE answer_cache_totals SET entries = entries - 1, bytes = bytes - old.size; END")
+            conn.execute("CREATE TRIGGER IF NOT EXISTS answer_cache_resized AFTER UPDATE OF size ON answer_cache BEGIN"
+                         " UPDATE answer_cache_totals SET bytes = bytes + new.size - old.size; END")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _connect(self):
+        # sqlite3 connections can't be shared between threads, keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value FROM answer_cache WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute("UPDATE answer_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key, value):
+        size = _entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            # An upsert rather than INSERT OR REPLACE: REPLACE's implicit delete doesn't fire the totals trigger
+            conn.execute(
+                "INSERT INTO answer_cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size,"
+                " expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+                (key, value, size, now + self.ttl, now),
+            )
+            if self._over_budget(conn):
+                conn.execute("DELETE FROM answer_cache WHERE expires_at <= ?", (now,))
+            while self._over_budget(conn):
+                entries = conn.execute("SELECT entries FROM answer_cache_totals").fetchone()[0]
+                # Least recently used first; a few rows at a time when only the byte budget is exceeded
+                excess = entries - self.max_entries if entries > self.max_entries else 16
+                conn.execute("DELETE FROM answer_cache WHERE key IN"
+                             " (SELECT key FROM answer_cache ORDER BY accessed_at LIMIT ?)", (excess,))
+
+    def _over_budget(self, conn):
+        entries, total = conn.execute("SELECT entries, bytes FROM answer_cache_totals").fetchone()
+        return entries > self.max_entries or total > self.max_bytes
+
+    @property
+    def size(self):
+        return self._connect().execute("SELECT bytes FROM answer_cache_totals").fetchone()[0]
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM answer_cache")
+
+
+class AnswerCache:
+    """Cache of post-processed model answers keyed on normalized prompt and tier."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config, default_path):
+        kind = config['ANSWER_CACHE_BACKEND']
+        if kind == 'none':
+            return None
+        options = dict(ttl=config['ANSWER_CACHE_TTL'], max_bytes=config['ANSWER_CACHE_MAX_BYTES'],
+                       max_entries=config['ANSWER_CACHE_MAX_ENTRIES'])
+        if kind == 'sqlite':
+            return cls(SQLiteBackend(config['ANSWER_CACHE_PATH'] or default_path, **options))
+        if kind == 'memory':
+            return cls(MemoryBackend(**options))
+        raise ValueError(f"Unknown ANSWER_CACHE_BACKEND: {kind}")
+
+    def get(self, question, tier):
+        answer = self.backend.get(cache_key(question, tier))
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    def set(self, question, tier, answer):
+        self.backend.set(cache_key(question, tier), answer)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'bytes': self.backend.size,
+        }
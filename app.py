@@ -1,14 +1,28 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, \
+    session, make_response
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import requests
+import json
 import os
 import random
 import time
-from werkzeug.utils import secure_filename
 from flask_migrate import Migrate
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
 from dotenv import load_dotenv
+from inference_client import InferenceClient
+from local_engine import LocalT5Engine, LocalEngineError
+from batching import MicroBatcher
+from answer_cache import AnswerCache
+from single_flight import SingleFlight, SingleFlightError
+from prompts import build_prompt, clean_answer, question_key
+from storage import database_uri, sqlite_pragmas, configure_engine
+from metrics import Metrics, instrument, record_upstream
+from assets import Assets
+from avatars import AvatarPipeline, AvatarError
+from user_cache import UserCache
 
 load_dotenv()
 
@@ -20,13 +34,22 @@ app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'profile_pic
 # Ensure the upload directory exists at app startup
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Database configuration (always SQLite for ephemeral deployment)
+# Database configuration (SQLite in instance/ unless DATABASE_URL is set)
 instance_path = os.path.join(app.root_path, 'instance')
 os.makedirs(instance_path, exist_ok=True) # Ensure the instance directory exists
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(instance_path, 'site.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri(instance_path)
 
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
+metrics = Metrics.from_config(app.config)
+with app.app_context():
+    configure_engine(db.engine, sqlite_pragmas(app.config))
+    if app.config['METRICS_ENABLED']:
+        instrument(app, db.engine, metrics, log_requests=app.config['REQUEST_LOG'])
+# Fingerprinted, pre-compressed static files; templates link them with asset_url()
+assets = Assets.from_config(app.config, os.path.join(app.static_folder, 'dist'))
+app.add_url_rule('/assets/<path:filename>', 'asset', assets.send)
+app.jinja_env.globals['asset_url'] = assets.url
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -47,6 +70,48 @@ HEADERS = {
     "Authorization": f"Bearer {os.environ.get('HF_API_TOKEN')}",
     "Content-Type": "application/json"
 }
+API_URLS = {'normal': API_URL_NORMAL, 'upgraded': API_URL_UPGRADED}
+inference_client = InferenceClient.from_config(app.config, HEADERS)
+local_engine = LocalT5Engine.from_config(app.config) if app.config['INFERENCE_BACKEND'] == 'local' else None
+answer_cache = AnswerCache.from_config(app.config, os.path.join(instance_path, 'answer_cache.db'))
+domain_gate = None
+if app.config['DOMAIN_GATE_ENABLED']:
+    from domain_gate import DomainGate
+    domain_gate = DomainGate.from_config(app.config, os.path.join(instance_path, 'domain_gate.npz'))
+faq_index = None
+if app.config['FAQ_ENABLED']:
+    from faq_index import FaqIndex
+    faq_index = FaqIndex.from_config(app.config, os.path.join(instance_path, 'faq_index'))
+single_flight = None
+if app.config['COALESCE_ENABLED']:
+    single_flight = SingleFlight.from_config(app.config, os.path.join(instance_path, 'single_flight.db'))
+context_builder = None
+if app.config['CONTEXT_TOKEN_BUDGET'] > 0:
+    from context import ContextBuilder # loads the tokenizer on first use
+    context_builder = ContextBuilder.from_config(app.config)
+user_cache = UserCache.from_config(app.config) if app.config['USER_CACHE_ENABLED'] else None
+render_cache = None
+if app.config['RENDER_CACHE_ENABLED']:
+    from render_cache import RenderCache, files_fingerprint
+    # Pages change with the template, the built asset names and job-queue settings
+    page_salt = files_fingerprint([os.path.join(app.root_path, 'templates', 'chat.html')]) + assets.fingerprint \
+        + str(app.config['JOB_QUEUE_ENABLED']) + str(app.config['JOB_MAX_WAIT_SECONDS'])
+    render_cache = RenderCache.from_config(app.config, salt=page_salt)
+semantic_cache = None
+if app.config['SEMANTIC_CACHE_ENABLED']:
+    from semantic_cache import SemanticCache # numpy is only needed when enabled
+    semantic_cache = SemanticCache.from_config(app.config, os.path.join(instance_path, 'semantic_index'))
+
+inference_seconds = metrics.histogram(
+    'agribot_inference_duration_seconds', 'Upstream/local generation latency by tier.', ('tier', 'backend', 'outcome'))
+first_token_seconds = metrics.histogram(
+    'agribot_stream_first_token_seconds', 'Time to the first streamed token by tier and answer source.',
+    ('tier', 'source'))
+cache_lookups = metrics.counter('agribot_cache_lookups_total', 'Answer cache lookups.', ('cache', 'result'))
+errors = metrics.counter('agribot_errors_total', 'Errors by kind.', ('kind',))
+answers = metrics.counter('agribot_answers_total', 'Chat answers by where they came from.', ('source',))
+coalesced = metrics.counter('agribot_coalesced_generations_total',
+                            'Generations shared with an identical in-flight request (upstream calls saved).', ('scope',))
 
 # Database Models
 class User(UserMixin, db.Model):
@@ -58,25 +123,131 @@ class User(UserMixin, db.Model):
     profile_picture = db.Column(db.String(255), default='default.jpg')
     is_upgraded = db.Column(db.Boolean, default=False)
     show_welcome_popup = db.Column(db.Boolean, default=True)
+    # Bumped with every change to the user's conversations or messages; keys the render cache and page ETags
+    content_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     conversations = db.relationship('Conversation', backref='user', lazy='dynamic', cascade="all, delete-orphan")
 
 class Conversation(db.Model):
+    # Sidebar: a user's conversations, newest first. AUTOINCREMENT so a queued job can't deliver into a new
+    # conversation that took a deleted one's id
+    __table_args__ = (db.Index('ix_conversation_user_id_created_at', 'user_id', 'created_at'),
+                      {'sqlite_autoincrement': True})
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    messages = db.relationship('Message', backref='conversation', lazy='dynamic', cascade="all, delete-orphan")
 
 class Message(db.Model):
+    # Conversation page: a conversation's messages in timestamp order. AUTOINCREMENT so SQLite never hands a
+    # deleted message's id to a new one; the semantic cache refers to answers by id
+    __table_args__ = (db.Index('ix_message_conversation_id_timestamp', 'conversation_id', 'timestamp'),
+                      {'sqlite_autoincrement': True})
     id = db.Column(db.Integer, primary_key=True)
     conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=False)
     sender = db.Column(db.String(10), nullable=False) # 'user' or 'ai'
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=db.func.current_timestamp())
+    token_count = db.Column(db.Integer) # tokenizer length of content, set on write when the context window is on
+
+def generate_batch(prompts, tier):
+    if local_engine is not None:
+        return local_engine.generate_batch(prompts, tier)
+    # Pooled keep-alive session; raises RequestException on HTTP errors, timeouts or an open circuit
+    return inference_client.generate_batch(API_URLS[tier], prompts)
+
+batcher = MicroBatcher.from_config(app.config, generate_batch, metrics) if app.config['INFERENCE_BATCHING'] else None
+
+def generate_answer(prompt, tier):
+    if batcher is not None:
+        return batcher.generate(prompt, tier)
+    if local_engine is not None:
+        return local_engine.generate(prompt, tier)
+    return inference_client.generate(API_URLS[tier], prompt)
+
+# Another worker may have bumped it since the row was cached; a stale value would give a page the old ETag
+UNCACHED_USER_COLUMNS = ('content_version',)
 
 @login_manager.user_loader
 def load_user(user_id):
     # return User.query.get(int(user_id)) # Deprecated
-    return db.session.get(User, int(user_id))
+    user_id = int(user_id)
+    values = user_cache.get(user_id) if user_cache is not None else None
+    if values is None:
+        user = db.session.get(User, user_id)
+        if user is not None and user_cache is not None:
+            user_cache.set(user_id, {column.key: getattr(user, column.key) for column in User.__table__.columns
+                                     if column.key not in UNCACHED_USER_COLUMNS})
+        return user
+    # Attach the cached row to this request's session as if just loaded, without a SELECT;
+    # the uncached columns are left expired and loaded fresh on first access
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+def forget_user(user_id):
+    # Dropped now and again once the change commits, in case a concurrent request re-cached the old row meanwhile
+    if user_cache is not None:
+        user_cache.forget(user_id)
+        db.session.info.setdefault('changed_users', set()).add(user_id)
+
+@event.listens_for(db.session, 'after_commit')
+def forget_committed_users(session):
+    for user_id in session.info.pop('changed_users', ()):
+        user_cache.forget(user_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def keep_rolled_back_users(session):
+    session.info.pop('changed_users', None)
+
+def bump_content_version(user_id):
+    # Part of the caller's transaction, so cached pages can't outlive the change; only the render cache reads it
+    if render_cache is None:
+        return
+    User.query.filter_by(id=user_id).update({User.content_version: User.content_version + 1},
+                                            synchronize_session=False)
+    forget_user(user_id)
+
+def set_profile_picture(user_id, picture):
+    # Called from the avatar worker thread once the thumbnails are written
+    with app.app_context():
+        User.query.filter_by(id=user_id).update({User.profile_picture: picture}, synchronize_session=False)
+        forget_user(user_id)
+        db.session.commit()
+
+def sidebar_conversations(user_id):
+    # Only the columns the sidebar shows, as plain rows instead of ORM objects
+    return db.session.execute(
+        db.select(Conversation.id, Conversation.title, Conversation.created_at)
+        .filter_by(user_id=user_id).order_by(Conversation.created_at.desc())).all()
+
+avatar_pipeline = AvatarPipeline.from_config(app.config, set_profile_picture)
+app.jinja_env.globals['avatar_urls'] = avatar_pipeline.urls
+
+@app.errorhandler(413)
+def request_too_large(error):
+    if request.endpoint == 'settings':
+        flash(f"Profile pictures can be at most {app.config['AVATAR_MAX_BYTES'] // (1024 * 1024)} MB.", 'error')
+        return redirect(url_for('settings'))
+    return error
+
+def cached_page(render):
+    # Chat pages only depend on the user's (versioned) conversations and profile; pending flashes are one-off
+    if render_cache is None or session.get('_flashes'):
+        return render()
+    etag = render_cache.etag(current_user, request.full_path)
+    if request.if_none_match.contains(etag):
+        render_cache.record_not_modified()
+        response = make_response('', 304)
+    else:
+        html = render_cache.get(etag)
+        if html is None:
+            html = render()
+            render_cache.set(etag, html)
+        response = make_response(html)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 # Routes
 @app.route('/')
@@ -146,8 +317,11 @@ def welcome():
 @app.route('/chat')
 @login_required
 def chat():
-    conversations = current_user.conversations.order_by(Conversation.created_at.desc()).all()
-    return render_template('chat.html', conversations=conversations, show_welcome_popup_on_load=current_user.show_welcome_popup)
+    def render():
+        conversations = sidebar_conversations(current_user.id)
+        return render_template('chat.html', conversations=conversations,
+                               show_welcome_popup_on_load=current_user.show_welcome_popup)
+    return cached_page(render)
 
 @app.route('/chat/new', methods=['POST'])
 @login_required
@@ -158,26 +332,210 @@ def new_chat():
     
     new_conversation = Conversation(user_id=current_user.id, title="New Chat")
     db.session.add(new_conversation)
+    bump_content_version(current_user.id)
     db.session.commit()
     return redirect(url_for('conversation', conversation_id=new_conversation.id))
 
 @app.route('/chat/<int:conversation_id>')
 @login_required
 def conversation(conversation_id):
+    def render():
+        conversation = Conversation.query.filter_by(id=conversation_id, user_id=current_user.id).first_or_404()
+        # Only the latest page is rendered; older messages are fetched from conversation_messages on scroll
+        messages, has_more = message_page(conversation, app.config['MESSAGE_PAGE_SIZE'])
+        conversations = sidebar_conversations(current_user.id)
+        return render_template('chat.html', current_conversation=conversation, messages=messages,
+                               conversations=conversations, has_more_messages=has_more)
+    # A page for someone else's (or a deleted) conversation 404s on render and is never cached
+    return cached_page(render)
+
+def message_page(conversation, limit, before_id=None):
+    # Keyset pagination on (timestamp, id), newest first, served by ix_message_conversation_id_timestamp
+    query = conversation.messages.order_by(Message.timestamp.desc(), Message.id.desc())
+    if before_id is not None:
+        # Read the cursor's timestamp in SQL so it is compared exactly as stored
+        before_timestamp = db.select(Message.timestamp) \
+            .where(Message.id == before_id, Message.conversation_id == conversation.id).scalar_subquery()
+        query = query.filter(db.or_(Message.timestamp < before_timestamp,
+                                    db.and_(Message.timestamp == before_timestamp, Message.id < before_id)))
+    messages = query.limit(limit + 1).all()
+    return messages[:limit][::-1], len(messages) > limit
+
+@app.route('/chat/<int:conversation_id>/messages')
+@login_required
+def conversation_messages(conversation_id):
     conversation = Conversation.query.filter_by(id=conversation_id, user_id=current_user.id).first_or_404()
-    messages = Message.query.filter_by(conversation_id=conversation.id).order_by(Message.timestamp.asc()).all()
-    conversations = current_user.conversations.order_by(Conversation.created_at.desc()).all()
-    return render_template('chat.html', current_conversation=conversation, messages=messages, conversations=conversations)
+    limit = min(request.args.get('limit', app.config['MESSAGE_PAGE_SIZE'], type=int), app.config['MESSAGE_PAGE_SIZE_MAX'])
+    before_id = request.args.get('before_id', type=int)
+    if before_id is None:
+        return jsonify({'message': 'before_id is required.', 'category': 'error'}), 400
+    messages, has_more = message_page(conversation, max(limit, 1), before_id)
+    return jsonify({
+        'messages': [{'id': m.id, 'sender': m.sender, 'content': m.content, 'timestamp': m.timestamp.isoformat()}
+                     for m in messages],
+        'has_more': has_more,
+    })
 
 @app.route('/chat/<int:conversation_id>/delete', methods=['POST'])
 @login_required
 def delete_conversation(conversation_id):
     conversation = Conversation.query.filter_by(id=conversation_id, user_id=current_user.id).first_or_404()
-    db.session.delete(conversation)
-    Message.query.filter_by(conversation_id=conversation.id).delete()
+    forget_answers(Message.conversation_id == conversation.id)
+    # Set-based deletes; avoids loading every message through the ORM cascade
+    conversation.messages.delete(synchronize_session=False)
+    Conversation.query.filter_by(id=conversation.id).delete(synchronize_session=False)
+    bump_content_version(current_user.id)
     db.session.commit()
     return jsonify({'message': 'Conversation deleted successfully.', 'category': 'success'})
 
+TROUBLE_CONNECTING = "Sorry, I'm having trouble connecting to the AI. Please try again later."
+OUT_OF_DOMAIN = "Out-of-domain: I can only answer agriculture questions."
+INFERENCE_ERRORS = (requests.exceptions.RequestException, LocalEngineError, SingleFlightError)
+
+def answer_without_model(user_input, tier):
+    # Refuse off-topic questions before spending a cache lookup or a generation on them
+    if domain_gate is not None and not domain_gate.allows(user_input):
+        return OUT_OF_DOMAIN, 'out_of_domain'
+    return cached_answer(user_input, tier)
+
+def cached_answer(user_input, tier):
+    # (answer, source) without the model, or (None, None); cached answers are stored already post-processed
+    ai_response_content = answer_cache.get(user_input, tier) if answer_cache else None
+    if answer_cache:
+        cache_lookups.inc(cache='exact', result='miss' if ai_response_content is None else 'hit')
+    if ai_response_content is not None:
+        return ai_response_content, 'exact'
+    if faq_index is not None:
+        # Curated dataset answer when the question confidently matches one in the dataset
+        ai_response_content = faq_index.lookup(user_input)
+        cache_lookups.inc(cache='faq', result='miss' if ai_response_content is None else 'hit')
+        if ai_response_content is not None:
+            return ai_response_content, 'faq'
+    if semantic_cache:
+        # Paraphrase of a question we've already answered
+        match = semantic_cache.lookup(user_input, tier)
+        similar = indexed_answer(*match) if match else None
+        cache_lookups.inc(cache='semantic', result='hit' if similar else 'miss')
+        if similar:
+            if answer_cache:
+                answer_cache.set(user_input, tier, similar.content)
+            return similar.content, 'semantic'
+    return None, None
+
+def indexed_answer(message_id, key):
+    # The AI message a semantic-cache row points at, if it still answers the question the row was indexed
+    # from; another worker's index may not know the conversation was deleted
+    message = db.session.get(Message, message_id)
+    if message is None or message.sender != 'ai':
+        return None
+    question = Message.query.filter(Message.conversation_id == message.conversation_id, Message.id < message.id) \
+        .order_by(Message.id.desc()).first()
+    if question is None or question.sender != 'user' or question_key(question.content) != key:
+        return None
+    return message
+
+def forget_answers(condition):
+    # Drop the AI messages about to be deleted from this worker's semantic index
+    if semantic_cache:
+        semantic_cache.discard(db.session.scalars(db.select(Message.id).where(condition, Message.sender == 'ai')))
+
+def remember_answer(user_input, tier, ai_message):
+    # Only called for freshly generated answers, after the AI message is committed
+    if answer_cache:
+        answer_cache.set(user_input, tier, ai_message.content)
+    if semantic_cache:
+        semantic_cache.add(user_input, ai_message.id, tier)
+
+def new_message(conversation_id, sender, content):
+    token_count = context_builder.count(content) if context_builder is not None else None
+    return Message(conversation_id=conversation_id, sender=sender, content=content, token_count=token_count)
+
+def conversation_history(conversation_id):
+    # (content, token_count) of the latest messages, newest first; empty unless the context window is on
+    if context_builder is None:
+        return []
+    return db.session.query(Message.content, Message.token_count).filter_by(conversation_id=conversation_id) \
+        .order_by(Message.timestamp.desc(), Message.id.desc()).limit(context_builder.max_messages).all()
+
+def turn_prompt(user_input, history):
+    # (prompt, with_history); history is taken newest first up to CONTEXT_TOKEN_BUDGET tokens
+    if context_builder is None:
+        return build_prompt(user_input), False
+    return context_builder.build(user_input, history)
+
+def generate_reply(user_input, tier, history=()):
+    # (raw answer, cacheable); answers that depend on earlier turns or were shared aren't cached again
+    prompt, with_history = turn_prompt(user_input, history)
+    if single_flight is None or with_history:
+        return generate_answer(prompt, tier), not with_history
+    # An identical question already being generated here or in another worker is waited on
+    answer, shared = single_flight.run(user_input, tier, lambda: generate_answer(prompt, tier))
+    if shared:
+        coalesced.inc(scope=shared)
+    return answer, not shared
+
+def stream_answer(prompt, tier):
+    if local_engine is not None:
+        yield from local_engine.stream(prompt, tier)
+    elif app.config['REMOTE_STREAMING']:
+        yield from inference_client.stream(API_URLS[tier], prompt)
+    else:
+        yield generate_answer(prompt, tier)
+
+def observe_inference(tier, started, outcome):
+    elapsed = time.perf_counter() - started
+    inference_seconds.observe(elapsed, tier=tier, backend=app.config['INFERENCE_BACKEND'], outcome=outcome)
+    record_upstream(elapsed)
+
+def inference_failed(tier, started, e):
+    observe_inference(tier, started, 'error')
+    errors.inc(kind=f"inference_{type(e).__name__}")
+    print(f"API call failed: {e}")
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def save_turn(user_id, conversation_id, user_input, ai_response_content):
+    # Both messages of a turn go in one transaction (one SQLite write lock instead of two)
+    user_message = new_message(conversation_id, 'user', user_input)
+    ai_message = new_message(conversation_id, 'ai', ai_response_content)
+    db.session.add_all([user_message, ai_message])
+    bump_content_version(user_id)
+    db.session.commit()
+    return ai_message
+
+def generate_for_job(user_input, tier):
+    # Runs on a job queue thread, once for all queued twins of the prompt
+    started = time.perf_counter()
+    try:
+        # Queued questions are answered on their own, so identical ones can share a generation
+        answer, cacheable = generate_reply(user_input, tier)
+        observe_inference(tier, started, 'ok')
+        return {'answer': clean_answer(answer), 'source': 'model', 'fresh': cacheable}
+    except INFERENCE_ERRORS as e:
+        inference_failed(tier, started, e)
+        return {'answer': TROUBLE_CONNECTING, 'source': 'error', 'fresh': False}
+
+def deliver_job(job, result):
+    with app.app_context():
+        conversation = db.session.get(Conversation, job['conversation_id'])
+        if conversation is None or conversation.user_id != job['user_id']:
+            return None # deleted while the job was queued
+        ai_message = new_message(conversation.id, 'ai', result['answer'])
+        db.session.add(ai_message)
+        bump_content_version(conversation.user_id)
+        db.session.commit()
+        answers.inc(source=result['source'])
+        # Cache the answer once, not once per deduplicated job
+        if result.pop('fresh', False) and result['answer']:
+            remember_answer(job['user_input'], job['tier'], ai_message)
+        return ai_message.id
+
+job_queue = None
+if app.config['JOB_QUEUE_ENABLED']:
+    from job_queue import JobQueue
+    job_queue = JobQueue.from_config(app.config, os.path.join(instance_path, 'jobs.db'), generate_for_job, deliver_job)
+
 @app.route('/send_message', methods=['POST'])
 @login_required
 def send_message():
@@ -185,38 +543,118 @@ def send_message():
     conversation_id = request.form.get('conversation_id')
 
     conversation = Conversation.query.filter_by(id=conversation_id, user_id=current_user.id).first_or_404()
-    
-    # Save user message
-    user_message = Message(conversation_id=conversation.id, sender='user', content=user_input)
-    db.session.add(user_message)
-    db.session.commit()
-
-    # Determine which API to use
-    api_url = API_URL_UPGRADED if current_user.is_upgraded else API_URL_NORMAL
-    
-    ai_response_content = ""
-    try:
-        data = {"inputs": f"question: {user_input} context: agriculture </s>"}
-        response = requests.post(api_url, headers=HEADERS, json=data)
-        response.raise_for_status() # Raise an exception for HTTP errors
-        ai_response_content = response.json()[0]['generated_text']
-        # Extract only the answer part
-        if "answer:" in ai_response_content:
-            ai_response_content = ai_response_content.split("answer:", 1)[1].strip()
-        
-        # Add a full stop if the response doesn't end with punctuation
-        if ai_response_content and not ai_response_content.strip().endswith( ('.', '!', '?') ):
-            ai_response_content += '.'
-
-    except requests.exceptions.RequestException as e:
-        print(f"API call failed: {e}")
-        ai_response_content = "Sorry, I'm having trouble connecting to the AI. Please try again later."
-
-    ai_message = Message(conversation_id=conversation.id, sender='ai', content=ai_response_content)
-    db.session.add(ai_message)
-    db.session.commit()
+    conversation_id = conversation.id
+
+    # Determine which model tier to use
+    tier = 'upgraded' if current_user.is_upgraded else 'normal'
+    user_id = current_user.id
+
+    ai_response_content, source = answer_without_model(user_input, tier)
+    if ai_response_content is None and job_queue is not None:
+        # Save the question now; a queue worker saves the answer and the client polls /jobs/<id>
+        user_message = new_message(conversation_id, 'user', user_input)
+        db.session.add(user_message)
+        bump_content_version(current_user.id)
+        db.session.commit()
+        job_id = job_queue.enqueue(user_input, tier, conversation_id, user_message.id, user_id)
+        return jsonify({'job_id': job_id, 'status': 'queued', 'conversation_id': conversation_id}), 202
+    history = conversation_history(conversation_id) if ai_response_content is None else []
+    # Give the pooled connection back while waiting on the model
+    db.session.close()
+    generated = False
+    if ai_response_content is None:
+        started = time.perf_counter()
+        try:
+            answer, generated = generate_reply(user_input, tier, history)
+            ai_response_content = clean_answer(answer)
+            source = 'model'
+            observe_inference(tier, started, 'ok')
+        except INFERENCE_ERRORS as e:
+            inference_failed(tier, started, e)
+            ai_response_content = TROUBLE_CONNECTING
+            source = 'error'
+    answers.inc(source=source)
+
+    ai_message = save_turn(user_id, conversation_id, user_input, ai_response_content)
+    if generated and ai_response_content:
+        remember_answer(user_input, tier, ai_message)
+
+    return jsonify({'ai_response': ai_response_content, 'conversation_id': conversation_id})
+
+@app.route('/send_message/stream', methods=['POST'])
+@login_required
+def send_message_stream():
+    user_input = request.form.get('user_input')
+    conversation_id = request.form.get('conversation_id')
 
-    return jsonify({'ai_response': ai_response_content, 'conversation_id': conversation.id})
+    conversation = Conversation.query.filter_by(id=conversation_id, user_id=current_user.id).first_or_404()
+    conversation_id = conversation.id
+
+    tier = 'upgraded' if current_user.is_upgraded else 'normal'
+    user_id = current_user.id # current_user isn't usable once the session is closed
+    ai_response_content, cached_source = answer_without_model(user_input, tier)
+    history = conversation_history(conversation_id) if ai_response_content is None else []
+    db.session.close()
+
+    def events():
+        started = time.perf_counter()
+        first_token_at = None
+        generated = False
+        source = cached_source
+        if ai_response_content is not None:
+            answer = ai_response_content
+            first_token_at = time.perf_counter()
+            yield sse('token', {'text': answer})
+        else:
+            pieces = []
+            try:
+                prompt, with_history = turn_prompt(user_input, history)
+                for piece in stream_answer(prompt, tier):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    pieces.append(piece)
+                    yield sse('token', {'text': piece})
+                answer = clean_answer(''.join(pieces))
+                generated = not with_history
+                source = 'model'
+                observe_inference(tier, started, 'ok')
+            except INFERENCE_ERRORS as e:
+                inference_failed(tier, started, e)
+                answer = TROUBLE_CONNECTING
+                source = 'error'
+        answers.inc(source=source)
+
+        # Persist the turn once, after the last token
+        ai_message = save_turn(user_id, conversation_id, user_input, answer)
+        if generated and answer:
+            remember_answer(user_input, tier, ai_message)
+
+        # The whole stream is timed by the request histogram, which is recorded once the body has been sent
+        first_token_seconds.observe((first_token_at or time.perf_counter()) - started, tier=tier, source=source)
+        # The final text is post-processed (answer: split, full stop), the client swaps it in
+        yield sse('done', {'ai_response': answer, 'conversation_id': conversation_id})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = job_queue.get(job_id) if job_queue else None
+    if job is None or job['user_id'] != current_user.id:
+        return jsonify({'message': 'Job not found.', 'category': 'error'}), 404
+    # ?wait=N long-polls up to N seconds (at most JOB_MAX_WAIT_SECONDS) for the answer
+    wait = min(max(request.args.get('wait', 0, type=float), 0), app.config['JOB_MAX_WAIT_SECONDS'])
+    if wait and job['status'] in ('queued', 'running'):
+        db.session.close()
+        job = job_queue.get(job_id, wait=wait)
+    response = {'job_id': job_id, 'status': job['status'], 'conversation_id': job['conversation_id']}
+    if job['status'] == 'done':
+        ai_message = db.session.get(Message, job['message_id']) if job['message_id'] else None
+        response['ai_response'] = ai_message.content if ai_message else TROUBLE_CONNECTING
+    elif job['status'] == 'failed':
+        response['ai_response'] = TROUBLE_CONNECTING
+    return jsonify(response)
 
 @app.route('/upgrade', methods=['GET', 'POST'])
 @login_required
@@ -240,6 +678,7 @@ def upgrade():
 
         if user_answer and correct_answer and user_answer.lower() == correct_answer.lower():
             current_user.is_upgraded = True
+            forget_user(current_user.id)
             db.session.commit()
             flash('Congratulations! You have been upgraded to the better AI model.')
             return redirect(url_for('settings'))
@@ -252,18 +691,20 @@ def upgrade():
 def settings():
     if request.method == 'POST':
         # Handle profile picture update
+        message = 'Settings updated successfully!'
         if 'profile_picture' in request.files and request.files['profile_picture'].filename != '':
-            file = request.files['profile_picture']
-            filename = secure_filename(file.filename)
-            unique_filename = f"{current_user.id}_{int(time.time())}_{filename}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(file_path)
-            current_user.profile_picture = unique_filename
-        
+            try:
+                avatar_pipeline.submit(request.files['profile_picture'], current_user.id)
+            except AvatarError as e:
+                flash(str(e), 'error')
+                return redirect(url_for('settings'))
+            message += ' Your new profile picture will appear in a moment.'
+
         # Handle welcome popup toggle (now part of the same form)
         current_user.show_welcome_popup = 'show_welcome_popup' in request.form
+        forget_user(current_user.id)
         db.session.commit()
-        flash('Settings updated successfully!', 'success')
+        flash(message, 'success')
         return redirect(url_for('settings'))
 
     return render_template('settings.html', show_welcome_popup_setting=current_user.show_welcome_popup)
@@ -275,6 +716,7 @@ def rename_conversation(conversation_id):
     new_title = request.form.get('new_title')
     if new_title:
         conversation.title = new_title
+        bump_content_version(current_user.id)
         db.session.commit()
         return jsonify({'message': 'Conversation renamed successfully.', 'category': 'success', 'new_title': new_title})
     return jsonify({'message': 'Failed to rename conversation.', 'category': 'error'}), 400
@@ -282,17 +724,44 @@ def rename_conversation(conversation_id):
 @app.route('/chat/clear_all', methods=['POST'])
 @login_required
 def clear_all_conversations():
-    conversations = Conversation.query.filter_by(user_id=current_user.id).all()
-    for conv in conversations:
-        Message.query.filter_by(conversation_id=conv.id).delete()
-        db.session.delete(conv)
+    user_conversation_ids = db.select(Conversation.id).filter_by(user_id=current_user.id)
+    forget_answers(Message.conversation_id.in_(user_conversation_ids))
+    Message.query.filter(Message.conversation_id.in_(user_conversation_ids)).delete(synchronize_session=False)
+    Conversation.query.filter_by(user_id=current_user.id).delete(synchronize_session=False)
+    bump_content_version(current_user.id)
     db.session.commit()
     flash('All conversations cleared successfully.', 'success')
     return redirect(url_for('chat'))
 
+@app.route('/metrics')
+def prometheus_metrics():
+    if not app.config['METRICS_ENABLED']:
+        return 'Metrics are disabled.', 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def answered_question_pairs():
+    # (question, ai_message_id, tier) for every AI reply that follows a user message
+    rows = db.session.query(Message, User.is_upgraded).join(Conversation, Message.conversation_id == Conversation.id) \
+        .join(User, Conversation.user_id == User.id) \
+        .order_by(Message.conversation_id, Message.timestamp, Message.id)
+    previous = None
+    for message, is_upgraded in rows.yield_per(1000):
+        if message.sender == 'ai' and previous is not None and previous.sender == 'user' \
+                and previous.conversation_id == message.conversation_id:
+            yield previous.content, message.id, 'upgraded' if is_upgraded else 'normal'
+        previous = message
+
 # Initialize database
 with app.app_context():
     db.create_all()
+    if semantic_cache is not None and semantic_cache.size == 0:
+        semantic_cache.rebuild(answered_question_pairs())
+
+if local_engine is not None and app.config['LOCAL_WARMUP']:
+    try:
+        local_engine.warm_up()
+    except LocalEngineError as e:
+        print(f"Local model warm-up failed: {e}")
 
 if __name__ == '__main__':
     # Create the profile_pics directory if it doesn't exist
@@ -0,0 +1,159 @@
+"""Fingerprinted, pre-compressed static assets served with immutable caching.
+
+``python assets.py build`` copies every file under ``static/`` (except user
+uploads) to ``static/dist/`` under a name containing its content hash,
+writes ``.gz`` (and, with the ``brotli`` package installed, ``.br``) copies
+of the text assets, and records the names in ``manifest.json``. Templates
+link assets through ``asset_url('style.css')``; ``/assets/<name>`` sends the
+smallest encoding the browser accepts with a one-year immutable
+Cache-Control, so repeat page loads don't even revalidate them. A changed
+file gets a new name, which is what invalidates it.
+
+    python assets.py build
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import request, send_from_directory, url_for
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.html', '.json', '.txt')
+SKIP_DIRS = ('dist', 'profile_pics')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # preferred first
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+
+def fingerprinted_name(name, data):
+    root, ext = os.path.splitext(name)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def _write(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build_assets(static_dir, output_dir):
+    """Write the fingerprinted copies and their compressed variants; returns the manifest."""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for file_name in sorted(files):
+            path = os.path.join(root, file_name)
+            name = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+            hashed = fingerprinted_name(name, data)
+            target = os.path.join(output_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _write(target, data)
+            if name.endswith(COMPRESSIBLE):
+                variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+                if brotli is not None:
+                    variants['.br'] = brotli.compress(data, quality=11)
+                for suffix, compressed in variants.items():
+                    # Only keep encodings that actually save bytes
+                    if len(compressed) < len(data):
+                        _write(target + suffix, compressed)
+            manifest[name] = hashed
+    _write(os.path.join(output_dir, 'manifest.json'), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    # Drop files from earlier builds that the manifest no longer mentions
+    keep = set(manifest.values()) | {'manifest.json'}
+    for root, _, files in os.walk(output_dir):
+        for file_name in files:
+            name = os.path.relpath(os.path.join(root, file_name), output_dir).replace(os.sep, '/')
+            for _, suffix in ENCODINGS:
+                if name.endswith(suffix):
+                    name = name[:-len(suffix)]
+            if name not in keep:
+                os.remove(os.path.join(root, file_name))
+    return manifest
+
+
+class Assets:
+    """``url(name)`` for templates and ``send(filename)`` for the ``/assets/`` route."""
+
+    def __init__(self, output_dir, max_age=31536000):
+        self.output_dir = output_dir
+        self.max_age = max_age
+        self.manifest = {}
+        manifest_path = os.path.join(output_dir, 'manifest.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            print(f"No asset manifest at {manifest_path}; serving unversioned files from static/ "
+                  f"(build it with `python assets.py build`)")
+
+    @classmethod
+    def from_config(cls, config, default_dir):
+        return cls(config['ASSETS_DIR'] or default_dir, max_age=config['ASSETS_MAX_AGE'])
+
+    @property
+    def fingerprint(self):
+        return hashlib.sha1(json.dumps(self.manifest, sort_keys=True).encode()).hexdigest()[:12]
+
+    def url(self, name):
+        hashed = self.manifest.get(name)
+        if hashed is None:
+            return url_for('static', filename=name)
+        return url_for('asset', filename=hashed)
+
+    def send(self, filename):
+        accepted = request.accept_encodings
+        encoding = None
+        for candidate, suffix in ENCODINGS:
+            if accepted[candidate] and os.path.exists(os.path.join(self.output_dir, filename + suffix)):
+                encoding = candidate
+                break
+        path = filename + dict(ENCODINGS)[encoding] if encoding else filename
+        # Named after their content, so they never change; no revalidation needed
+        response = send_from_directory(self.output_dir, path, mimetype=_mimetype(filename), max_age=self.max_age,
+                                       etag=False, conditional=True)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+
+def _mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='fingerprint and compress static/ into static/dist/')
+    here = os.path.dirname(os.path.abspath(__file__))
+    build.add_argument('--static', default=os.path.join(here, 'static'))
+    build.add_argument('--output', default=os.path.join(here, 'static', 'dist'))
+    build.add_argument('--clean', action='store_true', help='remove the output directory first')
+    args = parser.parse_args()
+
+    if args.clean:
+        shutil.rmtree(args.output, ignore_errors=True)
+    manifest = build_assets(args.static, args.output)
+    for name, hashed in manifest.items():
+        sizes = [os.path.getsize(os.path.join(args.output, hashed + suffix))
+                 for suffix in ('', '.gz', '.br') if os.path.exists(os.path.join(args.output, hashed + suffix))]
+        print(f"{name} -> {hashed} ({' / '.join(f'{size / 1024:.1f} KB' for size in sizes)})")
+    if brotli is None:
+        print("brotli not installed: wrote gzip variants only (pip install brotli)")
+
+
+if __name__ == '__main__':
+    main()
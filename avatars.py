@@ -0,0 +1,173 @@
+"""Profile picture uploads: capped, re-encoded to small square thumbnails off the request thread.
+
+The request handler copies the upload to disk (refusing more than
+``max_bytes``), checks that Pillow can read it and queues it. A worker
+thread crops it to a square, writes each size in SIZES as WebP and as JPEG
+(for browsers without WebP), points the user at the new picture and deletes
+their previous ones and the upload. A 12 MP phone photo becomes a few KB per
+avatar.
+
+Pictures are stored by base name (``<user id>_<timestamp>``); ``urls``
+gives the variants' URLs. Names with an extension are pictures uploaded
+before this pipeline and are served as they are.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Twice the CSS size of the chat footer avatar (40px) and the settings preview (100px), for high-DPI screens
+SIZES = {'sm': 80, 'md': 200}
+FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 6}),
+           'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})}
+CHUNK_SIZE = 64 * 1024
+# Refuse decompression bombs: a 5 MB file can still decode to gigabytes. Checked against the header's size
+# before decoding, so Pillow's process-wide MAX_IMAGE_PIXELS is left alone
+MAX_PIXELS = 50_000_000
+
+
+class AvatarError(ValueError):
+    """The upload is too large or not an image."""
+
+
+def check_pixels(image, max_pixels):
+    width, height = image.size
+    if width * height > max_pixels:
+        raise AvatarError(f"Profile pictures can be at most {max_pixels // 1_000_000} megapixels.")
+
+
+def variant_name(base, size, extension):
+    return f"{base}_{size}.{extension}"
+
+
+def make_thumbnails(source, folder, base, max_pixels=MAX_PIXELS):
+    """Write every size/format variant of ``source`` into ``folder``; returns their file names."""
+    names = []
+    with Image.open(source) as image:
+        check_pixels(image, max_pixels)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        # Largest size first, each one resampled from the previous crop
+        for size, pixels in sorted(SIZES.items(), key=lambda item: -item[1]):
+            image = ImageOps.fit(image, (pixels, pixels), Image.LANCZOS)
+            for extension, (image_format, options) in FORMATS.items():
+                name = variant_name(base, size, extension)
+                tmp = os.path.join(folder, name + '.tmp')
+                # JPEG has no alpha; flatten onto white
+                frame = image if extension != 'jpg' or image.mode == 'RGB' else _flatten(image)
+                frame.save(tmp, image_format, **options)
+                os.replace(tmp, os.path.join(folder, name))
+                names.append(name)
+    return names
+
+
+def _flatten(image):
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.split()[-1])
+    return background
+
+
+class AvatarPipeline:
+
+    def __init__(self, folder, set_picture, max_bytes=5 * 1024 * 1024, workers=1, max_pixels=MAX_PIXELS):
+        self.folder = folder
+        self.set_picture = set_picture  # (user_id, base) -> None, records the new picture
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.workers = workers
+        self.processed = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config, set_picture):
+        return cls(config['UPLOAD_FOLDER'], set_picture, max_bytes=config['AVATAR_MAX_BYTES'],
+                   workers=config['AVATAR_WORKERS'])
+
+    def _pool(self):
+        with self._lock:
+            # Executor threads don't survive a fork; start a fresh pool in each gunicorn worker
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='avatar')
+            return self._executor
+
+    def submit(self, file_storage, user_id):
+        """Save the upload and queue its processing; raises AvatarError if it can't be used."""
+        base = f"{user_id}_{time.time_ns() // 1_000_000}"
+        upload = os.path.join(self.folder, base + '.upload')
+        size = 0
+        try:
+            with open(upload, 'wb') as f:
+                while True:
+                    chunk = file_storage.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise AvatarError(f"Profile pictures can be at most {self.max_bytes // (1024 * 1024)} MB.")
+                    f.write(chunk)
+            # Header check only; decoding happens on the worker
+            with Image.open(upload) as image:
+                check_pixels(image, self.max_pixels)
+                image.verify()
+        except (UnidentifiedImageError, Image.DecompressionBombError, SyntaxError, OSError) as e:
+            os.remove(upload)
+            raise AvatarError("Please upload a JPEG, PNG, WebP or GIF image.") from e
+        except AvatarError:
+            os.remove(upload)
+            raise
+        return self._pool().submit(self._process, upload, user_id, base, size)
+
+    def _process(self, upload, user_id, base, size):
+        try:
+            names = make_thumbnails(upload, self.folder, base, self.max_pixels)
+            self.set_picture(user_id, base)
+        except Exception as e:
+            print(f"Profile picture for user {user_id} could not be processed: {e}")
+            with self._lock:
+                self.failed += 1
+            # The user keeps their current picture; drop whatever was written for this one
+            self._remove(name for name in os.listdir(self.folder) if name.startswith(base + '_'))
+            return None
+        finally:
+            os.remove(upload)
+        self.remove_superseded(user_id, base)
+        with self._lock:
+            self.processed += 1
+            self.bytes_in += size
+            self.bytes_out += sum(os.path.getsize(os.path.join(self.folder, name)) for name in names)
+        return base
+
+    def remove_superseded(self, user_id, base):
+        """Delete the user's pictures other than ``base``, including ones uploaded before this pipeline."""
+        self._remove(name for name in os.listdir(self.folder)
+                     if name.startswith(f"{user_id}_") and not name.startswith(base + '_')
+                     and not name.endswith(('.upload', '.tmp')))
+
+    def _remove(self, names):
+        for name in list(names):
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                pass
+
+    def urls(self, picture, size):
+        """``{'webp': url, 'jpg': url}`` for a processed picture, ``{'jpg': url}`` for an old upload."""
+        if os.path.splitext(picture)[1]:
+            return {'jpg': url_for('static', filename='profile_pics/' + picture)}
+        return {extension: url_for('static', filename='profile_pics/' + variant_name(picture, size, extension))
+                for extension in FORMATS}
+
+    def stats(self):
+        return {'processed': self.processed, 'failed': self.failed, 'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out}
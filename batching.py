@@ -0,0 +1,114 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import COUNT_BUCKETS
+
+# Queueing delay is bounded by BATCH_MAX_WAIT_MS plus the batch ahead, so finer than request latency
+QUEUE_DELAY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class MicroBatcher:
+    """Collect concurrent prompts for a few milliseconds and generate them together.
+
+    ``run_batch(prompts, tier)`` must return one result per prompt. Prompts are
+    batched per tier because tiers use different endpoints / decoding settings.
+    Request handlers block on a ``Future`` until their batch has run. With a
+    ``metrics`` registry, batch sizes and queueing delays are exported per tier.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait=0.01, metrics=None):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queues = {}
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+        self.batch_sizes = self.queue_delays = None
+        if metrics is not None:
+            self.batch_sizes = metrics.histogram(
+                'agribot_batch_size', 'Prompts per generation batch (fill rate = size / BATCH_MAX_SIZE).', ('tier',),
+                COUNT_BUCKETS)
+            self.queue_delays = metrics.histogram(
+                'agribot_batch_queue_delay_seconds', 'Time a prompt waited for its batch to start.', ('tier',),
+                QUEUE_DELAY_BUCKETS)
+
+    @classmethod
+    def from_config(cls, config, run_batch, metrics=None):
+        return cls(run_batch, max_batch_size=config['BATCH_MAX_SIZE'], max_wait=config['BATCH_MAX_WAIT_MS'] / 1000,
+                   metrics=metrics)
+
+    def _queue(self, tier):
+        with self._lock:
+            # Dispatcher threads don't survive a fork; start fresh ones in each gunicorn worker
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queues = {}
+            q = self._queues.get(tier)
+            if q is None:
+                q = self._queues[tier] = queue.Queue()
+                threading.Thread(target=self._dispatch, args=(tier, q), daemon=True,
+                                 name=f"micro-batcher-{tier}").start()
+            return q
+
+    def submit(self, prompt, tier):
+        future = Future()
+        self._queue(tier).put((prompt, future, time.monotonic()))
+        return future
+
+    def generate(self, prompt, tier):
+        return self.submit(prompt, tier).result()
+
+    def _dispatch(self, tier, q):
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run(batch, tier)
+
+    def _run(self, batch, tier):
+        started = time.monotonic()
+        delays = [started - enqueued for _, _, enqueued in batch]
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.queue_delay_total += sum(delays)
+            self.queue_delay_max = max(self.queue_delay_max, *delays)
+        if self.batch_sizes is not None:
+            self.batch_sizes.observe(len(batch), tier=tier)
+            for delay in delays:
+                self.queue_delays.observe(delay, tier=tier)
+        try:
+            results = self.run_batch([prompt for prompt, _, _ in batch], tier)
+            if len(results) != len(batch):
+                raise ValueError(f"Expected {len(batch)} results from batch, got {len(results)}")
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'batches': self.batches,
+                'items': self.items,
+                'fill_rate': self.items / (self.batches * self.max_batch_size) if self.batches else 0.0,
+                'avg_queue_delay_ms': 1000 * self.queue_delay_total / self.items if self.items else 0.0,
+                'max_queue_delay_ms': 1000 * self.queue_delay_max,
+            }
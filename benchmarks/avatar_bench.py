@@ -0,0 +1,108 @@
+"""Bytes a browser downloads per chat page for a phone-photo profile picture, before and after the avatar pipeline.
+
+Seeds a throwaway database with one user and writes a synthetic --megapixels
+JPEG (gradient plus sensor-like noise, so it compresses like a photo), then
+logs in through Flask's test client and compares:
+
+    verbatim      the photo saved as uploaded, as settings() used to do
+    jpg / webp    the 80px thumbnail the chat page links now (JPEG fallback / WebP)
+
+It also times the upload request and the background re-encode.
+
+    python benchmarks/avatar_bench.py --megapixels 12
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def photo(megapixels):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    pixels += rng.normal(0, 12, pixels.shape)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, 'JPEG', quality=92)
+    return buffer.getvalue(), (width, height)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--megapixels', type=float, default=12)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='agribot-avatar-')
+    os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}", REQUEST_LOG='false',
+                      AVATAR_MAX_BYTES=str(64 * 1024 * 1024))
+    try:
+        import app as agribot
+        from werkzeug.security import generate_password_hash
+
+        # Keep the benchmark's pictures out of static/profile_pics
+        pictures = os.path.join(workdir, 'profile_pics')
+        os.makedirs(pictures)
+        agribot.avatar_pipeline.folder = pictures
+
+        data, (width, height) = photo(args.megapixels)
+        with agribot.app.app_context():
+            user = agribot.User(email='bench@example.com', password=generate_password_hash('pw'), first_name='Bench',
+                                last_name='User', show_welcome_popup=False)
+            agribot.db.session.add(user)
+            agribot.db.session.commit()
+            user_id = user.id
+            legacy = f"{user_id}_1700000000_IMG_0001.jpg"
+            with open(os.path.join(pictures, legacy), 'wb') as f:
+                f.write(data)
+            user.profile_picture = legacy
+            agribot.db.session.commit()
+
+        client = agribot.app.test_client()
+        client.post('/login', data={'email': 'bench@example.com', 'password': 'pw'})
+
+        def page_bytes():
+            html = client.get('/chat').get_data()
+            with agribot.app.app_context():
+                picture = agribot.db.session.get(agribot.User, user_id).profile_picture
+            with agribot.app.test_request_context():
+                urls = agribot.avatar_pipeline.urls(picture, 'sm')
+            return len(html), {extension: os.path.getsize(os.path.join(pictures, os.path.basename(url)))
+                               for extension, url in urls.items()}
+
+        html_before, before = page_bytes()
+
+        start = time.perf_counter()
+        response = client.post('/settings', data={'profile_picture': (io.BytesIO(data), 'IMG_0002.jpg')},
+                               content_type='multipart/form-data')
+        request_ms = (time.perf_counter() - start) * 1000
+        assert response.status_code == 302, response.status_code
+        while agribot.avatar_pipeline.stats()['processed'] + agribot.avatar_pipeline.stats()['failed'] == 0:
+            time.sleep(0.01)
+        total_ms = (time.perf_counter() - start) * 1000
+        html_after, after = page_bytes()
+
+        print(f"upload: {width}x{height} JPEG, {len(data) / 1024:.0f} KB")
+        print(f"{'avatar':<10} {'html bytes':>10} {'avatar bytes':>13} {'page total':>11}")
+        print(f"{'verbatim':<10} {html_before:>10} {before['jpg']:>13} {html_before + before['jpg']:>11}")
+        for extension in ('jpg', 'webp'):
+            print(f"{extension:<10} {html_after:>10} {after[extension]:>13} {html_after + after[extension]:>11}")
+        print(f"upload request {request_ms:.0f} ms, thumbnails ready after {total_ms:.0f} ms")
+        print(f"files left for the user: {sorted(os.listdir(pictures))}")
+        print(agribot.avatar_pipeline.stats())
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
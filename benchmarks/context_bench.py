@@ -0,0 +1,107 @@
+"""Context-assembly time per turn on long conversations, with and without stored token counts.
+
+Seeds a throwaway SQLite file with conversations of --messages messages and
+builds the prompt for a new question in each, two ways:
+
+    retokenize  read the whole conversation and tokenize every message each turn
+    stored      read the latest CONTEXT_MAX_MESSAGES rows and add up their
+                message.token_count (what send_message does)
+
+Both pick the same messages under the same budget.
+
+    python benchmarks/context_bench.py --tokenizer fine_tuned_t5_agriculture_exp --messages 200 --budget 64
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from context import ContextBuilder, TokenCounter
+
+SCHEMA = """
+CREATE TABLE message (id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL, sender VARCHAR(10) NOT NULL,
+                      content TEXT NOT NULL, timestamp DATETIME, token_count INTEGER);
+CREATE INDEX ix_message_conversation_id_timestamp ON message (conversation_id, timestamp);
+"""
+LATEST = ("SELECT content, token_count FROM message WHERE conversation_id = ? "
+          "ORDER BY timestamp DESC, id DESC LIMIT ?")
+ALL = "SELECT content FROM message WHERE conversation_id = ? ORDER BY timestamp DESC, id DESC"
+WORDS = ("maize beans cassava aphids fertilizer soil rain harvest plant water leaves yellow spray compost "
+         "seedlings weeks nitrogen rows acre store dry pests control season irrigation").split()
+
+
+def sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize() + '.'
+
+
+def seed(conn, builder, conversations, messages, rng):
+    conn.executescript(SCHEMA)
+    rows = []
+    for conversation_id in range(1, conversations + 1):
+        for i in range(messages):
+            content = sentence(rng, rng.randint(5, 12) if i % 2 == 0 else rng.randint(15, 40))
+            rows.append((conversation_id, 'user' if i % 2 == 0 else 'ai', content, i, builder.count(content)))
+    conn.executemany("INSERT INTO message (conversation_id, sender, content, timestamp, token_count) "
+                     "VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tokenizer', default=config.LOCAL_TOKENIZER_PATH)
+    parser.add_argument('--conversations', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=200, help='messages per conversation')
+    parser.add_argument('--budget', type=int, default=64, help='CONTEXT_TOKEN_BUDGET')
+    parser.add_argument('--max-messages', type=int, default=config.CONTEXT_MAX_MESSAGES)
+    parser.add_argument('--turns', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    builder = ContextBuilder(TokenCounter(args.tokenizer), budget=args.budget,
+                             max_input_length=config.LOCAL_MAX_INPUT_LENGTH, max_messages=args.max_messages)
+    workdir = tempfile.mkdtemp(prefix='agribot-context-')
+    try:
+        conn = sqlite3.connect(os.path.join(workdir, 'bench.db'))
+        seed(conn, builder, args.conversations, args.messages, rng)
+        turns = [(rng.randint(1, args.conversations), sentence(rng, 8)) for _ in range(args.turns)]
+
+        def retokenize(conversation_id, question):
+            history = [(content, builder.count(content)) for content, in conn.execute(ALL, (conversation_id,))]
+            return builder.build(question, history)
+
+        def stored(conversation_id, question):
+            return builder.build(question, conn.execute(LATEST, (conversation_id, args.max_messages)).fetchall())
+
+        results = {}
+        for name, build in (('retokenize', retokenize), ('stored', stored)):
+            latencies, prompts = [], []
+            for conversation_id, question in turns:
+                start = time.perf_counter()
+                prompt, _ = build(conversation_id, question)
+                latencies.append(time.perf_counter() - start)
+                prompts.append(prompt)
+            results[name] = (np.array(latencies) * 1000, prompts)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    assert results['retokenize'][1] == results['stored'][1], "both ways should pick the same history"
+    prompt_tokens = [builder.count(prompt) for prompt in results['stored'][1]]
+    print(f"{args.conversations} conversations x {args.messages} messages, budget {args.budget} tokens, "
+          f"prompts average {np.mean(prompt_tokens):.0f} tokens (max {max(prompt_tokens)})")
+    print(f"{'':>10} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, (latencies_ms, _) in results.items():
+        print(f"{name:>10} {np.percentile(latencies_ms, 50):>8.3f} {np.percentile(latencies_ms, 95):>8.3f} "
+              f"{latencies_ms.mean():>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Time the conversation/message hot-path queries before and after the composite indexes.
+
+Seeds a throwaway SQLite file with the app's schema, runs the SQL that
+conversation() and chat() issue, then adds the indexes from migration
+8c1d2e4f6a10 and runs it again.
+
+    python benchmarks/db_indexes_bench.py --users 2000 --messages-per-conversation 60
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SCHEMA = """
+CREATE TABLE user (id INTEGER PRIMARY KEY, email VARCHAR(100) UNIQUE NOT NULL);
+CREATE TABLE conversation (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id),
+                           title VARCHAR(200), created_at DATETIME);
+CREATE TABLE message (id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL REFERENCES conversation (id),
+                      sender VARCHAR(10) NOT NULL, content TEXT NOT NULL, timestamp DATETIME);
+"""
+INDEXES = """
+CREATE INDEX ix_message_conversation_id_timestamp ON message (conversation_id, timestamp);
+CREATE INDEX ix_conversation_user_id_created_at ON conversation (user_id, created_at);
+"""
+QUERIES = {
+    'conversation() messages': "SELECT * FROM message WHERE conversation_id = ? ORDER BY timestamp ASC",
+    'chat() sidebar': "SELECT * FROM conversation WHERE user_id = ? ORDER BY created_at DESC",
+}
+
+
+def seed(conn, users, conversations_per_user, messages_per_conversation):
+    conn.executescript(SCHEMA)
+    start = datetime(2025, 1, 1)
+    conn.executemany("INSERT INTO user (id, email) VALUES (?, ?)",
+                     ((u, f"user{u}@example.com") for u in range(1, users + 1)))
+    conversations = [(u, f"Chat {c}", start + timedelta(minutes=random.randint(0, 500000)))
+                     for u in range(1, users + 1) for c in range(conversations_per_user)]
+    random.shuffle(conversations)  # interleave users as real traffic would
+    conn.executemany("INSERT INTO conversation (user_id, title, created_at) VALUES (?, ?, ?)", conversations)
+    n_conversations = len(conversations)
+
+    def messages():
+        # Turns from all conversations arrive interleaved over time
+        for turn in range(messages_per_conversation):
+            for conversation_id in range(1, n_conversations + 1):
+                yield (conversation_id, 'user' if turn % 2 == 0 else 'ai',
+                       'How do I control aphids on cabbage?', start + timedelta(seconds=turn * n_conversations + conversation_id))
+    conn.executemany("INSERT INTO message (conversation_id, sender, content, timestamp) VALUES (?, ?, ?, ?)", messages())
+    conn.commit()
+    return users, n_conversations
+
+
+def time_queries(conn, users, n_conversations, repeat):
+    results = {}
+    for label, sql in QUERIES.items():
+        upper = n_conversations if 'message' in sql else users
+        keys = [random.randint(1, upper) for _ in range(repeat)]
+        start = time.perf_counter()
+        for key in keys:
+            conn.execute(sql, (key,)).fetchall()
+        results[label] = (time.perf_counter() - start) * 1000 / repeat
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql, (1,)).fetchall()
+        results[label + ' plan'] = '; '.join(row[-1] for row in plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--conversations-per-user', type=int, default=8)
+    parser.add_argument('--messages-per-conversation', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(0)
+    path = os.path.join(tempfile.mkdtemp(prefix='agribot-db-'), 'bench.db')
+    conn = sqlite3.connect(path)
+    users, n_conversations = seed(conn, args.users, args.conversations_per_user, args.messages_per_conversation)
+    n_messages = conn.execute("SELECT COUNT(*) FROM message").fetchone()[0]
+    print(f"seeded {users} users, {n_conversations} conversations, {n_messages} messages")
+
+    before = time_queries(conn, users, n_conversations, args.repeat)
+    conn.executescript(INDEXES)
+    conn.execute("ANALYZE")
+    after = time_queries(conn, users, n_conversations, args.repeat)
+
+    for label in QUERIES:
+        print(f"{label:<26} before {before[label]:8.3f} ms   after {after[label]:8.3f} ms   "
+              f"({before[label] / after[label]:.0f}x)")
+        print(f"    plan before: {before[label + ' plan']}")
+        print(f"    plan after:  {after[label + ' plan']}")
+    conn.close()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""How much traffic the BM25 FAQ tier absorbs, how right it is and how fast.
+
+Indexes the training split of the dataset and asks it the held-out
+validation questions, standing in for user traffic. For each confidence
+threshold it reports the share of questions answered from the index
+("absorbed"), how often the returned answer is the reference answer, and
+the token F1 between them. Lookup latency is measured with the index
+memory-mapped as the app loads it.
+
+    python benchmarks/faq_index_bench.py --dataset KisanVaani/agriculture-qa-english-only
+
+--synthetic N builds an offline stand-in from question templates over
+crops, pests and places (see synthetic_pairs). Questions the index should
+not answer have no reference; absorbing them counts as "wrongly absorbed".
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faq_index import FaqIndex, build_index, terms
+
+CROPS = "maize wheat rice cassava beans sorghum tomato potato onion cabbage millet groundnut banana coffee".split()
+PESTS = "aphids armyworm weevils whiteflies thrips cutworms nematodes mites".split()
+UNSEEN_CROPS = "quinoa teff amaranth yam".split()
+PLACES = "kenya uganda tanzania rwanda ghana nigeria malawi zambia ethiopia india".split()
+TEMPLATES = [
+    "how do i control {pest} on {crop} in {place}",
+    "when should i plant {crop} in {place}",
+    "which fertilizer is best for {crop} in {place}",
+    "how much water does {crop} need in {place}",
+    "what causes yellow leaves on {crop} infested by {pest}",
+    "how do i store harvested {crop} against {pest}",
+]
+OFF_TOPIC = ["what is the capital of france", "how do i reset my phone password", "who won the football match",
+             "recommend a good movie tonight", "how do i bake chocolate cake", "what is quantum computing"]
+
+
+def synthetic_pairs(n, seed=0):
+    """``(train_pairs, queries, references)``; references are None for off-topic queries.
+
+    Queries are, in equal parts, an indexed question asked again with filler
+    and different casing (should be absorbed), the same question about a crop
+    the index has never seen, and off-topic questions (both should fall
+    through to the model).
+    """
+    rng = random.Random(seed)
+    pairs, queries, references = [], [], []
+    for i in range(n):
+        slots = {'crop': rng.choice(CROPS), 'pest': rng.choice(PESTS), 'place': rng.choice(PLACES)}
+        question = TEMPLATES[i % len(TEMPLATES)].format(**slots)
+        answer = f"Advice on {question}."
+        pairs.append((question, answer))
+        kind = i % 3
+        if kind == 0:
+            queries.append(f"Hello, please tell me {question.upper()}?")
+            references.append(answer)
+        elif kind == 1:
+            queries.append(question.replace(slots['crop'], rng.choice(UNSEEN_CROPS)))
+            references.append(None)
+        else:
+            queries.append(rng.choice(OFF_TOPIC))
+            references.append(None)
+    return pairs, queries, references
+
+
+def dataset_pairs(name):
+    from training.config import DEFAULTS
+    from training.data import load_qa_dataset, split_dataset
+
+    train_split, val_split = split_dataset(load_qa_dataset(name), DEFAULTS['test_size'], DEFAULTS['seed'])
+    pairs = list(zip(train_split['question'], train_split['answers']))
+    return pairs, list(val_split['question']), list(val_split['answers'])
+
+
+def token_f1(prediction, reference):
+    predicted, expected = Counter(terms(prediction)), Counter(terms(reference or ''))
+    overlap = sum((predicted & expected).values())
+    if not overlap:
+        return 0.0
+    precision, recall = overlap / sum(predicted.values()), overlap / sum(expected.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='KisanVaani/agriculture-qa-english-only')
+    parser.add_argument('--synthetic', type=int, help='use N templated questions instead of the dataset')
+    parser.add_argument('--thresholds', default='0.5,0.6,0.7,0.8,0.9,1.0')
+    args = parser.parse_args()
+
+    pairs, queries, references = synthetic_pairs(args.synthetic) if args.synthetic else dataset_pairs(args.dataset)
+    workdir = tempfile.mkdtemp(prefix='agribot-faq-index-')
+    try:
+        path = os.path.join(workdir, 'faq_index')
+        start = time.perf_counter()
+        meta = build_index(pairs, path)
+        build_seconds = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(workdir, f)) for f in os.listdir(workdir))
+        start = time.perf_counter()
+        index = FaqIndex(path)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        results, latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            doc, confidence = index.search(query)
+            answer = index.answer_text(doc) if doc is not None else None
+            latencies.append(time.perf_counter() - start)
+            results.append((answer, confidence))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies_us = np.array(latencies) * 1e6
+    print(f"{meta['documents']} indexed questions ({len(pairs)} pairs), {meta['terms']} terms, "
+          f"{size / 1e6:.2f} MB on disk, built in {build_seconds:.1f}s, mmap load {load_ms:.1f} ms")
+    print(f"{len(queries)} queries: lookup p50 {np.percentile(latencies_us, 50):.0f} us, "
+          f"p99 {np.percentile(latencies_us, 99):.0f} us")
+    print(f"{'threshold':>9} {'absorbed':>9} {'exact':>7} {'F1':>6} {'wrongly absorbed':>17}")
+    for threshold in (float(t) for t in args.thresholds.split(',')):
+        absorbed = [(answer, reference) for (answer, confidence), reference in zip(results, references)
+                    if answer is not None and confidence >= threshold]
+        on_topic = [(answer, reference) for answer, reference in absorbed if reference is not None]
+        exact = sum(answer == reference.strip() for answer, reference in on_topic)
+        f1 = np.mean([token_f1(answer, reference) for answer, reference in on_topic]) if on_topic else 0.0
+        print(f"{threshold:>9.2f} {len(absorbed) / len(queries):>9.1%} "
+              f"{exact / len(on_topic) if on_topic else 0.0:>7.1%} {f1:>6.2f} "
+              f"{(len(absorbed) - len(on_topic)) / len(queries):>17.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""Latency, throughput, memory and ROUGE per inference backend and decoding config.
+
+Runs the same held-out questions (the validation split used by
+``python -m training evaluate``) one at a time through each backend, the way
+``generate_answer`` serves a chat turn:
+
+    remote     InferenceClient against a local stub of the HF endpoint that
+               answers after --stub-latency-ms (decoding happens upstream,
+               so it has a single "endpoint" row)
+    tf         LocalT5Engine on the saved TF checkpoint
+    onnx       LocalT5Engine with LOCAL_MODEL_FORMAT=onnx (--onnx-model)
+    onnx-int8  the same on a ``local_engine.py export --quantize`` model
+
+and, for the local backends, each decoding config in CONFIGS. Each backend
+runs in its own process so peak RSS is that backend's high-water mark
+(cumulative over its configs, in table order). tokens/s counts the
+re-tokenized generated text; rougeL is against the reference answers after
+``clean_answer``.
+
+The table is printed and, with --output, written as CSV with fixed columns
+and row order, so results from two releases can be diffed:
+
+    python benchmarks/inference_bench.py --onnx-int8-model fine_tuned_t5_agriculture_onnx --output inference.csv
+
+--tiny builds a small random-weight T5 (and its ONNX exports) around
+--tokenizer and uses synthetic questions, to check the suite end to end
+without the fine-tuned model or the dataset; its quality numbers mean nothing:
+
+    python benchmarks/inference_bench.py --tiny --tokenizer t5-small --questions 20 --no-rouge
+"""
+import argparse
+import csv
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from inference_client import InferenceClient
+from inference_client_bench import StubHandler
+from local_engine import LocalEngineError, LocalT5Engine
+from prompts import build_prompt, clean_answer
+from training.config import DEFAULTS
+
+CONFIGS = {
+    'greedy': {'num_beams': 1, 'max_new_tokens': 128, 'early_stopping': False},  # normal tier
+    'greedy-max32': {'num_beams': 1, 'max_new_tokens': 32, 'early_stopping': False},
+    'beams2': {'num_beams': 2, 'max_new_tokens': 128, 'early_stopping': True},
+    'beams4': {'num_beams': 4, 'max_new_tokens': 128, 'early_stopping': True},  # notebook / upgraded tier
+    'beams4-max64': {'num_beams': 4, 'max_new_tokens': 64, 'early_stopping': True},
+    'beams4-no-early-stop': {'num_beams': 4, 'max_new_tokens': 128, 'early_stopping': False},
+}
+BACKENDS = ('remote', 'tf', 'onnx', 'onnx-int8')
+COLUMNS = ('backend', 'config', 'questions', 'p50_ms', 'p95_ms', 'mean_ms', 'tokens_per_s', 'peak_rss_mb', 'rougeL',
+           'status')
+
+
+class SlowStub(StubHandler):
+    latency = 0.0  # stands in for generation time on the HF endpoint
+
+    def do_POST(self):
+        time.sleep(SlowStub.latency)
+        super().do_POST()
+
+
+def peak_rss_mb():
+    # VmHWM belongs to this address space; ru_maxrss on Linux carries the parent's peak across exec
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def rouge_l(predictions, references):
+    from training.scoring import compute_metric
+
+    scores = compute_metric('rouge', predictions, [[r] for r in references], per_example=True)
+    return float(np.mean(scores['rougeL']))
+
+
+def measure(backend, name, generate, load_tokenizer, questions, references, settings):
+    prompts = [build_prompt(q) for q in questions]
+    for prompt in prompts[:settings.warmup]:
+        generate(prompt)
+    latencies, outputs = [], []
+    for prompt in prompts:
+        start = time.perf_counter()
+        outputs.append(generate(prompt))
+        latencies.append(time.perf_counter() - start)
+    rss = peak_rss_mb()
+    # Loaded only now so the remote row's RSS isn't the tokenizer's (transformers alone is ~500 MB)
+    tokenizer = load_tokenizer()
+    tokens = sum(len(tokenizer(text, add_special_tokens=False)['input_ids']) for text in outputs)
+    predictions = [clean_answer(text) for text in outputs]
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'backend': backend,
+        'config': name,
+        'questions': len(prompts),
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 1),
+        'p95_ms': round(float(np.percentile(latencies_ms, 95)), 1),
+        'mean_ms': round(float(latencies_ms.mean()), 1),
+        'tokens_per_s': round(tokens / sum(latencies), 1),
+        'peak_rss_mb': round(rss),
+        'rougeL': None if settings.no_rouge else round(rouge_l(predictions, references), 4),
+        'status': 'ok',
+    }
+
+
+def status_row(backend, name, status):
+    return {'backend': backend, 'config': name, 'status': status}
+
+
+def run_remote(questions, references, settings):
+    def load_tokenizer():
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(settings.tokenizer)
+
+    SlowStub.latency = settings.stub_latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    client = InferenceClient({'Content-Type': 'application/json'})
+    try:
+        return [measure('remote', 'endpoint', lambda prompt: client.generate(url, prompt), load_tokenizer,
+                        questions, references, settings)]
+    finally:
+        client.close()
+        server.shutdown()
+
+
+def run_local(backend, questions, references, settings):
+    model_path = {'tf': settings.model, 'onnx': settings.onnx_model, 'onnx-int8': settings.onnx_int8_model}[backend]
+    if not model_path:
+        return [status_row(backend, name, f'skipped: no --{backend}-model') for name in settings.configs]
+    engine = LocalT5Engine(model_path, tokenizer_path=settings.tokenizer, model_format='tf' if backend == 'tf' else 'onnx')
+    try:
+        engine.load()
+    except LocalEngineError as e:
+        return [status_row(backend, name, f'skipped: {e}') for name in settings.configs]
+    rows = []
+    for name in settings.configs:
+        decoding = CONFIGS[name]
+        engine.num_beams = {'bench': decoding['num_beams']}
+        engine.max_new_tokens = decoding['max_new_tokens']
+        engine.early_stopping = decoding['early_stopping']
+        rows.append(measure(backend, name, lambda prompt: engine.generate(prompt, 'bench'), lambda: engine.tokenizer,
+                            questions, references, settings))
+        print(f"{backend} {name}: p50 {rows[-1]['p50_ms']} ms", file=sys.stderr)
+    return rows
+
+
+def run_child(settings_path, backend, rows_path):
+    with open(settings_path) as f:
+        settings = json.load(f)
+    questions, references = settings.pop('questions'), settings.pop('references')
+    settings = argparse.Namespace(**settings)
+    if backend == 'remote':
+        rows = run_remote(questions, references, settings)
+    else:
+        rows = run_local(backend, questions, references, settings)
+    with open(rows_path, 'w') as f:
+        json.dump(rows, f)
+
+
+def validation_questions(dataset, n):
+    from training.data import load_qa_dataset, questions_and_answers, split_dataset
+
+    _, val_split = split_dataset(load_qa_dataset(dataset), DEFAULTS['test_size'], DEFAULTS['seed'])
+    return questions_and_answers(val_split.select(range(min(n, len(val_split)))))
+
+
+def prepare_tiny(args, workdir):
+    """Random-weight tiny T5 saved with the tokenizer, its ONNX exports, and synthetic questions."""
+    from transformers import T5Tokenizer
+
+    from dynamic_padding_bench import tiny_t5
+    from local_engine import export_onnx
+    from training_input_bench import synthetic_dataset
+
+    tokenizer = T5Tokenizer.from_pretrained(args.tokenizer)
+    model_dir = os.path.join(workdir, 'tiny_t5')
+    tiny_t5(len(tokenizer), 64).save_pretrained(model_dir)
+    tokenizer.save_pretrained(model_dir)
+    args.model = args.tokenizer = model_dir
+    for backend, quantize in (('onnx', False), ('onnx-int8', True)):
+        attribute = backend.replace('-', '_') + '_model'
+        if backend in args.backends and not getattr(args, attribute):
+            output_dir = os.path.join(workdir, backend)
+            try:
+                export_onnx(model_dir, output_dir, quantize=quantize)
+                setattr(args, attribute, output_dir)
+            except Exception as e:
+                print(f"{backend} export failed, its rows will be skipped: {e}", file=sys.stderr)
+    data = synthetic_dataset(args.questions)
+    return data['question'], data['answers']
+
+
+def print_table(rows):
+    cells = [['' if row.get(column) is None else str(row[column]) for column in COLUMNS] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(COLUMNS)]
+    for line in [list(COLUMNS)] + cells:
+        print('  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--configs', default=','.join(CONFIGS))
+    parser.add_argument('--model', default=config.LOCAL_MODEL_PATH)
+    parser.add_argument('--tokenizer', default=config.LOCAL_TOKENIZER_PATH)
+    parser.add_argument('--onnx-model', help='ONNX export of --model (local_engine.py export)')
+    parser.add_argument('--onnx-int8-model', help='quantized ONNX export (local_engine.py export --quantize)')
+    parser.add_argument('--dataset', default=DEFAULTS['dataset'])
+    parser.add_argument('--questions', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--stub-latency-ms', type=float, default=300.0)
+    parser.add_argument('--no-rouge', action='store_true')
+    parser.add_argument('--tiny', action='store_true', help='random-weight tiny T5 and synthetic questions')
+    parser.add_argument('--output', help='write the table as CSV')
+    parser.add_argument('--child', nargs=3, metavar=('SETTINGS', 'BACKEND', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    args.backends = args.backends.split(',')
+    args.configs = args.configs.split(',')
+    unknown = sorted(set(args.backends) - set(BACKENDS)) + sorted(set(args.configs) - set(CONFIGS))
+    if unknown:
+        parser.error(f"unknown backend/config: {', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix='agribot-inference-bench-')
+    try:
+        if args.tiny:
+            questions, references = prepare_tiny(args, workdir)
+        else:
+            questions, references = validation_questions(args.dataset, args.questions)
+        settings_path = os.path.join(workdir, 'settings.json')
+        with open(settings_path, 'w') as f:
+            json.dump(dict(vars(args), child=None, questions=questions, references=references), f)
+
+        rows = []
+        for backend in args.backends:
+            rows_path = os.path.join(workdir, f'{backend}.rows.json')
+            process = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', settings_path, backend,
+                                      rows_path])
+            if process.returncode:
+                names = ['endpoint'] if backend == 'remote' else args.configs
+                rows.extend(status_row(backend, name, f'failed: exit code {process.returncode}') for name in names)
+                continue
+            with open(rows_path) as f:
+                rows.extend(json.load(f))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{len(questions)} questions, {args.warmup} warm-up, stub latency {args.stub_latency_ms:.0f} ms")
+    print_table(rows)
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
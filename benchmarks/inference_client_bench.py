@@ -0,0 +1,83 @@
+"""Compare bare ``requests.post`` with the pooled InferenceClient.
+
+Starts a local stub of the HF inference endpoint, counts the TCP connections
+it accepts, and times N sequential chat turns through each client. The stub
+can add a per-connection delay to stand in for the TCP+TLS handshake to HF.
+
+    python benchmarks/inference_client_bench.py --requests 200 --handshake-ms 30
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from inference_client import InferenceClient  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+    connections = 0
+    handshake_delay = 0.0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StubHandler.lock:
+            StubHandler.connections += 1
+        time.sleep(StubHandler.handshake_delay)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps([{"generated_text": "answer: Use NPK fertilizer"}]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(label, call, n):
+    StubHandler.connections = 0
+    start = time.perf_counter()
+    for _ in range(n):
+        call()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<16} {n} requests  {elapsed * 1000 / n:7.2f} ms/req  "
+          f"{StubHandler.connections} connections")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--handshake-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    StubHandler.handshake_delay = args.handshake_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    headers = {"Content-Type": "application/json"}
+    payload = {"inputs": "question: best fertilizer for wheat context: agriculture </s>"}
+
+    bare = run('requests.post', lambda: requests.post(url, headers=headers, json=payload, timeout=10), args.requests)
+    client = InferenceClient(headers)
+    pooled = run('InferenceClient', lambda: client.generate(url, payload['inputs']), args.requests)
+    print(f"speedup: {bare / pooled:.2f}x")
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Measure what the metrics hooks and request log line add to every request.
+
+Copies the app to a temporary directory and, in a fresh interpreter per mode
+(config is read at import), drives a logged-in /chat page and a cached
+/send_message through Flask's test client --requests times. Modes run
+interleaved for --rounds rounds and the best round counts, which keeps disk
+and CPU noise out of a difference of a few microseconds. The JSON log lines
+go to /dev/null so terminal speed doesn't count, but their formatting does.
+
+    python benchmarks/metrics_overhead_bench.py --requests 2000 --rounds 5
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'off': {'METRICS_ENABLED': 'false', 'REQUEST_LOG': 'false'},
+    'metrics': {'METRICS_ENABLED': 'true', 'REQUEST_LOG': 'false'},
+    'metrics+log': {'METRICS_ENABLED': 'true', 'REQUEST_LOG': 'true'},
+}
+
+DRIVER = textwrap.dedent("""
+    import json, os, sys, time
+    from app import app, answer_cache
+    import metrics as metrics_module
+
+    n = int(sys.argv[1])
+    client = app.test_client()
+    client.post('/signup', data={'email': 'bench@example.com', 'first_name': 'B', 'last_name': 'B', 'password': 'pw'})
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'pw'})
+    conversation_id = client.post('/chat/new').headers['Location'].rstrip('/').split('/')[-1]
+    # Pre-seed the answer cache so /send_message never leaves the process
+    answer_cache.set('how do i grow maize', 'normal', 'Plant in well-drained soil.')
+    form = {'user_input': 'how do i grow maize', 'conversation_id': conversation_id}
+
+    results = {}
+    real_stdout = sys.stdout
+    for label, call in (('GET /chat', lambda: client.get('/chat')),
+                        ('POST /send_message (cached)', lambda: client.post('/send_message', data=form))):
+        for _ in range(50):
+            call()
+        sys.stdout = open(os.devnull, 'w')
+        start = time.perf_counter()
+        for _ in range(n):
+            call()
+        elapsed = time.perf_counter() - start
+        sys.stdout = real_stdout
+        results[label] = elapsed * 1e6 / n
+
+    histogram = metrics_module.Histogram('x', 'x', ('route', 'method', 'status'))
+    start = time.perf_counter()
+    for _ in range(100000):
+        histogram.observe(0.012, route='/chat', method='GET', status=200)
+    results['Histogram.observe'] = (time.perf_counter() - start) * 1e6 / 100000
+    print(json.dumps(results))
+""")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--modes', nargs='+', default=list(MODES))
+    args = parser.parse_args()
+
+    app_dir = tempfile.mkdtemp(prefix='agribot-metrics-')
+    try:
+        shutil.copytree(ROOT, app_dir, dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns('.git', 'instance', '__pycache__', 'notebook', 'images', '*.pdf'))
+        results = {}
+        for _ in range(args.rounds):
+            for mode in args.modes:
+                shutil.rmtree(os.path.join(app_dir, 'instance'), ignore_errors=True)
+                env = dict(os.environ, SECRET_KEY='bench', ANSWER_CACHE_BACKEND='memory', **MODES[mode])
+                out = subprocess.run([sys.executable, '-c', DRIVER, str(args.requests)], cwd=app_dir, env=env,
+                                     capture_output=True, text=True, check=True).stdout
+                timings = json.loads(out.strip().splitlines()[-1])
+                best = results.setdefault(mode, timings)
+                for label, value in timings.items():
+                    best[label] = min(best[label], value)
+    finally:
+        shutil.rmtree(app_dir, ignore_errors=True)
+
+    baseline = results.get('off')
+    for label in next(iter(results.values())):
+        print(label)
+        for mode, timings in results.items():
+            extra = f"  ({timings[label] - baseline[label]:+.1f} us)" if baseline and mode != 'off' and 'observe' not in label else ''
+            print(f"  {mode:<12} {timings[label]:8.1f} us/op{extra}")
+
+
+if __name__ == '__main__':
+    main()
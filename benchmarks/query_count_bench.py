@@ -0,0 +1,97 @@
+"""SQL statements and latency per request on the main chat routes, with and without the user cache.
+
+Seeds a throwaway database with one user, --conversations conversations of
+--messages messages each, logs in through Flask's test client and requests
+each route --requests times under three setups:
+
+    before        load_user SELECTs the user every request, sidebar loaded as Conversation objects
+    user cache    the user row from this worker's user cache, sidebar as (id, title, created_at) rows
+    + render      the same with the render cache on (an unchanged page isn't rendered again)
+
+    python benchmarks/query_count_bench.py --conversations 8 --messages 50
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--conversations', type=int, default=8)
+    parser.add_argument('--messages', type=int, default=50, help='messages per conversation')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='agribot-queries-')
+    os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}", USER_CACHE_ENABLED='true',
+                      RENDER_CACHE_ENABLED='true', REQUEST_LOG='false')
+    try:
+        import app as agribot
+        from sqlalchemy import event
+        from werkzeug.security import generate_password_hash
+
+        with agribot.app.app_context():
+            user = agribot.User(email='bench@example.com', password=generate_password_hash('pw'), first_name='Bench',
+                                last_name='User', show_welcome_popup=False)
+            agribot.db.session.add(user)
+            agribot.db.session.flush()
+            conversations = [agribot.Conversation(user_id=user.id, title=f"Maize question {i}")
+                             for i in range(args.conversations)]
+            agribot.db.session.add_all(conversations)
+            agribot.db.session.flush()
+            agribot.db.session.add_all(
+                agribot.Message(conversation_id=c.id, sender='user' if i % 2 == 0 else 'ai',
+                                content='How do I control fall armyworm on maize in the long rains?')
+                for c in conversations for i in range(args.messages))
+            agribot.db.session.commit()
+            newest = conversations[-1].id
+            # Scroll-back page: the messages before the last MESSAGE_PAGE_SIZE
+            before_id = conversations[-1].messages.order_by(agribot.Message.id.desc()) \
+                .offset(agribot.app.config['MESSAGE_PAGE_SIZE'] - 1).first().id
+            engine = agribot.db.engine
+
+        statements = []
+        event.listen(engine, 'after_cursor_execute', lambda *args: statements.append(1))
+
+        def orm_sidebar(user_id):
+            # What chat() and conversation() loaded before
+            return agribot.db.session.get(agribot.User, user_id).conversations \
+                .order_by(agribot.Conversation.created_at.desc()).all()
+
+        user_cache, render_cache, slim_sidebar = agribot.user_cache, agribot.render_cache, agribot.sidebar_conversations
+        setups = {'before': (None, None, orm_sidebar), 'user cache': (user_cache, None, slim_sidebar),
+                  '+ render': (user_cache, render_cache, slim_sidebar)}
+        client = agribot.app.test_client()
+        client.post('/login', data={'email': 'bench@example.com', 'password': 'pw'})
+        client.get('/chat')  # consumes the login flash, which would bypass the render cache
+        print(f"{args.conversations} conversations x {args.messages} messages, {args.requests} requests per row")
+        print(f"{'route':<36} {'setup':<11} {'queries':>8} {'p50 ms':>8} {'mean ms':>8}")
+        for page in ('/chat', f'/chat/{newest}', f'/chat/{newest}/messages?before_id={before_id}', '/settings'):
+            for setup, (agribot.user_cache, agribot.render_cache, agribot.sidebar_conversations) in setups.items():
+                client.get(page)
+                latencies, counts = [], []
+                for _ in range(args.requests):
+                    del statements[:]
+                    start = time.perf_counter()
+                    response = client.get(page)
+                    response.get_data()
+                    latencies.append(time.perf_counter() - start)
+                    counts.append(len(statements))
+                assert response.status_code == 200, (page, setup, response.status_code)
+                latencies_ms = np.array(latencies) * 1000
+                print(f"{page:<36} {setup:<11} {np.mean(counts):>8.1f} {np.percentile(latencies_ms, 50):>8.2f} "
+                      f"{latencies_ms.mean():>8.2f}")
+        print(user_cache.stats())
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Render time and bytes sent for the chat pages of a user with many conversations.
+
+Seeds a throwaway database with one user, --conversations conversations of
+--messages messages each, logs in through Flask's test client and requests
+/chat and the newest conversation's page three ways:
+
+    render        render cache off: query the sidebar and messages and run Jinja every time
+    cache hit     the rendered page from this worker's render cache
+    304           the browser revalidates with If-None-Match and gets an empty 304
+
+    python benchmarks/render_cache_bench.py --conversations 200 --messages 50
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--conversations', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=50, help='messages per conversation')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='agribot-render-')
+    os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}", RENDER_CACHE_ENABLED='true',
+                      REQUEST_LOG='false')
+    try:
+        import app as agribot
+        from werkzeug.security import generate_password_hash
+
+        with agribot.app.app_context():
+            user = agribot.User(email='bench@example.com', password=generate_password_hash('pw'), first_name='Bench',
+                                last_name='User', show_welcome_popup=False)
+            agribot.db.session.add(user)
+            agribot.db.session.flush()
+            conversations = [agribot.Conversation(user_id=user.id, title=f"Maize question {i}")
+                             for i in range(args.conversations)]
+            agribot.db.session.add_all(conversations)
+            agribot.db.session.flush()
+            agribot.db.session.add_all(
+                agribot.Message(conversation_id=c.id, sender='user' if i % 2 == 0 else 'ai',
+                                content='How do I control fall armyworm on maize in the long rains?')
+                for c in conversations for i in range(args.messages))
+            agribot.db.session.commit()
+            newest = conversations[-1].id
+
+        client = agribot.app.test_client()
+        client.post('/login', data={'email': 'bench@example.com', 'password': 'pw'})
+        render_cache = agribot.render_cache
+        print(f"{args.conversations} conversations x {args.messages} messages, {args.requests} requests per row")
+        print(f"{'page':<18} {'mode':<10} {'p50 ms':>8} {'mean ms':>8} {'bytes':>8}")
+        for page in ('/chat', f'/chat/{newest}'):
+            for mode in ('render', 'cache hit', '304'):
+                agribot.render_cache = None if mode == 'render' else render_cache
+                etag = client.get(page).headers.get('ETag', '').strip('"')
+                headers = {'If-None-Match': f'"{etag}"'} if mode == '304' else {}
+                latencies, sizes = [], []
+                for _ in range(args.requests):
+                    start = time.perf_counter()
+                    response = client.get(page, headers=headers)
+                    body = response.get_data()
+                    latencies.append(time.perf_counter() - start)
+                    sizes.append(len(body))
+                expected = 304 if mode == '304' else 200
+                assert response.status_code == expected, (page, mode, response.status_code)
+                latencies_ms = np.array(latencies) * 1000
+                print(f"{page:<18} {mode:<10} {np.percentile(latencies_ms, 50):>8.2f} {latencies_ms.mean():>8.2f} "
+                      f"{int(np.mean(sizes)):>8}")
+        print(render_cache.stats())
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Load test /send_message under each gunicorn SERVING_MODE against a slow stub upstream.
+
+Copies the app to a temporary directory (so the local instance/site.db is
+untouched), points HF_API_URL_* at an in-process stub that sleeps
+--upstream-ms per call, starts gunicorn with gunicorn.conf.py for every mode
+and drives it with --clients concurrent logged-in users.
+
+    python benchmarks/serving_load_test.py --modes sync async --clients 32 --upstream-ms 500
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SlowUpstream(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    delay = 0.5
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(SlowUpstream.delay)
+        body = json.dumps([{"generated_text": f"answer: stub {uuid.uuid4().hex[:6]}"}]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(base_url + '/login', timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"gunicorn did not come up at {base_url}")
+
+
+def logged_in_client(base_url):
+    # Signup/login hash passwords (CPU heavy), so they happen before the timed phase
+    session = requests.Session()
+    email = f"load-{uuid.uuid4().hex}@example.com"
+    session.post(base_url + '/signup', data={'email': email, 'first_name': 'Load', 'last_name': 'Test', 'password': 'pw'})
+    session.post(base_url + '/login', data={'email': email, 'password': 'pw'})
+    location = session.post(base_url + '/chat/new', allow_redirects=False).headers['Location']
+    return session, location.rstrip('/').split('/')[-1]
+
+
+def drive(base_url, session, conversation_id, duration):
+    latencies, errors = [], 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        # Unique question per turn so no cache can short-circuit the upstream call
+        data = {'user_input': f"how to grow maize {uuid.uuid4().hex}", 'conversation_id': conversation_id}
+        start = time.perf_counter()
+        try:
+            response = session.post(base_url + '/send_message', data=data, timeout=120)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        except requests.exceptions.RequestException:
+            errors += 1
+    return latencies, errors
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float('nan')
+
+
+def run_mode(mode, args, upstream_url, app_dir):
+    port = free_port()
+    env = dict(os.environ, SECRET_KEY='load-test', SERVING_MODE=mode, BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(args.workers),
+               HF_API_URL_NORMAL=upstream_url, HF_API_URL_UPGRADED=upstream_url, ANSWER_CACHE_BACKEND='none')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                              cwd=app_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(base_url)
+        with ThreadPoolExecutor(args.clients) as pool:
+            clients = list(pool.map(lambda _: logged_in_client(base_url), range(args.clients)))
+            start = time.perf_counter()
+            results = list(pool.map(lambda c: drive(base_url, *c, args.duration), clients))
+            elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = [lat for lats, _ in results for lat in lats]
+    return {
+        'mode': mode,
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', nargs='+', default=['sync', 'threads', 'async'])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load per mode')
+    parser.add_argument('--upstream-ms', type=float, default=500.0)
+    args = parser.parse_args()
+
+    SlowUpstream.delay = args.upstream_ms / 1000
+    upstream = ThreadingHTTPServer(('127.0.0.1', 0), SlowUpstream)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    upstream_url = f"http://127.0.0.1:{upstream.server_port}/"
+
+    app_dir = tempfile.mkdtemp(prefix='agribot-load-')
+    try:
+        shutil.copytree(ROOT, app_dir, dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns('.git', 'instance', '__pycache__', 'notebook', 'images', '*.pdf'))
+        print(f"{'mode':<8} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        for mode in args.modes:
+            r = run_mode(mode, args, upstream_url, app_dir)
+            print(f"{r['mode']:<8} {r['requests']:>8} {r['errors']:>6} {r['rps']:>8.1f} {r['p50_ms']:>8.0f} {r['p99_ms']:>8.0f}")
+    finally:
+        upstream.shutdown()
+        shutil.rmtree(app_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Concurrent chat-turn writes against SQLite: default settings vs the storage.py tuning.
+
+Starts --processes writer processes (one per gunicorn worker) that each save
+--turns chat turns into a shared database file while a reader process keeps
+loading conversations, first with SQLite's defaults (rollback journal,
+synchronous=FULL, no busy_timeout, user and AI message committed separately)
+and then with WAL, synchronous=NORMAL, busy_timeout and one commit per turn.
+
+    python benchmarks/sqlite_write_bench.py --processes 4 --turns 300
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+SCHEMA = """
+CREATE TABLE conversation (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, title VARCHAR(200), created_at DATETIME);
+CREATE TABLE message (id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL REFERENCES conversation (id),
+                      sender VARCHAR(10) NOT NULL, content TEXT NOT NULL, timestamp DATETIME);
+CREATE INDEX ix_message_conversation_id_timestamp ON message (conversation_id, timestamp);
+"""
+INSERT = "INSERT INTO message (conversation_id, sender, content, timestamp) VALUES (?, ?, ?, CURRENT_TIMESTAMP)"
+ANSWER = "Apply well-rotted manure before planting and top-dress with nitrogen at knee height. " * 4
+
+MODES = {
+    # timeout=0 surfaces every lock collision as "database is locked" so they can be counted
+    'default': {'pragmas': {}, 'timeout': 0.0, 'one_commit': False},
+    'tuned': {'pragmas': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000,
+                          'mmap_size': 268435456}, 'timeout': 5.0, 'one_commit': True},
+}
+
+
+def connect(path, mode):
+    conn = sqlite3.connect(path, timeout=MODES[mode]['timeout'], isolation_level=None)
+    for name, value in MODES[mode]['pragmas'].items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+
+def execute_retrying(conn, sql, params=()):
+    # What the app sees without busy_timeout: "database is locked", counted and retried
+    errors = 0
+    while True:
+        try:
+            return conn.execute(sql, params), errors
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            errors += 1
+            time.sleep(0.001)
+
+
+def writer(path, mode, worker, turns, results):
+    conn = connect(path, mode)
+    conversation_id = worker + 1
+    latencies, errors = [], 0
+    for turn in range(turns):
+        start = time.perf_counter()
+        if MODES[mode]['one_commit']:
+            for sql, params in (("BEGIN IMMEDIATE", ()),
+                                (INSERT, (conversation_id, 'user', f"question {turn}")),
+                                (INSERT, (conversation_id, 'ai', ANSWER)),
+                                ("COMMIT", ())):
+                errors += execute_retrying(conn, sql, params)[1]
+        else:
+            for sender, content in (('user', f"question {turn}"), ('ai', ANSWER)):
+                for sql, params in (("BEGIN IMMEDIATE", ()), (INSERT, (conversation_id, sender, content)), ("COMMIT", ())):
+                    errors += execute_retrying(conn, sql, params)[1]
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    results.put((latencies, errors))
+
+
+def reader(path, mode, n_conversations, stop, results):
+    conn = connect(path, mode)
+    reads, errors = 0, 0
+    while not stop.is_set():
+        conversation_id = reads % n_conversations + 1
+        cursor, failed = execute_retrying(
+            conn, "SELECT * FROM message WHERE conversation_id = ? ORDER BY timestamp DESC LIMIT 50", (conversation_id,))
+        cursor.fetchall()
+        reads += 1
+        errors += failed
+    conn.close()
+    results.put(('reads', reads, errors))
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float('nan')
+
+
+def run(mode, args):
+    path = os.path.join(tempfile.mkdtemp(prefix='agribot-sqlite-'), 'bench.db')
+    conn = connect(path, mode)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO conversation (user_id, title) VALUES (?, ?)",
+                     [(i, f"Chat {i}") for i in range(args.processes)])
+    conn.close()
+
+    results, reader_results = multiprocessing.Queue(), multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    readers = [multiprocessing.Process(target=reader, args=(path, mode, args.processes, stop, reader_results))]
+    writers = [multiprocessing.Process(target=writer, args=(path, mode, i, args.turns, results))
+               for i in range(args.processes)]
+    for p in readers:
+        p.start()
+    start = time.perf_counter()
+    for p in writers:
+        p.start()
+    collected = [results.get() for _ in writers]
+    elapsed = time.perf_counter() - start
+    stop.set()
+    _, reads, read_errors = reader_results.get()
+    for p in writers + readers:
+        p.join()
+
+    latencies = [lat for lats, _ in collected for lat in lats]
+    return {
+        'mode': mode,
+        'turns_per_s': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'locked': sum(errors for _, errors in collected) + read_errors,
+        'reads_per_s': reads / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--turns', type=int, default=300, help='chat turns saved per process')
+    parser.add_argument('--modes', nargs='+', default=list(MODES))
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'turns/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'locked':>7} {'reads/s':>8}")
+    for mode in args.modes:
+        r = run(mode, args)
+        print(f"{r['mode']:<8} {r['turns_per_s']:>8.0f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['locked']:>7} {r['reads_per_s']:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
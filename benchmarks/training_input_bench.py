@@ -0,0 +1,132 @@
+"""Epoch time of the notebooks' input pipeline vs the cached memory-mapped one.
+
+"before" is what python_files/agribot.py used to do: two train_test_split
+calls, ``datasets.map(preprocess_data)`` on every run and ``to_tf_dataset``
+with a per-example ``tf.stack`` collate_fn. "after" is training/data.py:
+tokenize once into .npy files and batch from them with a vectorized gather.
+
+Without --data a synthetic set the size of KisanVaani (22,615 QA pairs) is
+generated. With --model the epoch includes ``model.fit`` on that (ideally
+tiny) T5 checkpoint; otherwise only the input pipeline is timed.
+
+    python benchmarks/training_input_bench.py --tokenizer t5-base
+    python benchmarks/training_input_bench.py --tokenizer ./tiny_tok --model ./tiny_t5 --examples 4000
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tensorflow as tf
+from datasets import Dataset, load_dataset
+from transformers import T5Tokenizer, TFT5ForConditionalGeneration
+from training.train import keras  # tf_keras or tf.keras, whichever transformers uses
+
+from training.data import build_cache, split_dataset, tf_dataset
+
+WORDS = ("maize wheat rice soil nitrogen fertilizer compost irrigation aphids pest crop yield seed "
+         "planting harvest rainfall drought manure mulch weeds fungicide rotation cattle poultry "
+         "tomato cassava beans sorghum organic acidic loam spacing germination").split()
+
+
+def synthetic_dataset(n, seed=0):
+    rng = random.Random(seed)
+    questions = [f"how do i {' '.join(rng.choices(WORDS, k=rng.randint(4, 22)))}" for _ in range(n)]
+    answers = [' '.join(rng.choices(WORDS, k=rng.randint(5, 60))) for _ in range(n)]
+    return Dataset.from_dict({'question': questions, 'answers': answers})
+
+
+def notebook_pipeline(dataset, tokenizer, batch_size):
+    # Verbatim from the notebooks, apart from the tokenizer being passed in
+    train_dataset = dataset.train_test_split(test_size=0.2, seed=42)['train']
+
+    def preprocess_data(examples):
+        questions = [str(q) if q else "Unknown question" for q in examples['question']]
+        answers = [str(a) if a else "No answer available" for a in examples['answers']]
+        inputs = [f"question: {q} context: agriculture </s>" for q in questions]
+        model_inputs = tokenizer(inputs, max_length=128, truncation=True, padding="max_length", return_tensors="tf")
+        labels = tokenizer(answers, max_length=128, truncation=True, padding="max_length", return_tensors="tf")
+        return {"input_ids": model_inputs["input_ids"], "attention_mask": model_inputs["attention_mask"],
+                "labels": labels["input_ids"]}
+
+    train_dataset = train_dataset.map(preprocess_data, batched=True, load_from_cache_file=False)
+    return train_dataset.to_tf_dataset(
+        columns=["input_ids", "attention_mask", "labels"],
+        shuffle=True,
+        batch_size=batch_size,
+        collate_fn=lambda x: {
+            "input_ids": tf.stack([tf.convert_to_tensor(item["input_ids"]) for item in x]),
+            "attention_mask": tf.stack([tf.convert_to_tensor(item["attention_mask"]) for item in x]),
+            "labels": tf.stack([tf.convert_to_tensor(item["labels"]) for item in x])
+        }
+    )
+
+
+def cached_pipeline(dataset, tokenizer, batch_size, cache_dir):
+    train_dataset, _ = split_dataset(dataset)
+    return tf_dataset(build_cache(train_dataset, tokenizer, cache_dir), batch_size=batch_size, shuffle=True)
+
+
+def epoch_seconds(tf_data, model):
+    if model is None:
+        start = time.perf_counter()
+        for _ in tf_data:
+            pass
+        return time.perf_counter() - start
+    # Trace the train step for this element spec first so graph building isn't counted
+    model.fit(tf_data.take(2), epochs=1, verbose=0)
+    start = time.perf_counter()
+    model.fit(tf_data, epochs=1, verbose=0)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', help='local JSON/CSV with question/answers columns')
+    parser.add_argument('--examples', type=int, default=22615, help='synthetic examples when --data is not given')
+    parser.add_argument('--tokenizer', default='t5-base')
+    parser.add_argument('--model', help='T5 checkpoint to train for one epoch (tiny config recommended on CPU)')
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    if args.data:
+        data_format = 'csv' if args.data.endswith('.csv') else 'json'
+        dataset = load_dataset(data_format, data_files=args.data)['train']
+    else:
+        dataset = synthetic_dataset(args.examples)
+    tokenizer = T5Tokenizer.from_pretrained(args.tokenizer)
+    model = None
+    if args.model:
+        model = TFT5ForConditionalGeneration.from_pretrained(args.model)
+        model.compile(optimizer=keras.optimizers.Nadam(learning_rate=2e-5), loss=model.hf_compute_loss)
+
+    cache_dir = tempfile.mkdtemp(prefix='agribot-token-cache-')
+    try:
+        rows = []
+        start = time.perf_counter()
+        before = notebook_pipeline(dataset, tokenizer, args.batch_size)
+        prep = time.perf_counter() - start
+        rows.append(('before (map + collate_fn)', prep, epoch_seconds(before, model)))
+
+        for label in ('after, cold cache', 'after, warm cache'):
+            start = time.perf_counter()
+            after = cached_pipeline(dataset, tokenizer, args.batch_size, cache_dir)
+            prep = time.perf_counter() - start
+            rows.append((label, prep, epoch_seconds(after, model)))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    what = 'train epoch' if model is not None else 'input-only epoch'
+    print(f"{len(dataset)} examples, batch size {args.batch_size}, {what}")
+    print(f"{'pipeline':<28} {'preprocess s':>12} {'epoch s':>9} {'total s':>9}")
+    for label, prep, epoch in rows:
+        print(f"{label:<28} {prep:>12.2f} {epoch:>9.2f} {prep + epoch:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,131 @@
 import os
  
-SECRET_KEY = os.urandom(24)
+# Set SECRET_KEY when running more than one worker, otherwise each worker signs sessions with its own key
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(24)
 SQLALCHEMY_DATABASE_URI = 'sqlite:///site.db'
-SQLALCHEMY_TRACK_MODIFICATIONS = False 
\ No newline at end of file
+SQLALCHEMY_TRACK_MODIFICATIONS = False 
+
+# Inference HTTP client (connection pooling, timeouts, retries, circuit breaker)
+INFERENCE_POOL_SIZE = int(os.environ.get('INFERENCE_POOL_SIZE', 10))
+INFERENCE_CONNECT_TIMEOUT = float(os.environ.get('INFERENCE_CONNECT_TIMEOUT', 3.05))
+INFERENCE_READ_TIMEOUT = float(os.environ.get('INFERENCE_READ_TIMEOUT', 30))
+INFERENCE_MAX_RETRIES = int(os.environ.get('INFERENCE_MAX_RETRIES', 2))
+INFERENCE_BACKOFF = float(os.environ.get('INFERENCE_BACKOFF', 0.5))
+INFERENCE_BACKOFF_MAX = float(os.environ.get('INFERENCE_BACKOFF_MAX', 4))
+INFERENCE_BREAKER_THRESHOLD = int(os.environ.get('INFERENCE_BREAKER_THRESHOLD', 5))
+INFERENCE_BREAKER_RESET = float(os.environ.get('INFERENCE_BREAKER_RESET', 30))
+
+# Answer cache in front of the model: 'memory' (per worker), 'sqlite' (shared by all workers) or 'none'
+ANSWER_CACHE_BACKEND = os.environ.get('ANSWER_CACHE_BACKEND', 'memory')
+ANSWER_CACHE_PATH = os.environ.get('ANSWER_CACHE_PATH')  # defaults to instance/answer_cache.db
+ANSWER_CACHE_TTL = int(os.environ.get('ANSWER_CACHE_TTL', 24 * 60 * 60))
+ANSWER_CACHE_MAX_BYTES = int(os.environ.get('ANSWER_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 10000))
+
+# Semantic near-duplicate cache over previously answered questions (needs numpy)
+SEMANTIC_CACHE_ENABLED = os.environ.get('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true'
+SEMANTIC_CACHE_PATH = os.environ.get('SEMANTIC_CACHE_PATH')  # defaults to instance/semantic_index
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', 0.85))
+SEMANTIC_CACHE_DIM = int(os.environ.get('SEMANTIC_CACHE_DIM', 1024))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get('SEMANTIC_CACHE_MAX_ENTRIES', 50000))
+
+# Out-of-domain gate: hashed n-gram classifier that refuses off-topic questions before any model call
+# (train with `python domain_gate.py train`)
+DOMAIN_GATE_ENABLED = os.environ.get('DOMAIN_GATE_ENABLED', 'false').lower() == 'true'
+DOMAIN_GATE_PATH = os.environ.get('DOMAIN_GATE_PATH')  # defaults to instance/domain_gate.npz
+DOMAIN_GATE_THRESHOLD = os.environ.get('DOMAIN_GATE_THRESHOLD')  # overrides the threshold picked at training time
+
+# BM25 retrieval over the curated KisanVaani QA pairs, in front of the model (build with `python faq_index.py build`)
+FAQ_ENABLED = os.environ.get('FAQ_ENABLED', 'false').lower() == 'true'
+FAQ_INDEX_PATH = os.environ.get('FAQ_INDEX_PATH')  # defaults to instance/faq_index
+FAQ_THRESHOLD = float(os.environ.get('FAQ_THRESHOLD', 0.8))  # 0..1, share of both questions' words that match
+
+# Inference backend for send_message: 'remote' (HF endpoints) or 'local' (in-process T5)
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'remote')
+LOCAL_MODEL_PATH = os.environ.get('LOCAL_MODEL_PATH', 'fine_tuned_t5_agriculture_exp2')
+LOCAL_TOKENIZER_PATH = os.environ.get('LOCAL_TOKENIZER_PATH', 'fine_tuned_t5_agriculture_exp')
+LOCAL_MODEL_FORMAT = os.environ.get('LOCAL_MODEL_FORMAT', 'tf')  # 'tf' or 'onnx'
+LOCAL_MAX_INPUT_LENGTH = int(os.environ.get('LOCAL_MAX_INPUT_LENGTH', 128))
+LOCAL_MAX_NEW_TOKENS = int(os.environ.get('LOCAL_MAX_NEW_TOKENS', 128))
+LOCAL_NUM_BEAMS_NORMAL = int(os.environ.get('LOCAL_NUM_BEAMS_NORMAL', 1))
+LOCAL_NUM_BEAMS_UPGRADED = int(os.environ.get('LOCAL_NUM_BEAMS_UPGRADED', 4))
+LOCAL_NUM_THREADS = int(os.environ.get('LOCAL_NUM_THREADS', 0))  # 0 lets TF decide
+LOCAL_WARMUP = os.environ.get('LOCAL_WARMUP', 'true').lower() == 'true'
+
+# Dynamic micro-batching of concurrent prompts (useful with threaded workers or the local backend)
+INFERENCE_BATCHING = os.environ.get('INFERENCE_BATCHING', 'false').lower() == 'true'
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 10))
+
+# Ask the remote endpoint for token streaming (text-generation-inference style SSE) on /send_message/stream
+REMOTE_STREAMING = os.environ.get('REMOTE_STREAMING', 'false').lower() == 'true'
+
+# Conversation history is loaded in keyset-paginated pages of this many messages
+MESSAGE_PAGE_SIZE = int(os.environ.get('MESSAGE_PAGE_SIZE', 50))
+MESSAGE_PAGE_SIZE_MAX = int(os.environ.get('MESSAGE_PAGE_SIZE_MAX', 200))
+
+# SQLite connection PRAGMAs (ignored when DATABASE_URL points at another database)
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+# Request metrics: Prometheus text on /metrics plus one JSON log line per request
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+REQUEST_LOG = os.environ.get('REQUEST_LOG', 'true').lower() == 'true'
+# Shared directory for per-worker snapshots so /metrics covers every gunicorn worker
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+# Job-queue mode: /send_message saves the question, returns 202 with a job id, and a pool of
+# threads per worker (sharing one SQLite queue) saves the answer; the client polls /jobs/<id>
+JOB_QUEUE_ENABLED = os.environ.get('JOB_QUEUE_ENABLED', 'false').lower() == 'true'
+JOB_QUEUE_PATH = os.environ.get('JOB_QUEUE_PATH')  # defaults to instance/jobs.db
+# Most prompts of a tier generated at once on the host, across all workers
+JOB_CONCURRENCY_NORMAL = int(os.environ.get('JOB_CONCURRENCY_NORMAL', 4))
+JOB_CONCURRENCY_UPGRADED = int(os.environ.get('JOB_CONCURRENCY_UPGRADED', 2))
+JOB_POLL_INTERVAL_MS = float(os.environ.get('JOB_POLL_INTERVAL_MS', 200))
+# Longest /jobs/<id>?wait=N long-poll. A waiting request holds its worker, so it is off with sync workers
+# (SERVING_MODE=sync) and the page polls instead
+JOB_MAX_WAIT_SECONDS = float(os.environ.get('JOB_MAX_WAIT_SECONDS',
+                                            0 if os.environ.get('SERVING_MODE', 'sync') == 'sync' else 10))
+# Running jobs older than this (or whose worker died) are requeued, up to JOB_MAX_ATTEMPTS tries
+JOB_STALE_SECONDS = float(os.environ.get('JOB_STALE_SECONDS', 300))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+# Finished jobs are deleted this long after they finish
+JOB_RETENTION_SECONDS = float(os.environ.get('JOB_RETENTION_SECONDS', 3600))
+
+# Single-flight: identical questions (same normalized prompt and tier) already being generated,
+# in this worker or another on the host, wait for that generation instead of calling upstream again
+COALESCE_ENABLED = os.environ.get('COALESCE_ENABLED', 'false').lower() == 'true'
+COALESCE_PATH = os.environ.get('COALESCE_PATH')  # defaults to instance/single_flight.db
+COALESCE_TIMEOUT = float(os.environ.get('COALESCE_TIMEOUT', 60))  # then a waiting worker generates itself
+COALESCE_POLL_INTERVAL_MS = float(os.environ.get('COALESCE_POLL_INTERVAL_MS', 50))
+
+# Multi-turn context: earlier messages of the conversation, newest first, go into the prompt
+# up to this many tokens (0 = off, each question is answered on its own as the model was trained)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 0))
+CONTEXT_MAX_MESSAGES = int(os.environ.get('CONTEXT_MAX_MESSAGES', 20))  # rows read per turn
+CONTEXT_TOKENIZER_PATH = os.environ.get('CONTEXT_TOKENIZER_PATH')  # defaults to LOCAL_TOKENIZER_PATH
+
+# Per-worker cache of rendered chat pages plus ETag/304 handling, keyed on user.content_version
+RENDER_CACHE_ENABLED = os.environ.get('RENDER_CACHE_ENABLED', 'false').lower() == 'true'
+RENDER_CACHE_TTL = int(os.environ.get('RENDER_CACHE_TTL', 3600))
+RENDER_CACHE_MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+RENDER_CACHE_MAX_ENTRIES = int(os.environ.get('RENDER_CACHE_MAX_ENTRIES', 2000))
+
+# Per-worker copy of each logged-in user's row for Flask-Login's load_user (one SELECT less per request).
+# Profile changes made through another worker show up after at most the TTL; content_version is always read fresh.
+USER_CACHE_ENABLED = os.environ.get('USER_CACHE_ENABLED', 'false').lower() == 'true'
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 5))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000))
+
+# Fingerprinted static assets built by `python assets.py build` (used when its manifest exists)
+ASSETS_DIR = os.environ.get('ASSETS_DIR')  # defaults to static/dist
+ASSETS_MAX_AGE = int(os.environ.get('ASSETS_MAX_AGE', 365 * 24 * 3600))
+
+# Profile pictures are re-encoded to small WebP/JPEG thumbnails by a background thread
+AVATAR_MAX_BYTES = int(os.environ.get('AVATAR_MAX_BYTES', 5 * 1024 * 1024))
+AVATAR_WORKERS = int(os.environ.get('AVATAR_WORKERS', 1))
+# Werkzeug stops reading bigger request bodies (413) before they are spooled to disk
+MAX_CONTENT_LENGTH = AVATAR_MAX_BYTES + 64 * 1024
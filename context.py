@@ -0,0 +1,82 @@
+"""Token-budgeted conversation history for multi-turn prompts.
+
+Each message's token count is stored on its row when it is written, so
+building the context for a new question only adds up integers: recent
+messages are taken newest first until the next one would exceed the budget,
+then put back in order in front of the question.
+"""
+import threading
+
+from prompts import build_prompt
+
+
+class TokenCounter:
+    """Counts tokens with the model's tokenizer, loaded on first use."""
+
+    def __init__(self, tokenizer_path, tokenizer=None):
+        self.tokenizer_path = tokenizer_path
+        self.tokenizer = tokenizer
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self.tokenizer is None:
+                from transformers import AutoTokenizer
+                self.tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_path)
+        return self.tokenizer
+
+    def count(self, text):
+        tokenizer = self.tokenizer or self._load()
+        return len(tokenizer(text or '', add_special_tokens=False)['input_ids'])
+
+
+class ContextBuilder:
+    """Adds as much recent history to a prompt as fits in ``budget`` tokens.
+
+    ``budget`` is also capped so the whole prompt stays within
+    ``max_input_length``, past which the model would truncate it.
+    """
+
+    def __init__(self, counter, budget=64, max_input_length=128, max_messages=20):
+        self.counter = counter
+        self.budget = budget
+        self.max_input_length = max_input_length
+        self.max_messages = max_messages
+        self.turns = 0
+        self.messages_used = 0
+
+    @classmethod
+    def from_config(cls, config, tokenizer=None):
+        return cls(TokenCounter(config['CONTEXT_TOKENIZER_PATH'] or config['LOCAL_TOKENIZER_PATH'], tokenizer),
+                   budget=config['CONTEXT_TOKEN_BUDGET'], max_input_length=config['LOCAL_MAX_INPUT_LENGTH'],
+                   max_messages=config['CONTEXT_MAX_MESSAGES'])
+
+    def count(self, text):
+        return self.counter.count(text)
+
+    def select(self, history, budget):
+        """The newest messages of ``history`` ((content, token_count) pairs, newest first) that fit, oldest first."""
+        selected, used = [], 0
+        for content, token_count in history:
+            if token_count is None:
+                # Written before counts were stored
+                token_count = self.count(content)
+            if used + token_count > budget:
+                break
+            selected.append(content)
+            used += token_count
+        return selected[::-1]
+
+    def build(self, question, history):
+        """``(prompt, used_history)`` for ``question`` after ``history``."""
+        prompt = build_prompt(question)
+        budget = min(self.budget, self.max_input_length - self.count(prompt))
+        selected = self.select(history, budget) if budget > 0 else []
+        self.turns += 1
+        self.messages_used += len(selected)
+        if not selected:
+            return prompt, False
+        return build_prompt(question, ' '.join(selected)), True
+
+    def stats(self):
+        return {'turns': self.turns, 'messages_per_turn': self.messages_used / self.turns if self.turns else 0.0}
@@ -0,0 +1,226 @@
+"""Cheap out-of-domain check that runs before any cache lookup or model call.
+
+A logistic regression over hashed word unigrams, bigrams and character
+trigrams, trained on the KisanVaani questions (in domain) against general
+questions from another dataset (out of domain). The model is one float16
+weight vector in a small ``.npz`` and scores a question in microseconds.
+
+    python domain_gate.py train --negatives rajpurkar/squad --output instance/domain_gate.npz
+    python domain_gate.py check "what's the weather like in paris"
+"""
+import argparse
+import os
+import random
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from prompts import normalize_question
+
+FORMAT_VERSION = 1
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+
+def features(text, dim):
+    """Hashed feature indices for a question; each feature has weight 1/sqrt(count) (L2-normalised)."""
+    words = _TOKEN.findall(normalize_question(text))
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        grams.extend('#' + padded[i:i + 3] for i in range(len(padded) - 2))
+    return np.array([zlib.crc32(g.encode('utf-8')) % dim for g in grams], dtype=np.int64)
+
+
+def _logit(weights, bias, indices):
+    return float(weights[indices].sum()) / np.sqrt(len(indices)) + bias if len(indices) else bias
+
+
+def _sigmoid(z):
+    return 1 / (1 + np.exp(-np.clip(z, -30, 30)))
+
+
+def _scores(weights, bias, rows):
+    return np.array([_sigmoid(_logit(weights, bias, indices)) for indices in rows])
+
+
+def train_gate(positives, negatives, dim=2 ** 16, epochs=5, learning_rate=0.5, l2=1e-6, batch_size=64,
+               holdout=0.1, target_recall=0.99, seed=0):
+    """Fit the gate; returns ``(weights, bias, threshold, report)``.
+
+    The threshold is set on a held-out split so that ``target_recall`` of the
+    in-domain questions pass; the report gives precision and recall of the
+    rejections at that threshold.
+    """
+    rng = random.Random(seed)
+    examples = [(q, 1.0) for q in positives] + [(q, 0.0) for q in negatives]
+    rng.shuffle(examples)
+    cut = int(len(examples) * (1 - holdout))
+    rows = [features(q, dim) for q, _ in examples]
+    labels = np.array([y for _, y in examples], dtype=np.float32)
+    train_rows, train_labels = rows[:cut], labels[:cut]
+    # Balance the classes so the negative sample size doesn't set the prior
+    class_weight = {1.0: len(train_labels) / (2 * max(train_labels.sum(), 1)),
+                    0.0: len(train_labels) / (2 * max(len(train_labels) - train_labels.sum(), 1))}
+
+    weights = np.zeros(dim, dtype=np.float32)
+    bias = 0.0
+    order = np.arange(len(train_rows))
+    np_rng = np.random.default_rng(seed)
+    for epoch in range(epochs):
+        np_rng.shuffle(order)
+        step = learning_rate / (1 + epoch)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            lengths = np.array([len(train_rows[i]) for i in batch])
+            indices = np.concatenate([train_rows[i] for i in batch])
+            row_ids = np.repeat(np.arange(len(batch)), lengths)
+            values = np.repeat(1 / np.sqrt(np.maximum(lengths, 1)), lengths)
+            z = np.bincount(row_ids, weights=weights[indices] * values, minlength=len(batch)) + bias
+            y = train_labels[batch]
+            gradient = (_sigmoid(z) - y) * np.where(y == 1.0, class_weight[1.0], class_weight[0.0])
+            np.add.at(weights, indices, -step * gradient[row_ids] * values / len(batch))
+            weights *= 1 - step * l2
+            bias -= step * float(gradient.mean())
+
+    held_rows, held_labels = rows[cut:], labels[cut:]
+    scores = _scores(weights, bias, held_rows)
+    in_domain = scores[held_labels == 1.0]
+    threshold = float(np.quantile(in_domain, 1 - target_recall)) if len(in_domain) else 0.5
+    rejected = scores < threshold
+    out_of_domain = held_labels == 0.0
+    true_rejections = int((rejected & out_of_domain).sum())
+    report = {
+        'threshold': threshold,
+        'held_out': len(held_labels),
+        'precision': true_rejections / max(int(rejected.sum()), 1),
+        'recall': true_rejections / max(int(out_of_domain.sum()), 1),
+        'in_domain_pass_rate': float((~rejected[held_labels == 1.0]).mean()) if len(in_domain) else 0.0,
+    }
+    return weights, bias, threshold, report
+
+
+def save_gate(path, weights, bias, threshold):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, weights=weights.astype(np.float16), bias=np.float32(bias), threshold=np.float32(threshold),
+             version=np.int32(FORMAT_VERSION))
+    os.replace(tmp, path)
+
+
+class DomainGate:
+    """Says whether a question is agricultural enough to send to the model."""
+
+    def __init__(self, path, threshold=None):
+        self.path = path
+        self.threshold = threshold
+        self.weights = None
+        self.bias = 0.0
+        self.allowed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def from_config(cls, config, default_path):
+        threshold = config['DOMAIN_GATE_THRESHOLD']
+        return cls(config['DOMAIN_GATE_PATH'] or default_path,
+                   threshold=float(threshold) if threshold not in (None, '') else None)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            print(f"Domain gate model not found at {self.path}; train it with `python domain_gate.py train`")
+            return
+        with np.load(self.path) as data:
+            if int(data['version']) != FORMAT_VERSION:
+                print(f"Domain gate at {self.path} has format {int(data['version'])}, expected {FORMAT_VERSION}")
+                return
+            self.weights = data['weights'].astype(np.float32)
+            self.bias = float(data['bias'])
+            if self.threshold is None:
+                self.threshold = float(data['threshold'])
+
+    def score(self, question):
+        """Probability that the question is in domain."""
+        return float(_sigmoid(_logit(self.weights, self.bias, features(question, len(self.weights)))))
+
+    def allows(self, question):
+        # Without a model every question goes through
+        allowed = self.weights is None or self.score(question) >= self.threshold
+        with self._lock:
+            if allowed:
+                self.allowed += 1
+            else:
+                self.rejected += 1
+        return allowed
+
+    def stats(self):
+        checked = self.allowed + self.rejected
+        return {'allowed': self.allowed, 'rejected': self.rejected,
+                'rejected_rate': self.rejected / checked if checked else 0.0}
+
+
+def load_questions(name_or_path):
+    """Questions from a text file (one per line), a local json/csv file or a Hugging Face dataset."""
+    if name_or_path.endswith('.txt'):
+        with open(name_or_path) as f:
+            return [line.strip() for line in f if line.strip()]
+    from training.data import load_qa_dataset
+
+    return [q for q in load_qa_dataset(name_or_path)['question'] if q]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train = subparsers.add_parser('train', help='fit the gate and report precision/recall and latency')
+    train.add_argument('--dataset', default='KisanVaani/agriculture-qa-english-only', help='in-domain questions')
+    train.add_argument('--negatives', action='append', default=[],
+                       help='out-of-domain questions: HF dataset, json/csv or .txt file (repeatable; '
+                            'default rajpurkar/squad)')
+    train.add_argument('--max-negatives', type=int, help='sample at most this many (default: 2x the positives)')
+    train.add_argument('--dim', type=int, default=2 ** 16)
+    train.add_argument('--epochs', type=int, default=5)
+    train.add_argument('--target-recall', type=float, default=0.99, help='share of in-domain questions let through')
+    train.add_argument('--output', default=os.path.join('instance', 'domain_gate.npz'))
+    check = subparsers.add_parser('check', help='score a question with a trained gate')
+    check.add_argument('question')
+    check.add_argument('--model', default=os.path.join('instance', 'domain_gate.npz'))
+    args = parser.parse_args()
+
+    if args.command == 'check':
+        gate = DomainGate(args.model)
+        print(f"in-domain probability {gate.score(args.question):.3f} (threshold {gate.threshold:.3f}): "
+              f"{'allow' if gate.allows(args.question) else 'reject'}")
+        return
+
+    positives = list(dict.fromkeys(load_questions(args.dataset)))
+    negatives = list(dict.fromkeys(q for name in args.negatives or ['rajpurkar/squad'] for q in load_questions(name)))
+    limit = args.max_negatives or 2 * len(positives)
+    if len(negatives) > limit:
+        negatives = random.Random(0).sample(negatives, limit)
+    print(f"{len(positives)} in-domain and {len(negatives)} out-of-domain questions")
+
+    started = time.perf_counter()
+    weights, bias, threshold, report = train_gate(positives, negatives, dim=args.dim, epochs=args.epochs,
+                                                  target_recall=args.target_recall)
+    print(f"trained in {time.perf_counter() - started:.1f}s")
+    save_gate(args.output, weights, bias, threshold)
+
+    gate = DomainGate(args.output)
+    sample = (positives + negatives)[:2000]
+    started = time.perf_counter()
+    for question in sample:
+        gate.score(question)
+    latency_us = (time.perf_counter() - started) / len(sample) * 1e6
+    print(f"held out {report['held_out']}: reject precision {report['precision']:.3f}, "
+          f"recall {report['recall']:.3f}, in-domain pass rate {report['in_domain_pass_rate']:.3f} "
+          f"at threshold {threshold:.3f}")
+    print(f"{latency_us:.1f} us per question, {os.path.getsize(args.output) / 1024:.0f} KB at {args.output}")
+
+
+if __name__ == '__main__':
+    main()
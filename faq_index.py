@@ -0,0 +1,225 @@
+"""BM25 retrieval over the curated KisanVaani question/answer pairs.
+
+``python faq_index.py build`` indexes the dataset's questions once into a few
+``.npy`` files (hashed terms, postings with precomputed BM25 weights and the
+answers as one UTF-8 blob). Workers memory-map them, so the index costs one
+page-cache copy per host and a lookup is a handful of small array operations.
+
+    python faq_index.py build --dataset KisanVaani/agriculture-qa-english-only --output instance/faq_index
+    python faq_index.py query "how do I control aphids on beans"
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from prompts import normalize_question
+
+FORMAT_VERSION = 1
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# semantic_cache's stopwords plus conversational filler; unknown words lower confidence, so these mustn't count
+_STOPWORDS = frozenset(
+    "a an and are as at be can do does for from how i in is it me my of on or should "
+    "the to what when which why with you your "
+    "about explain hello help hi know please tell thanks want".split()
+)
+
+
+def terms(text):
+    return [w for w in _TOKEN.findall(normalize_question(text)) if w not in _STOPWORDS]
+
+
+def term_hash(term):
+    # crc32 like semantic_cache; collisions among a ~20k-word vocabulary are vanishingly rare
+    return zlib.crc32(term.encode('utf-8'))
+
+
+def _files(path):
+    names = ('terms', 'idf', 'offsets', 'docs', 'weights', 'norms', 'answer_offsets', 'answers')
+    return {name: f"{path}.{name}.npy" for name in names}
+
+
+def _idf(n_docs, df):
+    return np.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+
+
+def build_index(pairs, path, k1=1.2, b=0.75):
+    """Write the index for ``(question, answer)`` pairs; repeated questions keep their first answer."""
+    seen = set()
+    doc_terms, answers = [], []
+    for question, answer in pairs:
+        words = terms(question or '')
+        key = ' '.join(words)
+        if not words or not answer or key in seen:
+            continue
+        seen.add(key)
+        doc_terms.append(Counter(term_hash(w) for w in words))
+        answers.append(str(answer).strip())
+
+    n_docs = len(doc_terms)
+    lengths = np.array([sum(counts.values()) for counts in doc_terms], dtype=np.float32)
+    avgdl = float(lengths.mean()) if n_docs else 0.0
+    postings = {}
+    for doc, counts in enumerate(doc_terms):
+        for h, tf in counts.items():
+            postings.setdefault(h, []).append((doc, tf))
+
+    hashes = np.array(sorted(postings), dtype=np.uint32)
+    df = np.array([len(postings[h]) for h in hashes], dtype=np.float32)
+    idf = _idf(n_docs, df).astype(np.float32)
+    offsets = np.zeros(len(hashes) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(df, dtype=np.int64)
+    docs = np.empty(offsets[-1], dtype=np.int32)
+    weights = np.empty(offsets[-1], dtype=np.float32)
+    for i, h in enumerate(hashes):
+        # Docs are appended in ascending order, so each postings list is sorted
+        entries = np.array(postings[int(h)], dtype=np.float32)
+        start, end = offsets[i], offsets[i + 1]
+        docs[start:end] = entries[:, 0]
+        tf = entries[:, 1]
+        norm = k1 * (1 - b + b * lengths[docs[start:end]] / avgdl)
+        weights[start:end] = idf[i] * tf * (k1 + 1) / (tf + norm)
+    # A question's score against itself: the most any query can reach on that doc
+    norms = np.bincount(docs, weights=weights, minlength=n_docs).astype(np.float32)
+
+    encoded = [a.encode('utf-8') for a in answers]
+    answer_offsets = np.zeros(n_docs + 1, dtype=np.int64)
+    answer_offsets[1:] = np.cumsum([len(a) for a in encoded], dtype=np.int64)
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    arrays = {'terms': hashes, 'idf': idf, 'offsets': offsets, 'docs': docs, 'weights': weights, 'norms': norms,
+              'answer_offsets': answer_offsets, 'answers': blob}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    for name, filename in _files(path).items():
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, arrays[name])
+        os.replace(tmp, filename)
+    meta = {'version': FORMAT_VERSION, 'documents': n_docs, 'terms': len(hashes), 'k1': k1, 'b': b, 'avgdl': avgdl}
+    with open(path + '.meta.json', 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+class FaqIndex:
+    """Answers a question with the curated answer of its best BM25 match.
+
+    Confidence is the smaller of two coverages: the share of the matched
+    question's BM25 weight that the user's question hits, and the share of
+    the user's question (by IDF) found in the match. Unknown words count at
+    the highest IDF, so a question about something the dataset never
+    mentions falls through to the model.
+    """
+
+    def __init__(self, path, threshold=0.8):
+        self.path = path
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.size = 0
+        self._load()
+
+    @classmethod
+    def from_config(cls, config, default_path):
+        return cls(config['FAQ_INDEX_PATH'] or default_path, threshold=config['FAQ_THRESHOLD'])
+
+    def _load(self):
+        files = _files(self.path)
+        if not all(os.path.exists(f) for f in files.values()) or not os.path.exists(self.path + '.meta.json'):
+            print(f"FAQ index not found at {self.path}; build it with `python faq_index.py build`")
+            return
+        with open(self.path + '.meta.json') as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            print(f"FAQ index at {self.path} has format {meta.get('version')}, expected {FORMAT_VERSION}; rebuild it")
+            return
+        for name, filename in files.items():
+            setattr(self, '_' + name, np.load(filename, mmap_mode='r'))
+        self.size = meta['documents']
+        self._max_idf = float(_idf(self.size, 0))
+
+    def answer_text(self, doc):
+        start, end = self._answer_offsets[doc], self._answer_offsets[doc + 1]
+        return self._answers[start:end].tobytes().decode('utf-8')
+
+    def search(self, question):
+        """Return ``(doc, confidence)`` of the best match, or ``(None, 0.0)``."""
+        hashes = np.unique(np.array([term_hash(w) for w in terms(question)], dtype=np.uint32))
+        if not self.size or not len(hashes):
+            return None, 0.0
+        positions = np.searchsorted(self._terms, hashes)
+        known = positions < len(self._terms)
+        known[known] = self._terms[positions[known]] == hashes[known]
+        positions = positions[known]
+        query_idf = float(self._idf[positions].sum()) + self._max_idf * int((~known).sum())
+        if not len(positions):
+            return None, 0.0
+
+        starts, ends = self._offsets[positions], self._offsets[positions + 1]
+        docs = np.concatenate([self._docs[start:end] for start, end in zip(starts, ends)])
+        weights = np.concatenate([self._weights[start:end] for start, end in zip(starts, ends)])
+        scores = np.bincount(docs, weights=weights, minlength=self.size)
+        doc = int(scores.argmax())
+        # IDF of the query words that occur in the best match
+        matched_idf = float(np.repeat(self._idf[positions], ends - starts)[docs == doc].sum())
+        confidence = min(float(scores[doc]) / float(self._norms[doc]), matched_idf / query_idf)
+        return doc, confidence
+
+    def lookup(self, question):
+        """Return the curated answer when the match clears ``threshold``, else None."""
+        doc, confidence = self.search(question)
+        answer = self.answer_text(doc) if doc is not None and confidence >= self.threshold else None
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return answer
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'absorbed': self.hits / lookups if lookups else 0.0,
+            'documents': self.size,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='index a Hugging Face dataset or local json/csv file')
+    build.add_argument('--dataset', default='KisanVaani/agriculture-qa-english-only')
+    build.add_argument('--output', default=os.path.join('instance', 'faq_index'))
+    build.add_argument('--k1', type=float, default=1.2)
+    build.add_argument('--b', type=float, default=0.75)
+    query = subparsers.add_parser('query', help='look a question up in a built index')
+    query.add_argument('question')
+    query.add_argument('--index', default=os.path.join('instance', 'faq_index'))
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from training.data import load_qa_dataset
+
+        dataset = load_qa_dataset(args.dataset)
+        meta = build_index(zip(dataset['question'], dataset['answers']), args.output, args.k1, args.b)
+        size = sum(os.path.getsize(f) for f in _files(args.output).values())
+        print(f"indexed {meta['documents']} questions, {meta['terms']} terms, {size / 1e6:.1f} MB at {args.output}")
+    else:
+        index = FaqIndex(args.index)
+        doc, confidence = index.search(args.question)
+        print(f"confidence {confidence:.2f}")
+        if doc is not None:
+            print(index.answer_text(doc))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import os
+
+# Serving mode for the web workers:
+#   sync    - one request per worker process (gunicorn's default)
+#   threads - gthread workers, WORKER_THREADS requests in flight per process
+#   async   - gevent workers; requests waiting on the inference endpoint yield
+#             to other requests, so a few processes can hold many slow calls
+SERVING_MODE = os.environ.get('SERVING_MODE', 'sync')
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+
+if SERVING_MODE == 'threads':
+    worker_class = 'gthread'
+    threads = int(os.environ.get('WORKER_THREADS', 8))
+    concurrency = threads
+elif SERVING_MODE == 'async':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 200))
+    concurrency = worker_connections
+    if os.environ.get('INFERENCE_BACKEND') == 'local':
+        # In-process TF generation never yields to the gevent hub
+        print("SERVING_MODE=async with the local backend serialises generation; use SERVING_MODE=threads")
+elif SERVING_MODE == 'sync':
+    concurrency = 1
+else:
+    raise ValueError(f"Unknown SERVING_MODE: {SERVING_MODE}")
+
+# Keep enough pooled upstream connections for every in-flight request in a worker
+os.environ.setdefault('INFERENCE_POOL_SIZE', str(max(10, concurrency)))
+
+
+def on_starting(server):
+    # Worker metric snapshots from a previous run would be merged into this one's
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for file_name in os.listdir(metrics_dir):
+            if file_name.startswith('metrics-'):
+                os.remove(os.path.join(metrics_dir, file_name))
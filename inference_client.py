@@ -0,0 +1,180 @@
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth retrying: rate limiting and "model is loading / overloaded"
+RETRY_STATUSES = (429, 503)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without touching the network while an endpoint's breaker is open."""
+
+
+class StreamDecodeError(requests.exceptions.RequestException):
+    """Raised when a streamed event isn't the JSON object the endpoint should send."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            # Half-open: let a single probe through once the cool-down is over
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class InferenceClient:
+    """Keep-alive HTTP client for the Hugging Face inference endpoints.
+
+    One pooled ``requests.Session`` and one circuit breaker is kept per
+    endpoint URL. Sessions are created lazily so each gunicorn worker gets
+    its own connection pool after fork.
+    """
+
+    def __init__(self, headers, pool_size=10, connect_timeout=3.05, read_timeout=30.0,
+                 max_retries=2, backoff=0.5, backoff_max=4.0,
+                 failure_threshold=5, reset_timeout=30.0):
+        self.headers = headers
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._sessions = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, headers):
+        return cls(
+            headers,
+            pool_size=config['INFERENCE_POOL_SIZE'],
+            connect_timeout=config['INFERENCE_CONNECT_TIMEOUT'],
+            read_timeout=config['INFERENCE_READ_TIMEOUT'],
+            max_retries=config['INFERENCE_MAX_RETRIES'],
+            backoff=config['INFERENCE_BACKOFF'],
+            backoff_max=config['INFERENCE_BACKOFF_MAX'],
+            failure_threshold=config['INFERENCE_BREAKER_THRESHOLD'],
+            reset_timeout=config['INFERENCE_BREAKER_RESET'],
+        )
+
+    def _endpoint(self, url):
+        with self._lock:
+            session = self._sessions.get(url)
+            if session is None:
+                session = requests.Session()
+                session.headers.update(self.headers)
+                # Retries are handled below so they can honour the breaker and jitter
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[url] = session
+                self._breakers[url] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return session, self._breakers[url]
+
+    def _sleep_before_retry(self, attempt, response):
+        delay = min(self.backoff_max, self.backoff * (2 ** attempt))
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = min(self.backoff_max, max(delay, float(retry_after)))
+        # Full jitter so workers that failed together don't retry together
+        time.sleep(random.uniform(0, delay))
+
+    def post(self, url, payload):
+        session, breaker = self._endpoint(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {url}")
+
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = session.post(url, json=payload, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                breaker.record_failure()
+                raise
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                self._sleep_before_retry(attempt, response)
+                attempt += 1
+                continue
+            if response.status_code in RETRY_STATUSES or response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            response.raise_for_status()
+            return response.json()
+
+    def generate(self, url, prompt):
+        return self.post(url, {"inputs": prompt})[0]['generated_text']
+
+    def generate_batch(self, url, prompts):
+        # The text2text pipeline returns one dict per input, or one list of dicts per input
+        results = self.post(url, {"inputs": prompts})
+        return [(r[0] if isinstance(r, list) else r)['generated_text'] for r in results]
+
+    def stream(self, url, prompt):
+        """Yield generated text pieces from an endpoint that streams tokens as
+        server-sent events (text-generation-inference style)."""
+        session, breaker = self._endpoint(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {url}")
+        try:
+            response = session.post(url, json={"inputs": prompt, "stream": True}, timeout=self.timeout, stream=True)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            breaker.record_failure()
+            raise
+        with response:
+            if response.status_code in RETRY_STATUSES or response.status_code >= 500:
+                breaker.record_failure()
+            response.raise_for_status()
+            breaker.record_success()
+            if not response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                # Endpoint ignored "stream"; hand back the whole answer at once
+                yield response.json()[0]['generated_text']
+                return
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                try:
+                    event = json.loads(line[len('data:'):])
+                except ValueError as e:
+                    raise StreamDecodeError(f"Malformed event from {url}: {line[:200]!r}") from e
+                if not isinstance(event, dict):
+                    raise StreamDecodeError(f"Malformed event from {url}: {line[:200]!r}")
+                token = event.get('token') or {}
+                if token.get('text') and not token.get('special'):
+                    yield token['text']
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._breakers.clear()
@@ -0,0 +1,258 @@
+"""SQLite-backed job queue for chat generations, worked by threads in each app process.
+
+``send_message`` commits the user message, calls ``enqueue`` and returns the
+job id; the client polls ``/jobs/<id>`` until the AI message is there. Every
+gunicorn worker runs a small pool of threads per tier that claim jobs from
+the shared table, so no broker is needed:
+
+* at most ``concurrency[tier]`` prompts of a tier are generated at once on
+  the host, however many processes are polling;
+* jobs for the same normalized prompt and tier are generated once and the
+  answer delivered to each of them;
+* jobs left ``running`` by a process that died (or that have run longer
+  than ``stale_after``) are put back in the queue, up to ``max_attempts``;
+* finished jobs are deleted ``retention`` seconds after they finish.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from answer_cache import cache_key
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+COLUMNS = ('id', 'tier', 'prompt_key', 'user_input', 'user_id', 'conversation_id', 'user_message_id', 'status',
+           'message_id', 'owner', 'attempts', 'created_at', 'started_at', 'finished_at', 'error')
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """``generate(user_input, tier)`` runs once per distinct prompt; ``deliver(job, result)``
+    runs for every job sharing it and returns the id of the saved AI message."""
+
+    def __init__(self, path, generate, deliver, concurrency=None, poll_interval=0.2, stale_after=300.0,
+                 max_attempts=3, sweep_interval=30.0, retention=3600.0):
+        self.path = path
+        self.generate = generate
+        self.deliver = deliver
+        self.concurrency = concurrency or {'normal': 2, 'upgraded': 2}
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.sweep_interval = sweep_interval
+        self.retention = retention
+        self.hostname = socket.gethostname()
+        self.generated = 0
+        self.deduplicated = 0
+        self.recovered = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._wake = {}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, tier TEXT NOT NULL, prompt_key TEXT NOT NULL,"
+                " user_input TEXT NOT NULL, conversation_id INTEGER NOT NULL, user_message_id INTEGER,"
+                " status TEXT NOT NULL, message_id INTEGER, owner TEXT, attempts INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL, started_at REAL, finished_at REAL, error TEXT, user_id INTEGER)"
+            )
+            if 'user_id' not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                try:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN user_id INTEGER")
+                except sqlite3.OperationalError:
+                    pass  # another worker added it first
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status_tier ON jobs (status, tier, id)")
+
+    @classmethod
+    def from_config(cls, config, default_path, generate, deliver):
+        return cls(
+            config['JOB_QUEUE_PATH'] or default_path,
+            generate,
+            deliver,
+            concurrency={'normal': config['JOB_CONCURRENCY_NORMAL'], 'upgraded': config['JOB_CONCURRENCY_UPGRADED']},
+            poll_interval=config['JOB_POLL_INTERVAL_MS'] / 1000,
+            stale_after=config['JOB_STALE_SECONDS'],
+            max_attempts=config['JOB_MAX_ATTEMPTS'],
+            retention=config['JOB_RETENTION_SECONDS'],
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            # Autocommit; claims open their own BEGIN IMMEDIATE so two processes can't take the same job
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @property
+    def owner(self):
+        return f"{self.hostname}:{os.getpid()}"
+
+    def start(self):
+        """Start this process's worker threads (once per process, so it is safe after a fork)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._wake = {tier: threading.Event() for tier in self.concurrency}
+            for tier, count in self.concurrency.items():
+                for i in range(count):
+                    threading.Thread(target=self._work, args=(tier,), daemon=True,
+                                     name=f"job-worker-{tier}-{i}").start()
+            threading.Thread(target=self._sweep_loop, daemon=True, name="job-sweeper").start()
+
+    def enqueue(self, user_input, tier, conversation_id, user_message_id=None, user_id=None):
+        self.start()
+        cursor = self._connect().execute(
+            "INSERT INTO jobs (tier, prompt_key, user_input, user_id, conversation_id, user_message_id, status,"
+            " created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (tier, cache_key(user_input, tier), user_input, user_id, conversation_id, user_message_id, QUEUED,
+             time.time()))
+        self._wake[tier].set()
+        return cursor.lastrowid
+
+    def get(self, job_id, wait=0.0):
+        """The job as a dict (None if unknown); with ``wait``, block up to that many seconds for it to finish."""
+        self.start()
+        deadline = time.monotonic() + wait
+        while True:
+            row = self._connect().execute(
+                f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            job = dict(zip(COLUMNS, row)) if row else None
+            if job is None or job['status'] in (DONE, FAILED) or time.monotonic() >= deadline:
+                return job
+            time.sleep(self.poll_interval)
+
+    def _claim(self, tier, prompt_key=None):
+        """Mark every queued job of one prompt as ours and return them.
+
+        Without ``prompt_key``, takes the oldest queued prompt whose twin isn't
+        already running, if the tier is under its concurrency limit.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if prompt_key is None:
+                running = conn.execute("SELECT COUNT(DISTINCT prompt_key) FROM jobs WHERE status = ? AND tier = ?",
+                                       (RUNNING, tier)).fetchone()[0]
+                if running >= self.concurrency[tier]:
+                    conn.execute("ROLLBACK")
+                    return []
+                row = conn.execute(
+                    "SELECT prompt_key FROM jobs WHERE status = ? AND tier = ? AND prompt_key NOT IN"
+                    " (SELECT prompt_key FROM jobs WHERE status = ? AND tier = ?) ORDER BY id LIMIT 1",
+                    (QUEUED, tier, RUNNING, tier)).fetchone()
+                if row is None:
+                    conn.execute("ROLLBACK")
+                    return []
+                prompt_key = row[0]
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE status = ? AND tier = ? AND prompt_key = ? ORDER BY id",
+                (QUEUED, tier, prompt_key)).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status = ?, owner = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                [(RUNNING, self.owner, time.time(), row[0]) for row in rows])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def _finish(self, job_id, status, message_id=None, error=None):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, message_id = ?, error = ?, finished_at = ? WHERE id = ? AND owner = ?",
+            (status, message_id, error, time.time(), job_id, self.owner))
+
+    def _run(self, jobs):
+        first = jobs[0]
+        try:
+            result = self.generate(first['user_input'], first['tier'])
+        except Exception as e:
+            print(f"Job {first['id']} failed: {e}")
+            for job in jobs:
+                self._finish(job['id'], FAILED, error=str(e))
+            return
+        with self._lock:
+            self.generated += 1
+        while jobs:
+            for job in jobs:
+                try:
+                    self._finish(job['id'], DONE, message_id=self.deliver(job, result))
+                except Exception as e:
+                    print(f"Job {job['id']} could not be delivered: {e}")
+                    self._finish(job['id'], FAILED, error=str(e))
+            # Twins queued while we were generating get the same answer
+            jobs = self._claim(first['tier'], first['prompt_key'])
+            with self._lock:
+                self.deduplicated += len(jobs)
+
+    def _work(self, tier):
+        while True:
+            try:
+                jobs = self._claim(tier)
+            except sqlite3.Error as e:
+                print(f"Job queue error: {e}")
+                jobs = []
+            if not jobs:
+                # Local enqueues wake us at once; jobs from other processes are found by polling
+                self._wake[tier].wait(self.poll_interval)
+                self._wake[tier].clear()
+                continue
+            with self._lock:
+                self.deduplicated += len(jobs) - 1
+            self._run(jobs)
+
+    def sweep(self):
+        """Requeue (or fail, after ``max_attempts``) running jobs whose owner is gone or that are stale,
+        and delete jobs that finished more than ``retention`` seconds ago."""
+        conn = self._connect()
+        rows = conn.execute("SELECT id, owner, started_at, attempts FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+        now = time.time()
+        orphaned = []
+        for job_id, owner, started_at, attempts in rows:
+            host, _, pid = (owner or '').rpartition(':')
+            dead = host == self.hostname and pid.isdigit() and not pid_alive(int(pid))
+            if dead or now - (started_at or now) > self.stale_after:
+                orphaned.append((job_id, owner, attempts))
+        for job_id, owner, attempts in orphaned:
+            status = FAILED if attempts >= self.max_attempts else QUEUED
+            # Only if the owner hasn't finished it in the meantime
+            conn.execute("UPDATE jobs SET status = ?, owner = NULL, error = ?, finished_at = ?"
+                         " WHERE id = ? AND status = ? AND owner = ?",
+                         (status, f"orphaned by {owner}", now if status == FAILED else None, job_id, RUNNING, owner))
+        if orphaned:
+            with self._lock:
+                self.recovered += len(orphaned)
+            print(f"Job queue: recovered {len(orphaned)} orphaned job(s)")
+        # Clients stop polling a job once it's finished
+        conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                     (DONE, FAILED, now - self.retention))
+        return len(orphaned)
+
+    def _sweep_loop(self):
+        while True:
+            try:
+                self.sweep()
+            except sqlite3.Error as e:
+                print(f"Job queue sweep failed: {e}")
+            time.sleep(self.sweep_interval)
+
+    def stats(self):
+        counts = dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {'generated': self.generated, 'deduplicated': self.deduplicated, 'recovered': self.recovered,
+                **{status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)}}
@@ -0,0 +1,181 @@
+"""In-process T5 inference for the fine-tuned agriculture model.
+
+Serves ``generate`` from the model saved by ``python_files/agribot.py``
+(``model.save_pretrained(...)`` / ``tokenizer.save_pretrained(...)``) instead
+of the remote Hugging Face endpoint. The model is loaded once per worker on
+first use (or by ``warm_up`` at boot).
+
+An ONNX Runtime variant, optionally int8-quantized, can be produced with::
+
+    python local_engine.py export fine_tuned_t5_agriculture_exp2 fine_tuned_t5_agriculture_onnx \\
+        --tokenizer fine_tuned_t5_agriculture_exp --quantize
+
+and served by setting ``LOCAL_MODEL_FORMAT=onnx``. The export needs
+``optimum[onnxruntime]`` and ``torch``; the default TF path needs neither.
+"""
+import argparse
+import os
+import threading
+
+
+class LocalEngineError(RuntimeError):
+    pass
+
+
+class LocalT5Engine:
+    def __init__(self, model_path, tokenizer_path=None, model_format='tf', max_input_length=128,
+                 max_new_tokens=128, num_beams=None, num_threads=0, early_stopping=True):
+        self.model_path = model_path
+        self.tokenizer_path = tokenizer_path or model_path
+        self.model_format = model_format
+        self.max_input_length = max_input_length
+        self.max_new_tokens = max_new_tokens
+        # Greedy for the normal tier, beam search (as in the notebook) for upgraded users
+        self.num_beams = num_beams or {'normal': 1, 'upgraded': 4}
+        self.num_threads = num_threads
+        self.early_stopping = early_stopping  # beam search stops once num_beams finished candidates exist
+        self.model = None
+        self.tokenizer = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config['LOCAL_MODEL_PATH'],
+            tokenizer_path=config['LOCAL_TOKENIZER_PATH'],
+            model_format=config['LOCAL_MODEL_FORMAT'],
+            max_input_length=config['LOCAL_MAX_INPUT_LENGTH'],
+            max_new_tokens=config['LOCAL_MAX_NEW_TOKENS'],
+            num_beams={'normal': config['LOCAL_NUM_BEAMS_NORMAL'], 'upgraded': config['LOCAL_NUM_BEAMS_UPGRADED']},
+            num_threads=config['LOCAL_NUM_THREADS'],
+        )
+
+    def load(self):
+        if self.model is not None:
+            return
+        with self._lock:
+            if self.model is not None:
+                return
+            try:
+                if self.model_format == 'onnx':
+                    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+                    from transformers import AutoTokenizer
+                    model = ORTModelForSeq2SeqLM.from_pretrained(self.model_path)
+                    tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_path)
+                else:
+                    import tensorflow as tf
+                    from transformers import T5Tokenizer, TFT5ForConditionalGeneration
+                    if self.num_threads:
+                        tf.config.threading.set_intra_op_parallelism_threads(self.num_threads)
+                        tf.config.threading.set_inter_op_parallelism_threads(1)
+                    model = TFT5ForConditionalGeneration.from_pretrained(self.model_path)
+                    tokenizer = T5Tokenizer.from_pretrained(self.tokenizer_path)
+            except (OSError, ImportError, ValueError) as e:
+                raise LocalEngineError(f"Could not load local model from {self.model_path}: {e}") from e
+            self.tokenizer = tokenizer
+            self.model = model
+
+    def warm_up(self):
+        # First generate() traces the TF graph / allocates ORT buffers; pay for it before traffic arrives
+        for tier in self.num_beams:
+            self.generate_batch(["question: what is the best fertilizer for wheat context: agriculture </s>"], tier)
+
+    def generate(self, prompt, tier='normal'):
+        return self.generate_batch([prompt], tier)[0]
+
+    def generate_batch(self, prompts, tier='normal'):
+        self.load()
+        tensors = 'pt' if self.model_format == 'onnx' else 'tf'
+        # Pad only to the longest prompt in the batch, not to max_input_length
+        inputs = self.tokenizer(prompts, max_length=self.max_input_length, truncation=True,
+                                padding=True, return_tensors=tensors)
+        num_beams = self.num_beams.get(tier, 1)
+        try:
+            outputs = self.model.generate(
+                input_ids=inputs['input_ids'],
+                attention_mask=inputs['attention_mask'],
+                max_new_tokens=self.max_new_tokens,
+                num_beams=num_beams,
+                early_stopping=self.early_stopping and num_beams > 1,
+            )
+        except Exception as e:
+            raise LocalEngineError(f"Local generation failed: {e}") from e
+        return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+    def stream(self, prompt, tier='normal'):
+        """Yield decoded text pieces as tokens are produced.
+
+        Only greedy decoding can be streamed; tiers configured for beam search
+        (and the ONNX model) produce the whole answer as a single piece.
+        """
+        if self.model_format == 'onnx' or self.num_beams.get(tier, 1) > 1:
+            yield self.generate(prompt, tier)
+            return
+        self.load()
+        import tensorflow as tf
+
+        inputs = self.tokenizer([prompt], max_length=self.max_input_length, truncation=True, return_tensors='tf')
+        try:
+            encoder_outputs = self.model.get_encoder()(inputs['input_ids'], attention_mask=inputs['attention_mask'])
+            decoder_input_ids = tf.constant([[self.model.config.decoder_start_token_id]])
+            past_key_values = None
+            token_ids = []
+            emitted = ''
+            for _ in range(self.max_new_tokens):
+                # input_ids is required by Keras but unused once encoder_outputs is given
+                outputs = self.model(inputs['input_ids'], attention_mask=inputs['attention_mask'],
+                                     encoder_outputs=encoder_outputs, decoder_input_ids=decoder_input_ids,
+                                     past_key_values=past_key_values, use_cache=True)
+                next_id = int(tf.argmax(outputs.logits[0, -1]))
+                if next_id == self.model.config.eos_token_id:
+                    break
+                token_ids.append(next_id)
+                past_key_values = outputs.past_key_values
+                decoder_input_ids = tf.constant([[next_id]])
+                # Decode the whole prefix so sentencepiece word boundaries come out right
+                text = self.tokenizer.decode(token_ids, skip_special_tokens=True)
+                if text.startswith(emitted) and len(text) > len(emitted):
+                    yield text[len(emitted):]
+                    emitted = text
+        except Exception as e:
+            raise LocalEngineError(f"Local generation failed: {e}") from e
+
+
+def export_onnx(model_path, output_dir, tokenizer_path=None, quantize=False):
+    """Convert the saved TF checkpoint to ONNX (and optionally int8 weights)."""
+    import tempfile
+
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer, T5ForConditionalGeneration
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path or model_path)
+    with tempfile.TemporaryDirectory() as pt_dir:
+        # The ONNX exporter works from PyTorch weights; convert the TF checkpoint first
+        T5ForConditionalGeneration.from_pretrained(model_path, from_tf=True).save_pretrained(pt_dir)
+        model = ORTModelForSeq2SeqLM.from_pretrained(pt_dir, export=True)
+    model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+
+    if quantize:
+        qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        onnx_files = sorted(f for f in os.listdir(output_dir) if f.endswith('.onnx'))
+        for file_name in onnx_files:
+            ORTQuantizer.from_pretrained(output_dir, file_name=file_name).quantize(
+                save_dir=output_dir, quantization_config=qconfig)
+        # Swap the quantized graphs in under the names ORTModelForSeq2SeqLM looks for
+        for file_name in onnx_files:
+            os.replace(os.path.join(output_dir, file_name[:-5] + '_quantized.onnx'),
+                       os.path.join(output_dir, file_name))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export = subparsers.add_parser('export', help='export the TF checkpoint to ONNX')
+    export.add_argument('model_path')
+    export.add_argument('output_dir')
+    export.add_argument('--tokenizer')
+    export.add_argument('--quantize', action='store_true', help='dynamic int8 weight quantization')
+    args = parser.parse_args()
+    export_onnx(args.model_path, args.output_dir, args.tokenizer, args.quantize)
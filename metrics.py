@@ -0,0 +1,267 @@
+"""In-process metrics with a Prometheus text exposition.
+
+Counters and histograms are plain dicts keyed by label values behind a lock,
+so recording costs a few microseconds. Under gunicorn each worker has its
+own registry; set ``METRICS_DIR`` and every worker periodically writes a
+snapshot there, which ``/metrics`` merges so any worker can answer a scrape.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+
+from flask import g, request
+from sqlalchemy import event
+
+# Seconds; covers cached answers (~1 ms) through slow upstream generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+    @staticmethod
+    def merge(into, state):
+        for key, value in state:
+            key = tuple(key)
+            into[key] = into.get(key, 0) + value
+
+    def render(self, values):
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), list(state)] for key, state in self.values.items()]
+
+    @staticmethod
+    def merge(into, state):
+        for key, counts in state:
+            key = tuple(key)
+            current = into.get(key)
+            into[key] = counts if current is None else [a + b for a, b in zip(current, counts)]
+
+    def render(self, values):
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), state[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == '+Inf' else f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(state[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+class Metrics:
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._flushed_at = 0.0
+        self._flush_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(directory=config['METRICS_DIR'] or None, flush_interval=config['METRICS_FLUSH_INTERVAL'])
+
+    def counter(self, name, help_text, labels=()):
+        return self._metrics.setdefault(name, Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, help_text, labels, buckets))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def _snapshot_path(self):
+        return os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+
+    def flush(self):
+        path = self._snapshot_path()
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def maybe_flush(self):
+        # Called at the end of every request; cheap unless a snapshot is due
+        if not self.directory or time.monotonic() - self._flushed_at < self.flush_interval:
+            return
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._flushed_at = time.monotonic()
+            self.flush()
+        finally:
+            self._flush_lock.release()
+
+    def _collect(self):
+        if not self.directory:
+            snapshots = [self.snapshot()]
+        else:
+            # Our own numbers fresh, everyone else's from their last snapshot
+            self.flush()
+            snapshots = []
+            for file_name in os.listdir(self.directory):
+                if not (file_name.startswith('metrics-') and file_name.endswith('.json')):
+                    continue
+                try:
+                    with open(os.path.join(self.directory, file_name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        merged = {name: {} for name in self._metrics}
+        for snapshot in snapshots:
+            for name, state in snapshot.items():
+                if name in self._metrics:
+                    self._metrics[name].merge(merged[name], state)
+        return merged
+
+    def render(self):
+        merged = self._collect()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render(merged[name]))
+        return '\n'.join(lines) + '\n'
+
+
+def instrument(app, engine, metrics, log_requests=True):
+    """Record per-request latency and DB usage and emit one JSON log line per request.
+
+    The request ID comes from an incoming ``X-Request-ID`` header when present
+    and is echoed back on the response.
+    """
+    request_seconds = metrics.histogram(
+        'agribot_http_request_duration_seconds', 'Request latency by route.', ('route', 'method', 'status'))
+    db_queries = metrics.histogram(
+        'agribot_db_queries_per_request', 'SQL statements executed per request.', ('route',), COUNT_BUCKETS)
+    db_seconds = metrics.counter(
+        'agribot_db_query_seconds_total', 'Time spent in SQL statements.', ('route',))
+    errors = metrics.counter('agribot_errors_total', 'Errors by kind.', ('kind',))
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = g.get('request_stats') if g else None
+        if stats is not None:
+            stats['db_queries'] += 1
+            stats['db_seconds'] += time.perf_counter() - context._metrics_started
+
+    def finish(stats, route, method, path, status, exc=None):
+        duration = time.perf_counter() - stats['started']
+        request_seconds.observe(duration, route=route, method=method, status=status)
+        db_queries.observe(stats['db_queries'], route=route)
+        db_seconds.inc(stats['db_seconds'], route=route)
+        if exc is not None:
+            errors.inc(kind='unhandled_exception')
+        elif status >= 500:
+            errors.inc(kind='http_5xx')
+        metrics.maybe_flush()
+        if log_requests:
+            print(json.dumps({
+                'event': 'request', 'request_id': stats['request_id'], 'method': method, 'path': path,
+                'route': route, 'status': status, 'duration_ms': round(duration * 1000, 2),
+                'db_queries': stats['db_queries'], 'db_ms': round(stats['db_seconds'] * 1000, 2),
+                'upstream_ms': round(stats['upstream_seconds'] * 1000, 2),
+            }))
+
+    @app.before_request
+    def start_request_metrics():
+        request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_stats = {'request_id': request_id, 'started': time.perf_counter(),
+                           'db_queries': 0, 'db_seconds': 0.0, 'upstream_seconds': 0.0}
+
+    @app.after_request
+    def tag_response(response):
+        stats = g.get('request_stats')
+        if stats is None:
+            return response
+        response.headers['X-Request-ID'] = stats['request_id']
+        stats['status'] = response.status_code
+        if response.is_streamed:
+            # Record once the whole body has been sent; the view's generator keeps adding to stats until then
+            stats['deferred'] = True
+            args = (stats, request.url_rule.rule if request.url_rule else 'unmatched', request.method,
+                    request.path, response.status_code)
+            response.call_on_close(lambda: finish(*args))
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        stats = g.get('request_stats')
+        if stats is None or stats.get('deferred'):
+            return
+        g.pop('request_stats')
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = 500 if exc is not None else stats.get('status', 500)
+        finish(stats, route, request.method, request.path, status, exc)
+
+
+def record_upstream(seconds):
+    """Add inference time to the current request's log line."""
+    stats = g.get('request_stats') if g else None
+    if stats is not None:
+        stats['upstream_seconds'] += seconds
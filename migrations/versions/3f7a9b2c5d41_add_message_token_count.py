@@ -0,0 +1,33 @@
+"""add message.token_count for the token-budgeted context window
+
+Revision ID: 3f7a9b2c5d41
+Revises: 8c1d2e4f6a10
+Create Date: 2026-10-18 19:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f7a9b2c5d41'
+down_revision = '8c1d2e4f6a10'
+branch_labels = None
+depends_on = None
+
+
+def _existing_columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    # Nullable: existing messages are counted when a context first reads them
+    if 'token_count' not in _existing_columns('message'):
+        with op.batch_alter_table('message') as batch_op:
+            batch_op.add_column(sa.Column('token_count', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    if 'token_count' in _existing_columns('message'):
+        with op.batch_alter_table('message') as batch_op:
+            batch_op.drop_column('token_count')
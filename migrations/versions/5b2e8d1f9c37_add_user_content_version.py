@@ -0,0 +1,32 @@
+"""add user.content_version for the render cache and page ETags
+
+Revision ID: 5b2e8d1f9c37
+Revises: 3f7a9b2c5d41
+Create Date: 2026-10-18 20:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2e8d1f9c37'
+down_revision = '3f7a9b2c5d41'
+branch_labels = None
+depends_on = None
+
+
+def _existing_columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    if 'content_version' not in _existing_columns('user'):
+        with op.batch_alter_table('user') as batch_op:
+            batch_op.add_column(sa.Column('content_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    if 'content_version' in _existing_columns('user'):
+        with op.batch_alter_table('user') as batch_op:
+            batch_op.drop_column('content_version')
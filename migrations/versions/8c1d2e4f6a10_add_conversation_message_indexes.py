@@ -0,0 +1,38 @@
+"""add composite indexes for the conversation and message hot paths
+
+Revision ID: 8c1d2e4f6a10
+Revises: 
+Create Date: 2026-10-18 18:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1d2e4f6a10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_message_conversation_id_timestamp', 'message', ['conversation_id', 'timestamp']),
+    ('ix_conversation_user_id_created_at', 'conversation', ['user_id', 'created_at']),
+]
+
+
+def _existing_indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # app.py runs db.create_all() on import, so fresh databases already have these
+    for name, table, columns in INDEXES:
+        if name not in _existing_indexes(table):
+            op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for name, table, _ in INDEXES:
+        if name in _existing_indexes(table):
+            op.drop_index(name, table_name=table)
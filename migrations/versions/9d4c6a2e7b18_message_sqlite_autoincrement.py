@@ -0,0 +1,35 @@
+"""make message ids AUTOINCREMENT on SQLite so deleted ids are never reused
+
+Revision ID: 9d4c6a2e7b18
+Revises: 5b2e8d1f9c37
+Create Date: 2026-10-18 22:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4c6a2e7b18'
+down_revision = '5b2e8d1f9c37'
+branch_labels = None
+depends_on = None
+
+
+def _autoincrement(table):
+    sql = op.get_bind().execute(sa.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                {'name': table}).scalar()
+    return 'AUTOINCREMENT' in (sql or '').upper()
+
+
+def upgrade():
+    # Other databases don't reuse ids; on SQLite the table has to be rebuilt to add the keyword
+    if op.get_bind().dialect.name == 'sqlite' and not _autoincrement('message'):
+        with op.batch_alter_table('message', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite' and _autoincrement('message'):
+        with op.batch_alter_table('message', recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+            pass
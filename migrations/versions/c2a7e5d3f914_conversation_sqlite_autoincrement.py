@@ -0,0 +1,35 @@
+"""make conversation ids AUTOINCREMENT on SQLite so a queued job can't land in a reused id
+
+Revision ID: c2a7e5d3f914
+Revises: 9d4c6a2e7b18
+Create Date: 2026-10-18 23:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2a7e5d3f914'
+down_revision = '9d4c6a2e7b18'
+branch_labels = None
+depends_on = None
+
+
+def _autoincrement(table):
+    sql = op.get_bind().execute(sa.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                {'name': table}).scalar()
+    return 'AUTOINCREMENT' in (sql or '').upper()
+
+
+def upgrade():
+    # Other databases don't reuse ids; on SQLite the table has to be rebuilt to add the keyword
+    if op.get_bind().dialect.name == 'sqlite' and not _autoincrement('conversation'):
+        with op.batch_alter_table('conversation', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite' and _autoincrement('conversation'):
+        with op.batch_alter_table('conversation', recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+            pass
@@ -0,0 +1,35 @@
+import hashlib
+import re
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_question(question):
+    """Lower-case, collapse whitespace and drop trailing punctuation so that
+    trivially different spellings of a question share cache entries."""
+    question = _WHITESPACE.sub(' ', (question or '').strip().lower())
+    return question.rstrip(' ?!.')
+
+
+def question_key(question):
+    """64-bit hash of the normalised question; the semantic cache keeps it to check a match still answers it."""
+    digest = hashlib.blake2b(normalize_question(question).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+
+def build_prompt(question, history=None):
+    # Matches the format used when fine-tuning the T5 model; earlier turns go after the domain context
+    if history:
+        return f"question: {question} context: agriculture {history} </s>"
+    return f"question: {question} context: agriculture </s>"
+
+
+def clean_answer(generated_text):
+    # Extract only the answer part
+    if "answer:" in generated_text:
+        generated_text = generated_text.split("answer:", 1)[1].strip()
+
+    # Add a full stop if the response doesn't end with punctuation
+    if generated_text and not generated_text.strip().endswith(('.', '!', '?')):
+        generated_text += '.'
+    return generated_text
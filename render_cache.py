@@ -0,0 +1,68 @@
+"""Rendered chat pages per user, invalidated by the user's content version.
+
+``User.content_version`` is bumped in the same transaction as every change
+to the user's conversations or messages. A page's ETag hashes that version,
+the profile fields the page shows, the URL and the template, so an unchanged
+page is answered with 304 (the browser still has it) or from this worker's
+LRU of rendered HTML without touching the conversation and message tables.
+"""
+import hashlib
+import os
+import threading
+
+from answer_cache import MemoryBackend
+
+# What the chat page shows about the user besides their conversations
+PROFILE_FIELDS = ('first_name', 'last_name', 'profile_picture', 'is_upgraded', 'show_welcome_popup')
+
+
+def files_fingerprint(paths):
+    """Hash of the given files' contents, so a deploy with a changed template changes every ETag."""
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+class RenderCache:
+
+    def __init__(self, salt='', ttl=3600, max_bytes=16 * 1024 * 1024, max_entries=2000):
+        self.salt = salt
+        self.backend = MemoryBackend(ttl=ttl, max_bytes=max_bytes, max_entries=max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, salt=''):
+        return cls(salt, ttl=config['RENDER_CACHE_TTL'], max_bytes=config['RENDER_CACHE_MAX_BYTES'],
+                   max_entries=config['RENDER_CACHE_MAX_ENTRIES'])
+
+    def etag(self, user, page):
+        profile = '\x00'.join(str(getattr(user, field)) for field in PROFILE_FIELDS)
+        key = f"{self.salt}\x00{user.id}\x00{user.content_version}\x00{profile}\x00{page}"
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, etag):
+        html = self.backend.get(etag)
+        with self._lock:
+            if html is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return html
+
+    def set(self, etag, html):
+        self.backend.set(etag, html)
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'bytes': self.backend.size}
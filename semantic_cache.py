@@ -0,0 +1,260 @@
+import atexit
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are not coordinated between processes
+    fcntl = None
+
+from prompts import normalize_question, question_key
+
+TIERS = {'normal': 0, 'upgraded': 1}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be can do does for from how i in is it me my of on or should "
+    "the to what when which why with you your".split()
+)
+
+
+def _grow(array, capacity):
+    grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class HashingVectorizer:
+    """Signed feature hashing of content words and their bigrams, L2-normalised.
+
+    Bigrams carry half the weight of single words so that reordered
+    paraphrases ("which fertilizer is best for wheat") still score high.
+    """
+
+    def __init__(self, dim=1024, bigram_weight=0.5):
+        self.dim = dim
+        self.bigram_weight = bigram_weight
+
+    def features(self, text):
+        words = [w for w in _TOKEN.findall(normalize_question(text)) if w not in _STOPWORDS]
+        return [(w, 1.0) for w in words] + [(f"{a} {b}", self.bigram_weight) for a, b in zip(words, words[1:])]
+
+    def transform(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self.features(text):
+            h = zlib.crc32(feature.encode('utf-8'))
+            vector[h % self.dim] += weight if h & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Nearest-neighbour lookup over questions that already have an AI answer.
+
+    Rows are (question vector, AI ``Message`` id, tier, question key). Rows loaded from disk
+    stay memory-mapped; rows added by this worker go to an in-memory buffer and
+    are merged into the ``.npy`` files on save. Past ``max_entries`` the oldest
+    rows are dropped on save.
+    """
+
+    def __init__(self, path, dim=1024, threshold=0.85, max_entries=50000, flush_every=32):
+        self.path = path
+        self.vectorizer = HashingVectorizer(dim)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()  # guards the arrays; held only for copies and swaps
+        self._save_lock = threading.Lock()  # one save at a time per worker
+        self._saving = False
+        self._removed = set()  # message ids deleted since the last save
+        self._reset_buffer()
+        self._load()
+        atexit.register(self.save)
+
+    @classmethod
+    def from_config(cls, config, default_path):
+        return cls(
+            config['SEMANTIC_CACHE_PATH'] or default_path,
+            dim=config['SEMANTIC_CACHE_DIM'],
+            threshold=config['SEMANTIC_CACHE_THRESHOLD'],
+            max_entries=config['SEMANTIC_CACHE_MAX_ENTRIES'],
+        )
+
+    def _files(self):
+        return (self.path + '.vectors.npy', self.path + '.ids.npy', self.path + '.tiers.npy',
+                self.path + '.keys.npy')
+
+    def _reset_buffer(self):
+        self._buf_vectors = np.empty((0, self.vectorizer.dim), dtype=np.float32)
+        self._buf_ids = np.empty(0, dtype=np.int64)
+        self._buf_tiers = np.empty(0, dtype=np.int8)
+        self._buf_keys = np.empty(0, dtype=np.int64)
+        self._buf_len = 0
+
+    def _load(self):
+        self._vectors, self._ids, self._tiers, self._keys = self._read()
+
+    def _read(self):
+        # An index written before question keys were stored reads as empty, so app.py rebuilds it from the DB
+        vectors_file, *column_files = self._files()
+        if all(os.path.exists(f) for f in self._files()):
+            vectors = np.load(vectors_file, mmap_mode='r')
+            if vectors.shape[1] == self.vectorizer.dim:
+                # A crash between the renames in save() can leave lengths out of step
+                columns = [np.load(f, mmap_mode='r') for f in column_files]
+                n = min(len(vectors), *(len(column) for column in columns))
+                return (vectors[:n], *(np.array(column[:n]) for column in columns))
+        return (np.empty((0, self.vectorizer.dim), dtype=np.float32), np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.int8), np.empty(0, dtype=np.int64))
+
+    @property
+    def size(self):
+        return len(self._ids) + self._buf_len
+
+    def add(self, question, message_id, tier):
+        vector = self.vectorizer.transform(question)
+        if not vector.any():
+            return
+        with self._lock:
+            if self._buf_len == len(self._buf_ids):
+                capacity = max(64, 2 * self._buf_len)
+                self._buf_vectors = _grow(self._buf_vectors, capacity)
+                self._buf_ids = _grow(self._buf_ids, capacity)
+                self._buf_tiers = _grow(self._buf_tiers, capacity)
+                self._buf_keys = _grow(self._buf_keys, capacity)
+            self._buf_vectors[self._buf_len] = vector
+            self._buf_ids[self._buf_len] = message_id
+            self._buf_tiers[self._buf_len] = TIERS[tier]
+            self._buf_keys[self._buf_len] = question_key(question)
+            self._buf_len += 1
+            flush = self._buf_len >= self.flush_every and not self._saving
+            if flush:
+                self._saving = True
+        if flush:
+            self._save_in_background()
+
+    def discard(self, message_ids):
+        """Stop returning these AI messages, e.g. because their conversation was deleted."""
+        message_ids = set(message_ids)
+        if not message_ids:
+            return
+        with self._lock:
+            self._removed.update(message_ids)
+            flush = len(self._removed) >= self.flush_every and not self._saving
+            if flush:
+                self._saving = True
+        if flush:
+            self._save_in_background()
+
+    def _save_in_background(self):
+        # Rewriting the index takes a while at tens of thousands of rows; don't make the request wait
+        threading.Thread(target=self.save, daemon=True, name='semantic-cache-save').start()
+
+    def rebuild(self, pairs):
+        """Index ``(question, ai_message_id, tier)`` tuples, e.g. from the DB."""
+        for question, message_id, tier in pairs:
+            self.add(question, message_id, tier)
+        self.save()
+
+    def lookup(self, question, tier):
+        """Return ``(ai_message_id, question_key)`` of the closest stored question, or None.
+
+        Message ids are only a pointer: the caller checks the message still
+        answers a question with that key before serving it.
+        """
+        vector = self.vectorizer.transform(question)
+        best, best_score = None, self.threshold
+        if vector.any():
+            code = TIERS[tier]
+            with self._lock:
+                parts = [(self._vectors, self._ids, self._tiers, self._keys),
+                         (self._buf_vectors[:self._buf_len], self._buf_ids[:self._buf_len],
+                          self._buf_tiers[:self._buf_len], self._buf_keys[:self._buf_len])]
+                removed = np.fromiter(self._removed, dtype=np.int64, count=len(self._removed))
+            for vectors, ids, tiers, keys in parts:
+                if not len(ids):
+                    continue
+                scores = vectors @ vector
+                scores[tiers != code] = -1.0
+                if len(removed):
+                    scores[np.isin(ids, removed)] = -1.0
+                i = int(scores.argmax())
+                if scores[i] >= best_score:
+                    best, best_score = (int(ids[i]), int(keys[i])), float(scores[i])
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return best
+
+    def save(self):
+        with self._save_lock:
+            try:
+                self._save()
+            finally:
+                self._saving = False
+
+    def _save(self):
+        with self._lock:
+            pending = self._buf_len
+            removed = np.fromiter(self._removed, dtype=np.int64, count=len(self._removed))
+            if not pending and not len(removed):
+                return
+            # Copies, so lookups and adds carry on while the files are written
+            buf_vectors = self._buf_vectors[:pending].copy()
+            buf_ids = self._buf_ids[:pending].copy()
+            buf_tiers = self._buf_tiers[:pending].copy()
+            buf_keys = self._buf_keys[:pending].copy()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + '.lock', 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Another worker may have saved since we loaded; merge with what is on disk
+            vectors, ids, tiers, keys = self._read()
+            kept = ~np.isin(ids, removed)
+            new = ~np.isin(buf_ids, ids) & ~np.isin(buf_ids, removed)
+            # Rows are appended in answer order, so the oldest come first
+            evicted = max(0, int(kept.sum()) + int(new.sum()) - self.max_entries)
+            arrays = (
+                np.concatenate([vectors[kept], buf_vectors[new]])[evicted:],
+                np.concatenate([ids[kept], buf_ids[new]])[evicted:],
+                np.concatenate([tiers[kept], buf_tiers[new]])[evicted:],
+                np.concatenate([keys[kept], buf_keys[new]])[evicted:],
+            )
+            for filename, array in zip(self._files(), arrays):
+                tmp = filename + '.tmp'
+                with open(tmp, 'wb') as f:
+                    np.save(f, array)
+                os.replace(tmp, filename)
+            saved = self._read()
+        if evicted:
+            self.evicted += evicted
+            print(f"Semantic cache full ({self.max_entries} entries): dropped the {evicted} oldest")
+        with self._lock:
+            self._vectors, self._ids, self._tiers, self._keys = saved
+            # Message ids aren't reused, so ids that are gone from the files can't come back
+            self._removed.difference_update(removed.tolist())
+            # Keep rows added while the files were being written, in new arrays: a lookup may still be
+            # scoring slices of the old ones
+            self._buf_vectors = self._buf_vectors[pending:].copy()
+            self._buf_ids = self._buf_ids[pending:].copy()
+            self._buf_tiers = self._buf_tiers[pending:].copy()
+            self._buf_keys = self._buf_keys[pending:].copy()
+            self._buf_len -= pending
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': self.size,
+            'evicted': self.evicted,
+        }
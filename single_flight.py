@@ -0,0 +1,194 @@
+"""Single-flight generation: identical in-flight questions share one upstream call.
+
+Requests for the same normalized prompt and tier (``cache_key``) that arrive
+while a generation for it is running wait for that generation instead of
+starting their own. Threads of a worker share a ``Future``; workers on the
+host share a row in a small SQLite table, where the leading worker publishes
+the raw generation (or its error) for the others to pick up. An error only
+goes to the requests that were waiting when it happened; the last of them
+deletes the row, and later requests start a new flight.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from answer_cache import cache_key
+from job_queue import pid_alive
+
+
+class SingleFlightError(RuntimeError):
+    """The generation this request waited on failed in another worker."""
+
+
+class SingleFlight:
+
+    def __init__(self, path, timeout=60.0, poll_interval=0.05, linger=5.0):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.linger = linger
+        self.hostname = socket.gethostname()
+        self.leaders = 0
+        self.shared_thread = 0
+        self.shared_process = 0
+        self._flights = {}  # key -> Future of this process's generation
+        self._pid = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS flights ("
+            " key TEXT PRIMARY KEY, owner TEXT NOT NULL, started_at REAL NOT NULL,"
+            " result TEXT, error TEXT, finished_at REAL, waiters INTEGER NOT NULL DEFAULT 0)"
+        )
+        if 'waiters' not in {row[1] for row in conn.execute("PRAGMA table_info(flights)")}:
+            try:
+                conn.execute("ALTER TABLE flights ADD COLUMN waiters INTEGER NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                pass  # another worker added it first
+
+    @classmethod
+    def from_config(cls, config, default_path):
+        return cls(config['COALESCE_PATH'] or default_path, timeout=config['COALESCE_TIMEOUT'],
+                   poll_interval=config['COALESCE_POLL_INTERVAL_MS'] / 1000)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            # Autocommit: every statement here is a single atomic claim, publish or read
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @property
+    def owner(self):
+        return f"{self.hostname}:{os.getpid()}"
+
+    def run(self, question, tier, generate):
+        """``(generate(), shared)``; ``shared`` is None if this call generated, else 'thread' or 'process'."""
+        key = cache_key(question, tier)
+        with self._lock:
+            # Futures inherited across a fork would never be resolved in the child
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._flights = {}
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = Future()
+        if not leader:
+            result = future.result()
+            with self._lock:
+                self.shared_thread += 1
+            return result, 'thread'
+        try:
+            try:
+                result, shared = self._across_workers(key, generate)
+            except sqlite3.Error as e:
+                print(f"Single-flight table unavailable, generating alone: {e}")
+                result, shared = generate(), None
+            future.set_result(result)
+            return result, shared
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def _across_workers(self, key, generate):
+        conn = self._connect()
+        deadline = time.monotonic() + self.timeout
+        joined = False  # counted in the row's waiters
+        while True:
+            now = time.time()
+            conn.execute("DELETE FROM flights WHERE finished_at < ?", (now - self.linger,))
+            claimed = conn.execute("INSERT OR IGNORE INTO flights (key, owner, started_at) VALUES (?, ?, ?)",
+                                   (key, self.owner, now)).rowcount
+            if claimed:
+                return self._lead(key, generate), None
+            row = conn.execute("SELECT owner, started_at, result, error, finished_at FROM flights WHERE key = ?",
+                               (key,)).fetchone()
+            if row is None:
+                continue  # finished and cleaned up between the two statements
+            owner, started_at, result, error, finished_at = row
+            if finished_at is not None:
+                if error is None:
+                    if joined:
+                        self._leave(conn, key)
+                    with self._lock:
+                        self.shared_process += 1
+                    return result, 'process'
+                if joined:
+                    # The last waiter to read the error removes it
+                    self._leave(conn, key)
+                    conn.execute("DELETE FROM flights WHERE key = ? AND finished_at = ? AND error IS NOT NULL"
+                                 " AND waiters = 0", (key, finished_at))
+                    raise SingleFlightError(error)
+                # Failed before this request arrived; it gets a generation of its own
+                restarted = conn.execute(
+                    "UPDATE flights SET owner = ?, started_at = ?, result = NULL, error = NULL, finished_at = NULL,"
+                    " waiters = 0 WHERE key = ? AND finished_at = ? AND error IS NOT NULL",
+                    (self.owner, now, key, finished_at)).rowcount
+                if restarted:
+                    return self._lead(key, generate), None
+                continue
+            if not joined:
+                joined = bool(conn.execute(
+                    "UPDATE flights SET waiters = waiters + 1 WHERE key = ? AND finished_at IS NULL", (key,)).rowcount)
+                if not joined:
+                    continue  # finished between the two statements
+            if self._abandoned(owner, started_at) or time.monotonic() > deadline:
+                # Take the flight over, unless someone else just did
+                taken = conn.execute(
+                    "UPDATE flights SET owner = ?, started_at = ?, waiters = MAX(waiters - 1, 0)"
+                    " WHERE key = ? AND owner = ? AND finished_at IS NULL",
+                    (self.owner, now, key, owner)).rowcount
+                if taken:
+                    return self._lead(key, generate), None
+            time.sleep(self.poll_interval)
+
+    def _leave(self, conn, key):
+        conn.execute("UPDATE flights SET waiters = MAX(waiters - 1, 0) WHERE key = ?", (key,))
+
+    def _abandoned(self, owner, started_at):
+        host, _, pid = owner.rpartition(':')
+        dead = host == self.hostname and pid.isdigit() and not pid_alive(int(pid))
+        return dead or time.time() - started_at > self.timeout
+
+    def _lead(self, key, generate):
+        with self._lock:
+            self.leaders += 1
+        try:
+            result = generate()
+        except Exception as e:
+            self._publish(key, error=f"{type(e).__name__}: {e}")
+            raise
+        self._publish(key, result=result)
+        return result
+
+    def _publish(self, key, result=None, error=None):
+        try:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE flights SET result = ?, error = ?, finished_at = ? WHERE key = ? AND owner = ?",
+                (result, error, time.time(), key, self.owner))
+            if error is not None:
+                # Nobody was waiting on it; don't fail the next request with it
+                conn.execute("DELETE FROM flights WHERE key = ? AND owner = ? AND error IS NOT NULL AND waiters = 0",
+                             (key, self.owner))
+        except sqlite3.Error as e:
+            # Waiting workers take the flight over once it times out
+            print(f"Could not publish single-flight result: {e}")
+
+    def stats(self):
+        saved = self.shared_thread + self.shared_process
+        return {'generated': self.leaders, 'shared_thread': self.shared_thread,
+                'shared_process': self.shared_process, 'upstream_calls_saved': saved}
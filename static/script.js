@@ -6,16 +6,90 @@ function scrollToBottom() {
     }
 }
 
-// Simulate AI typing effect
-async function simulateTyping(messageElement, text) {
-    let i = 0;
-    messageElement.innerHTML = ''; // Clear initial text
-    
-    while (i < text.length) {
-        messageElement.innerHTML += text.charAt(i);
-        i++;
-        scrollToBottom();
-        await new Promise(resolve => setTimeout(resolve, 50)); // Typing speed
+// Read a text/event-stream response body, calling onEvent(event, data) per frame
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let eventName = 'message';
+            let data = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    eventName = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            if (data) {
+                onEvent(eventName, JSON.parse(data));
+            }
+        }
+    }
+}
+
+// Poll a queued job (job-queue mode) until its answer has been saved; long-polls when the page allows it
+async function waitForJob(jobId, wait) {
+    const url = wait ? `/jobs/${jobId}?wait=${wait}` : `/jobs/${jobId}`;
+    while (true) {
+        const response = await fetch(url);
+        if (!response.ok) {
+            throw new Error(`Job ${jobId} lookup failed: ${response.status}`);
+        }
+        const data = await response.json();
+        if (data.status === 'done' || data.status === 'failed') {
+            return data;
+        }
+        await new Promise(resolve => setTimeout(resolve, 700));
+    }
+}
+
+// Load the page of messages older than the oldest one shown, keeping the scroll position
+async function loadOlderMessages(chatMessages) {
+    if (chatMessages.dataset.hasMore !== 'true' || chatMessages.dataset.loading === 'true') return;
+    chatMessages.dataset.loading = 'true';
+
+    // The server pages on (timestamp, id) of this cursor message
+    const params = new URLSearchParams({ before_id: chatMessages.dataset.oldestId });
+    try {
+        const response = await fetch(`${chatMessages.dataset.messagesUrl}?${params}`);
+        if (!response.ok) {
+            console.error('Failed to load older messages:', response.status, response.statusText);
+            return;
+        }
+        const data = await response.json();
+
+        const previousHeight = chatMessages.scrollHeight;
+        const fragment = document.createDocumentFragment();
+        data.messages.forEach(message => {
+            const messageDiv = document.createElement('div');
+            messageDiv.classList.add('message', message.sender);
+            const paragraph = document.createElement('p');
+            paragraph.textContent = message.content;
+            messageDiv.appendChild(paragraph);
+            fragment.appendChild(messageDiv);
+        });
+        chatMessages.insertBefore(fragment, chatMessages.firstChild);
+        chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+
+        if (data.messages.length) {
+            chatMessages.dataset.oldestId = data.messages[0].id;
+        }
+        chatMessages.dataset.hasMore = data.has_more ? 'true' : 'false';
+    } catch (error) {
+        console.error('Error loading older messages:', error);
+    } finally {
+        chatMessages.dataset.loading = 'false';
     }
 }
 
@@ -23,6 +97,16 @@ async function simulateTyping(messageElement, text) {
 document.addEventListener('DOMContentLoaded', () => {
     scrollToBottom(); // Scroll to bottom on page load
 
+    // Fetch older history when the user scrolls to the top of the conversation
+    const chatMessages = document.getElementById('chat-messages');
+    if (chatMessages) {
+        chatMessages.addEventListener('scroll', () => {
+            if (chatMessages.scrollTop < 50) {
+                loadOlderMessages(chatMessages);
+            }
+        });
+    }
+
     const messageForm = document.getElementById('message-form');
     if (messageForm) {
         messageForm.addEventListener('submit', async (event) => {
@@ -58,29 +142,49 @@ document.addEventListener('DOMContentLoaded', () => {
             formData.append('conversation_id', conversationId);
 
             try {
-                const response = await fetch(messageForm.action, {
+                const response = await fetch(messageForm.dataset.streamUrl || messageForm.action, {
                     method: 'POST',
                     body: formData
                 });
 
                 if (response.ok) {
-                    const data = await response.json();
-                    const aiResponseContent = data.ai_response;
-
-                    // Hide typing indicator
-                    if (typingIndicator) {
-                        typingIndicator.style.display = 'none';
-                    }
-
-                    // 4. Add AI response to UI with typing simulation
+                    // 4. Render the AI response as tokens arrive
                     const aiMessageDiv = document.createElement('div');
                     aiMessageDiv.classList.add('message', 'ai');
                     const aiMessageParagraph = document.createElement('p');
                     aiMessageDiv.appendChild(aiMessageParagraph);
-                    chatMessagesContainer.appendChild(aiMessageDiv);
-                    scrollToBottom();
 
-                    await simulateTyping(aiMessageParagraph, aiResponseContent);
+                    if (!response.headers.get('Content-Type').startsWith('text/event-stream')) {
+                        // JSON answer, or a job id to poll for it
+                        let data = await response.json();
+                        if (data.job_id) {
+                            data = await waitForJob(data.job_id, messageForm.dataset.jobWait);
+                        }
+                        if (typingIndicator) {
+                            typingIndicator.style.display = 'none';
+                        }
+                        aiMessageParagraph.textContent = data.ai_response;
+                        chatMessagesContainer.appendChild(aiMessageDiv);
+                        scrollToBottom();
+                        return;
+                    }
+
+                    await readEventStream(response, (eventName, data) => {
+                        if (!aiMessageDiv.isConnected) {
+                            // Hide typing indicator once the first chunk arrives
+                            if (typingIndicator) {
+                                typingIndicator.style.display = 'none';
+                            }
+                            chatMessagesContainer.appendChild(aiMessageDiv);
+                        }
+                        if (eventName === 'token') {
+                            aiMessageParagraph.textContent += data.text;
+                        } else if (eventName === 'done') {
+                            // Final, post-processed answer as saved on the server
+                            aiMessageParagraph.textContent = data.ai_response;
+                        }
+                        scrollToBottom();
+                    });
 
                 } else {
                     console.error('Failed to send message:', response.status, response.statusText);
@@ -0,0 +1,41 @@
+import os
+
+from sqlalchemy import event
+
+
+def database_uri(instance_path):
+    """DATABASE_URL if set (e.g. a managed Postgres), otherwise instance/site.db."""
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        return 'sqlite:///' + os.path.join(instance_path, 'site.db')
+    # Render/Heroku hand out postgres:// URLs, which SQLAlchemy 1.4+ no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def sqlite_pragmas(config):
+    return {
+        'journal_mode': config['SQLITE_JOURNAL_MODE'],
+        'synchronous': config['SQLITE_SYNCHRONOUS'],
+        'busy_timeout': config['SQLITE_BUSY_TIMEOUT_MS'],
+        'mmap_size': config['SQLITE_MMAP_SIZE'],
+    }
+
+
+def configure_engine(engine, pragmas):
+    """Apply connection PRAGMAs to every new SQLite connection of ``engine``.
+
+    WAL lets readers run alongside the single writer, synchronous=NORMAL is
+    durable under WAL except on power loss, and busy_timeout makes writers
+    wait for the lock instead of failing with "database is locked".
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
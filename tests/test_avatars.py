@@ -0,0 +1,50 @@
+"""AvatarPipeline: thumbnails, and uploads refused before they are decoded.
+
+    python -m pytest tests/test_avatars.py
+"""
+import io
+import os
+import sys
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.datastructures import FileStorage
+
+from avatars import AvatarError, AvatarPipeline
+
+
+def upload(size, image_format='PNG'):
+    data = io.BytesIO()
+    Image.new('RGB', size, (40, 120, 40)).save(data, image_format)
+    data.seek(0)
+    return FileStorage(data, filename=f'photo.{image_format.lower()}')
+
+
+@pytest.fixture
+def pictures(tmp_path):
+    saved = []
+    pipeline = AvatarPipeline(str(tmp_path), lambda user_id, base: saved.append((user_id, base)), max_pixels=300 * 300)
+    return pipeline, saved
+
+
+def test_upload_becomes_thumbnails(pictures):
+    pipeline, saved = pictures
+    base = pipeline.submit(upload((300, 200), 'JPEG'), 7).result()
+    assert saved == [(7, base)]
+    assert sorted(os.listdir(pipeline.folder)) == sorted(f"{base}_{size}.{extension}" for size in ('sm', 'md')
+                                                         for extension in ('jpg', 'webp'))
+    with Image.open(os.path.join(pipeline.folder, f"{base}_sm.webp")) as thumbnail:
+        assert thumbnail.size == (80, 80)
+
+
+def test_too_many_pixels_is_refused_without_touching_pillow_limit(pictures):
+    pipeline, saved = pictures
+    limit = Image.MAX_IMAGE_PIXELS
+    with pytest.raises(AvatarError):
+        pipeline.submit(upload((400, 300)), 7)
+    assert os.listdir(pipeline.folder) == [] and saved == []
+    assert Image.MAX_IMAGE_PIXELS == limit
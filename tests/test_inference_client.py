@@ -0,0 +1,178 @@
+"""InferenceClient against a local stub of the Hugging Face endpoint: pooling, retries, the circuit breaker
+and streamed answers.
+
+    python -m pytest tests/test_inference_client.py
+"""
+import importlib
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_client import CircuitOpenError, InferenceClient, StreamDecodeError
+
+ANSWER = "answer: Use NPK fertilizer"
+PROMPT = "question: best fertilizer for wheat context: agriculture </s>"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    statuses = []  # status of each next response, then 200
+    events = None  # server-sent event lines to answer with instead of JSON
+    connections = 0
+    requests = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StubHandler.lock:
+            StubHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with StubHandler.lock:
+            StubHandler.requests += 1
+            status = StubHandler.statuses.pop(0) if StubHandler.statuses else 200
+        if StubHandler.events is not None:
+            body = ''.join(f"{line}\n\n" for line in StubHandler.events).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        body = json.dumps([{"generated_text": ANSWER}] if status == 200 else {"error": "Model is loading"}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def reset_stub():
+    StubHandler.statuses, StubHandler.events, StubHandler.connections, StubHandler.requests = [], None, 0, 0
+
+
+def client(**options):
+    # No backoff sleeps in tests
+    return InferenceClient({"Content-Type": "application/json"}, backoff=0, **options)
+
+
+def test_connection_is_reused(url):
+    inference = client()
+    for _ in range(5):
+        assert inference.generate(url, PROMPT) == ANSWER
+    assert StubHandler.requests == 5
+    assert StubHandler.connections == 1
+    inference.close()
+
+
+def test_429_and_503_are_retried(url):
+    StubHandler.statuses = [429, 503]
+    assert client(max_retries=2).generate(url, PROMPT) == ANSWER
+    assert StubHandler.requests == 3
+
+
+def test_retries_stop_at_max_retries(url):
+    StubHandler.statuses = [503] * 10
+    with pytest.raises(requests.exceptions.HTTPError):
+        client(max_retries=2).generate(url, PROMPT)
+    assert StubHandler.requests == 3
+
+
+def test_client_errors_are_not_retried(url):
+    StubHandler.statuses = [400]
+    with pytest.raises(requests.exceptions.HTTPError):
+        client(max_retries=2).generate(url, PROMPT)
+    assert StubHandler.requests == 1
+
+
+def test_breaker_opens_after_threshold(url):
+    StubHandler.statuses = [503] * 10
+    inference = client(max_retries=0, failure_threshold=3, reset_timeout=60)
+    for _ in range(3):
+        with pytest.raises(requests.exceptions.HTTPError):
+            inference.generate(url, PROMPT)
+    # Open: fails fast without reaching the endpoint
+    with pytest.raises(CircuitOpenError):
+        inference.generate(url, PROMPT)
+    assert StubHandler.requests == 3
+
+
+def test_breaker_half_open_probe_closes_it(url):
+    StubHandler.statuses = [503]
+    inference = client(max_retries=0, failure_threshold=1, reset_timeout=0)
+    with pytest.raises(requests.exceptions.HTTPError):
+        inference.generate(url, PROMPT)
+    # reset_timeout elapsed: one probe goes through and its success closes the breaker
+    assert inference.generate(url, PROMPT) == ANSWER
+    assert inference.generate(url, PROMPT) == ANSWER
+
+
+def token(text, special=False):
+    return 'data:' + json.dumps({"token": {"text": text, "special": special}})
+
+
+def test_stream_yields_tokens(url):
+    StubHandler.events = [token("Use"), token(" NPK"), token("</s>", special=True)]
+    assert list(client().stream(url, PROMPT)) == ["Use", " NPK"]
+
+
+def test_stream_malformed_event_is_a_request_error(url):
+    StubHandler.events = [token("Use"), 'data: {"token": ']
+    pieces = client().stream(url, PROMPT)
+    assert next(pieces) == "Use"
+    # A RequestException, so app.py answers TROUBLE_CONNECTING instead of failing the response
+    with pytest.raises(requests.exceptions.RequestException) as raised:
+        next(pieces)
+    assert isinstance(raised.value, StreamDecodeError)
+
+
+def test_send_message_falls_back_when_breaker_opens(url, tmp_path, monkeypatch):
+    pytest.importorskip('flask_sqlalchemy')
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('HF_API_URL_NORMAL', url)
+    monkeypatch.setenv('INFERENCE_BACKEND', 'remote')
+    monkeypatch.setenv('REQUEST_LOG', 'false')
+    sys.modules.pop('app', None)
+    agribot = importlib.import_module('app')
+    from werkzeug.security import generate_password_hash
+
+    with agribot.app.app_context():
+        user = agribot.User(email='test@example.com', password=generate_password_hash('pw'), first_name='Test',
+                            last_name='User', show_welcome_popup=False)
+        agribot.db.session.add(user)
+        agribot.db.session.flush()
+        conversation = agribot.Conversation(user_id=user.id, title='New Chat')
+        agribot.db.session.add(conversation)
+        agribot.db.session.commit()
+        conversation_id = conversation.id
+    monkeypatch.setattr(agribot, 'inference_client', client(max_retries=1, failure_threshold=1, reset_timeout=60))
+    web = agribot.app.test_client()
+    web.post('/login', data={'email': 'test@example.com', 'password': 'pw'})
+
+    StubHandler.statuses = [503] * 10
+    for question, requests_made in (('how do I grow maize', 2), ('how do I grow beans', 2)):
+        response = web.post('/send_message', data={'user_input': question, 'conversation_id': conversation_id})
+        assert response.get_json()['ai_response'] == agribot.TROUBLE_CONNECTING
+        # The first question is retried once and opens the breaker; the second never reaches the endpoint
+        assert StubHandler.requests == requests_made
+    sys.modules.pop('app', None)
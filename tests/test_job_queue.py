@@ -0,0 +1,65 @@
+"""JobQueue housekeeping and /jobs/<id> ownership.
+
+    python -m pytest tests/test_job_queue.py
+"""
+import importlib
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import DONE, FAILED, QUEUED, JobQueue
+
+
+def test_sweep_deletes_finished_jobs_after_retention(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    queue = JobQueue(path, generate=None, deliver=None, retention=60)
+    conn = sqlite3.connect(path, isolation_level=None)
+    now = time.time()
+    for status, finished_at in ((DONE, now - 120), (FAILED, now - 120), (DONE, now - 10), (QUEUED, None)):
+        conn.execute("INSERT INTO jobs (tier, prompt_key, user_input, conversation_id, status, created_at, finished_at)"
+                     " VALUES ('normal', 'k', 'q', 1, ?, ?, ?)", (status, now - 300, finished_at))
+    queue.sweep()
+    assert sorted(row[0] for row in conn.execute("SELECT status FROM jobs")) == [DONE, QUEUED]
+
+
+def test_job_status_only_answers_its_user(tmp_path, monkeypatch):
+    pytest.importorskip('flask_sqlalchemy')
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('JOB_QUEUE_ENABLED', 'true')
+    monkeypatch.setenv('JOB_QUEUE_PATH', str(tmp_path / 'jobs.db'))
+    monkeypatch.setenv('REQUEST_LOG', 'false')
+    sys.modules.pop('app', None)
+    agribot = importlib.import_module('app')
+    monkeypatch.setattr(agribot, 'generate_reply', lambda user_input, tier, history=(): ("Use NPK fertilizer", True))
+    from werkzeug.security import generate_password_hash
+
+    clients = {}
+    with agribot.app.app_context():
+        for name in ('owner', 'other'):
+            user = agribot.User(email=f'{name}@example.com', password=generate_password_hash('pw'), first_name=name,
+                                last_name='User', show_welcome_popup=False)
+            agribot.db.session.add(user)
+            agribot.db.session.flush()
+            agribot.db.session.add(agribot.Conversation(user_id=user.id, title='New Chat'))
+        agribot.db.session.commit()
+        conversation_id = agribot.Conversation.query.filter_by(user_id=1).one().id
+    for name in ('owner', 'other'):
+        clients[name] = agribot.app.test_client()
+        clients[name].post('/login', data={'email': f'{name}@example.com', 'password': 'pw'})
+
+    response = clients['owner'].post('/send_message', data={'user_input': 'best fertilizer for wheat',
+                                                            'conversation_id': conversation_id})
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    assert clients['other'].get(f'/jobs/{job_id}').status_code == 404
+    deadline = time.monotonic() + 10
+    while (status := clients['owner'].get(f'/jobs/{job_id}').get_json())['status'] not in (DONE, FAILED):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert status['ai_response'] == "Use NPK fertilizer."
+    sys.modules.pop('app', None)
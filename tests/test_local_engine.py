@@ -0,0 +1,91 @@
+"""LocalT5Engine against a tiny random-weight T5, built offline.
+
+The tokenizer is a small sentencepiece model trained on the spot, so no
+network access or fine-tuned checkpoint is needed:
+
+    python -m pytest tests/test_local_engine.py
+"""
+import os
+import sys
+
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+spm = pytest.importorskip('sentencepiece')
+transformers = pytest.importorskip('transformers')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_engine import LocalEngineError, LocalT5Engine
+from prompts import build_prompt
+
+SENTENCES = [
+    "how do I control fall armyworm on maize",
+    "what is the best fertilizer for wheat",
+    "when should I plant beans in the long rains",
+    "which crops grow well in sandy soil",
+    "how much water does a tomato plant need",
+    "apply compost before planting to improve the soil",
+    "question: context: agriculture",
+] * 20
+QUESTIONS = ["what is the best fertilizer for wheat", "how do I control fall armyworm on maize in the long rains"]
+
+
+@pytest.fixture(scope='module')
+def model_dir(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('tiny_t5')
+    # T5's special ids: pad 0, eos 1, unk 2, no bos
+    spm.SentencePieceTrainer.train(sentence_iterator=iter(SENTENCES), model_prefix=str(workdir / 'spiece'),
+                                   vocab_size=64, hard_vocab_limit=False, pad_id=0, eos_id=1, unk_id=2, bos_id=-1,
+                                   model_type='unigram')
+    tokenizer = transformers.T5Tokenizer(str(workdir / 'spiece.model'), extra_ids=0, legacy=True)
+    config = transformers.T5Config(vocab_size=len(tokenizer), d_model=32, d_ff=64, d_kv=8, num_heads=4, num_layers=2,
+                                   num_decoder_layers=2, decoder_start_token_id=0, pad_token_id=0, eos_token_id=1)
+    tf.random.set_seed(0)
+    model = transformers.TFT5ForConditionalGeneration(config)
+    model(model.dummy_inputs)
+    model.save_pretrained(str(workdir))
+    tokenizer.save_pretrained(str(workdir))
+    return str(workdir)
+
+
+@pytest.fixture(scope='module')
+def engine(model_dir):
+    return LocalT5Engine(model_dir, max_input_length=32, max_new_tokens=8, num_beams={'normal': 1, 'upgraded': 2})
+
+
+def test_generate_matches_batch(engine):
+    prompts = [build_prompt(question) for question in QUESTIONS]
+    batch = engine.generate_batch(prompts, 'normal')
+    assert len(batch) == len(prompts)
+    assert all(isinstance(answer, str) for answer in batch)
+    # Padding to the longest prompt must not change the shorter prompt's answer
+    assert [engine.generate(prompt, 'normal') for prompt in prompts] == batch
+
+
+def test_stream_equals_generate(engine):
+    for question in QUESTIONS:
+        prompt = build_prompt(question)
+        assert ''.join(engine.stream(prompt, 'normal')) == engine.generate(prompt, 'normal')
+
+
+def test_tiers_use_their_beam_setting(engine, monkeypatch):
+    seen = []
+    generate = engine.model.generate
+
+    def spy(**kwargs):
+        seen.append((kwargs['num_beams'], kwargs['early_stopping']))
+        return generate(**kwargs)
+
+    monkeypatch.setattr(engine.model, 'generate', spy)
+    prompt = build_prompt(QUESTIONS[0])
+    engine.generate(prompt, 'normal')
+    engine.generate(prompt, 'upgraded')
+    # Beam tiers aren't streamed token by token; they produce the full answer as one piece
+    assert list(engine.stream(prompt, 'upgraded')) == [engine.generate(prompt, 'upgraded')]
+    assert seen[:2] == [(1, False), (2, True)]
+
+
+def test_missing_model_raises(tmp_path):
+    with pytest.raises(LocalEngineError):
+        LocalT5Engine(str(tmp_path / 'missing')).generate('question: maize context: agriculture')
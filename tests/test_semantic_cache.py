@@ -0,0 +1,111 @@
+"""SemanticCache on its own (paraphrase lookups, saving alongside lookups, eviction when full) and in
+cached_answer, which must not serve answers from deleted conversations.
+
+    python -m pytest tests/test_semantic_cache.py
+"""
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import SemanticCache
+
+
+def matched_id(cache, question, tier='normal'):
+    match = cache.lookup(question, tier)
+    return match and match[0]
+
+
+def test_paraphrase_is_found_after_save(tmp_path):
+    cache = SemanticCache(str(tmp_path / 'index'), flush_every=1000)
+    cache.add("what is the best fertilizer for wheat", 7, 'normal')
+    assert matched_id(cache, "which fertilizer is best for wheat") == 7
+    assert matched_id(cache, "which fertilizer is best for wheat", 'upgraded') is None
+    cache.save()
+    reloaded = SemanticCache(str(tmp_path / 'index'))
+    assert matched_id(reloaded, "best fertilizer for wheat") == 7
+
+
+def test_rows_added_during_save_are_kept(tmp_path):
+    cache = SemanticCache(str(tmp_path / 'index'), flush_every=1000)
+    cache.add("how do I control fall armyworm on maize", 1, 'normal')
+    read = cache._read
+
+    def add_while_saving():
+        # Called with the files locked, after save() has taken its copy of the buffer
+        cache._read = read
+        cache.add("when should I plant beans in the long rains", 2, 'normal')
+        return read()
+
+    cache._read = add_while_saving
+    cache.save()
+    assert cache.size == 2
+    assert matched_id(cache, "when to plant beans in the long rains") == 2
+    cache.save()
+    assert list(SemanticCache(str(tmp_path / 'index'))._ids) == [1, 2]
+
+
+def test_full_index_drops_oldest(tmp_path):
+    cache = SemanticCache(str(tmp_path / 'index'), max_entries=2, flush_every=1000)
+    questions = ["how do I control fall armyworm on maize", "what is the best fertilizer for wheat",
+                 "how much water does a tomato plant need"]
+    for message_id, question in enumerate(questions, 1):
+        cache.add(question, message_id, 'normal')
+    cache.save()
+    assert list(cache._ids) == [2, 3]
+    assert cache.stats()['evicted'] == 1
+    assert matched_id(cache, questions[0]) is None
+    assert matched_id(cache, questions[2]) == 3
+
+
+def test_deleted_answers_are_not_served(tmp_path, monkeypatch):
+    # A's conversation is deleted, then B gets an answer; C's paraphrase of A's question must not get B's answer
+    pytest.importorskip('flask_sqlalchemy')
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('SEMANTIC_CACHE_ENABLED', 'true')
+    monkeypatch.setenv('SEMANTIC_CACHE_PATH', str(tmp_path / 'index'))
+    monkeypatch.setenv('REQUEST_LOG', 'false')
+    sys.modules.pop('app', None)
+    agribot = importlib.import_module('app')
+    monkeypatch.setattr(agribot, 'generate_reply', lambda user_input, tier, history=(): (f"Model on {user_input}", True))
+    from werkzeug.security import generate_password_hash
+
+    def login(name):
+        with agribot.app.app_context():
+            user = agribot.User(email=f'{name}@example.com', password=generate_password_hash('pw'), first_name=name,
+                                last_name='User', show_welcome_popup=False)
+            agribot.db.session.add(user)
+            agribot.db.session.flush()
+            conversation = agribot.Conversation(user_id=user.id, title='New Chat')
+            agribot.db.session.add(conversation)
+            agribot.db.session.commit()
+            conversation_id = conversation.id
+        web = agribot.app.test_client()
+        web.post('/login', data={'email': f'{name}@example.com', 'password': 'pw'})
+        return lambda question: web.post('/send_message', data={'user_input': question,
+                                                                 'conversation_id': conversation_id}).get_json()
+
+    ask_a, ask_b, ask_c = login('a'), login('b'), login('c')
+    assert ask_a("what is the best fertilizer for wheat")['ai_response'] == \
+        "Model on what is the best fertilizer for wheat."
+    login_a = agribot.app.test_client()
+    login_a.post('/login', data={'email': 'a@example.com', 'password': 'pw'})
+    login_a.post('/chat/clear_all')
+    ask_b("how much water does a tomato plant need")
+    assert ask_c("which fertilizer is best for wheat")['ai_response'] == "Model on which fertilizer is best for wheat."
+
+    # Another worker's index still has a row for a question whose answer was deleted, and its id now belongs
+    # to someone else's answer: the row must not be served
+    with agribot.app.app_context():
+        answer_b = agribot.Message.query.filter_by(sender='ai',
+                                                   content="Model on how much water does a tomato plant need.").one()
+        stale = SemanticCache(str(tmp_path / 'other'))
+        stale.add("how do I control fall armyworm on maize", answer_b.id, 'normal')
+        monkeypatch.setattr(agribot, 'semantic_cache', stale)
+        assert agribot.cached_answer("how to control fall armyworm on maize", 'normal') == (None, None)
+        stale.add("how much water does a tomato plant need", answer_b.id, 'normal')
+        assert agribot.cached_answer("How much water does my tomato plant need", 'normal')[1] == 'semantic'
+    sys.modules.pop('app', None)
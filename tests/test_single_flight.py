@@ -0,0 +1,85 @@
+"""SingleFlight across workers, played by two instances sharing one SQLite file: a failed flight's error only
+reaches the requests that were waiting on it.
+
+    python -m pytest tests/test_single_flight.py
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_cache import cache_key
+from single_flight import SingleFlight, SingleFlightError
+
+QUESTION = "how do I control fall armyworm on maize"
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'flights.db')
+
+
+def rows(path):
+    return sqlite3.connect(path).execute("SELECT error, waiters FROM flights").fetchall()
+
+
+def fail():
+    raise ValueError("endpoint returned 503")
+
+
+def test_waiter_gets_error_and_clears_it(path):
+    leader, waiter = SingleFlight(path, poll_interval=0.01), SingleFlight(path, poll_interval=0.01)
+    release = threading.Event()
+
+    def slow_failure():
+        release.wait(5)
+        fail()
+
+    outcomes = []
+
+    def lead():
+        with pytest.raises(ValueError):
+            leader.run(QUESTION, 'normal', slow_failure)
+
+    def wait_on_flight():
+        try:
+            outcomes.append(waiter.run(QUESTION, 'normal', lambda: "generated by the waiter"))
+        except SingleFlightError as e:
+            outcomes.append(e)
+
+    leading = threading.Thread(target=lead)
+    leading.start()
+    while not rows(path):
+        time.sleep(0.01)
+    waiting = threading.Thread(target=wait_on_flight)
+    waiting.start()
+    while rows(path)[0][1] == 0:
+        time.sleep(0.01)
+    release.set()
+    leading.join(5)
+    waiting.join(5)
+    assert len(outcomes) == 1 and isinstance(outcomes[0], SingleFlightError)
+    assert rows(path) == []
+
+
+def test_failure_without_waiters_leaves_nothing_behind(path):
+    first, second = SingleFlight(path), SingleFlight(path)
+    with pytest.raises(ValueError):
+        first.run(QUESTION, 'normal', fail)
+    assert rows(path) == []
+    assert second.run(QUESTION, 'normal', lambda: "answer") == ("answer", None)
+
+
+def test_late_request_leads_its_own_flight(path):
+    flights = SingleFlight(path)
+    # An error row whose waiter hasn't read it yet
+    sqlite3.connect(path, isolation_level=None).execute(
+        "INSERT INTO flights (key, owner, started_at, error, finished_at, waiters) VALUES (?, 'other:1', ?, ?, ?, 1)",
+        (cache_key(QUESTION, 'normal'), time.time(), "ValueError: 503", time.time()))
+    assert flights.run(QUESTION, 'normal', lambda: "answer") == ("answer", None)
+    assert flights.stats()['generated'] == 1
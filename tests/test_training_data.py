@@ -0,0 +1,25 @@
+"""Batching helpers in training/data.py.
+
+    python -m pytest tests/test_training_data.py
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from training.data import inference_batches, length_bucketed_batches
+
+
+def test_length_bucketed_batches_cover_every_index():
+    lengths = np.array([5, 1, 9, 3, 7, 2, 8])
+    batches = length_bucketed_batches(lengths, batch_size=3, rng=np.random.default_rng(0), pool_batches=2)
+    assert sorted(np.concatenate(batches).tolist()) == list(range(len(lengths)))
+    assert all(len(batch) <= 3 for batch in batches)
+
+
+def test_inference_batches_of_no_prompts_is_empty():
+    # Nothing to tokenize, so the tokenizer is never called
+    assert list(inference_batches(None, [])) == []
+    assert list(inference_batches(None, iter([]))) == []
@@ -0,0 +1,28 @@
+"""Prediction-cache keys in training/evaluation.py.
+
+    python -m pytest tests/test_training_evaluation.py
+"""
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('transformers')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from training.evaluation import model_fingerprint
+
+
+def test_fingerprint_changes_when_weights_are_rewritten(tmp_path):
+    (tmp_path / 'tf_model.h5').write_bytes(b'weights')
+    before = model_fingerprint(str(tmp_path))
+    (tmp_path / 'tf_model.h5').write_bytes(b'new weights')
+    assert model_fingerprint(str(tmp_path)) != before
+
+
+def test_missing_model_dir_exits_naming_it(tmp_path):
+    missing = str(tmp_path / 'output' / 'model')
+    with pytest.raises(SystemExit) as raised:
+        model_fingerprint(missing)
+    assert missing in str(raised.value)
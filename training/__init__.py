@@ -0,0 +1 @@
+"""Fine-tuning pipeline for the agriculture T5 model; see ``python -m training --help``."""
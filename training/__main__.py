@@ -0,0 +1,90 @@
+"""Fine-tune and evaluate the agriculture T5 model.
+
+    python -m training train --config experiments/agribot.json --set epochs=3 --set grad_accum_steps=4
+    python -m training evaluate --config experiments/agribot.json
+    python -m training prepare --config experiments/agribot.json
+    python -m training sweep experiments/agribot.json experiments/agribot2.json --parallel 2
+
+Settings come from training/config.py DEFAULTS, then the JSON experiment
+file, then ``--set key=value`` overrides. Re-running ``train`` with the same
+output_dir resumes from its latest checkpoint (``--set resume=false`` to start over).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from training.config import load_config
+
+
+def prepare(config):
+    from transformers import T5Tokenizer
+
+    from training.train import load_splits
+
+    tokenizer = T5Tokenizer.from_pretrained(config['tokenizer_name'])
+    _, arrays = load_splits(config, tokenizer)
+    for name, split_arrays in zip(('train', 'validation'), arrays):
+        print(f"{name}: {len(split_arrays['input_ids'])} examples, "
+              f"{sum(a.nbytes for a in split_arrays.values()) / 1e6:.1f} MB")
+
+
+def sweep(config_paths, overrides, parallel):
+    """Run one ``train`` process per experiment file, ``parallel`` at a time."""
+    queue = list(config_paths)
+    running = {}
+    failed = []
+    while queue or running:
+        while queue and len(running) < parallel:
+            path = queue.pop(0)
+            output_dir = load_config(path, overrides)['output_dir']
+            os.makedirs(output_dir, exist_ok=True)
+            log = open(os.path.join(output_dir, 'train.log'), 'a')
+            command = [sys.executable, '-m', 'training', 'train', '--config', path]
+            for override in overrides:
+                command += ['--set', override]
+            running[path] = (subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT), log)
+            print(f"started {path} -> {output_dir}/train.log")
+        for path, (process, log) in list(running.items()):
+            if process.poll() is not None:
+                log.close()
+                del running[path]
+                print(f"finished {path} with exit code {process.returncode}")
+                if process.returncode:
+                    failed.append(path)
+        time.sleep(1)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m training', description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name in ('train', 'evaluate', 'prepare'):
+        command = subparsers.add_parser(name)
+        command.add_argument('--config', help='JSON experiment file')
+        command.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', dest='overrides')
+    sweep_command = subparsers.add_parser('sweep', help='train several experiment files in parallel processes')
+    sweep_command.add_argument('configs', nargs='+')
+    sweep_command.add_argument('--parallel', type=int, default=2)
+    sweep_command.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', dest='overrides')
+    args = parser.parse_args(argv)
+
+    if args.command == 'sweep':
+        return 1 if sweep(args.configs, args.overrides, args.parallel) else 0
+
+    config = load_config(args.config, args.overrides)
+    if args.command == 'prepare':
+        prepare(config)
+    elif args.command == 'train':
+        from training.train import train
+        train(config)
+    elif args.command == 'evaluate':
+        from training.evaluation import evaluate_model
+        print(json.dumps(evaluate_model(config), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
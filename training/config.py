@@ -0,0 +1,57 @@
+import json
+
+# Defaults reproduce python_files/agribot.py (the Nadam run); experiment files override them
+DEFAULTS = {
+    'model_name': 't5-base',
+    'tokenizer_name': None,  # defaults to model_name
+    'dataset': 'KisanVaani/agriculture-qa-english-only',
+    'test_size': 0.2,
+    'seed': 42,
+    'optimizer': 'nadam',  # adam, nadam or sgd
+    'learning_rate': 2e-5,
+    'epochs': 21,
+    'batch_size': 8,
+    'grad_accum_steps': 1,  # effective batch size is batch_size * grad_accum_steps
+    'max_input_length': 128,
+    'max_target_length': 128,
+    'bucketed': True,
+    'mixed_precision': None,  # None, 'mixed_float16' or 'mixed_bfloat16'
+    'cache_dir': '.token_cache',
+    'output_dir': 'runs/agribot',  # checkpoints and history.json
+    'model_output_dir': None,  # save_pretrained targets; default to output_dir/model and output_dir/tokenizer
+    'tokenizer_output_dir': None,
+    'checkpoint_every_steps': 500,
+    'keep_checkpoints': 2,
+    'resume': True,
+    'eval_samples': None,  # None scores the whole validation split; the notebooks used 50
+    'eval_batch_size': 32,
+    'num_beams': 4,
+    'metrics': ['bleu', 'rouge'],
+    'metric_workers': None,  # processes for metric scoring; defaults to the CPU count (at most 8)
+}
+
+
+def parse_value(text):
+    # --set values are JSON when they parse as JSON (numbers, true/false, null), strings otherwise
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def load_config(path=None, overrides=()):
+    """DEFAULTS, updated from a JSON experiment file and then ``key=value`` overrides."""
+    config = dict(DEFAULTS)
+    if path:
+        with open(path) as f:
+            config.update(json.load(f))
+    for override in overrides:
+        key, _, value = override.partition('=')
+        config[key.strip()] = parse_value(value)
+    unknown = sorted(set(config) - set(DEFAULTS))
+    if unknown:
+        raise ValueError(f"Unknown training config keys: {', '.join(unknown)}")
+    config['tokenizer_name'] = config['tokenizer_name'] or config['model_name']
+    if config['grad_accum_steps'] < 1:
+        raise ValueError("grad_accum_steps must be at least 1")
+    return config
@@ -0,0 +1,273 @@
+"""Tokenize the QA dataset once and feed training from memory-mapped arrays.
+
+``build_cache`` writes ``input_ids``, ``attention_mask`` and ``labels`` for a
+split as ``.npy`` files under a directory named by a fingerprint of the
+tokenizer, the max lengths, the prompt format and the split contents, so a
+later run with the same settings just maps the files back in.
+``tf_dataset`` then batches straight from those arrays: one vectorized
+gather per batch instead of a Python ``collate_fn`` over single examples.
+
+With ``bucketed=True`` examples of similar length are batched together and
+every batch is cut down to its longest member (dynamic padding), so short
+questions stop paying for 128-token attention. Pad positions in ``labels``
+are stored as -100, which the Hugging Face T5 loss ignores.
+
+    python -m training prepare --config experiments/agribot.json
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from prompts import build_prompt
+
+CACHE_VERSION = 2
+FIELDS = ('input_ids', 'attention_mask', 'labels')
+LENGTHS = ('input_lengths', 'label_lengths')
+LABEL_PAD = -100  # ignored by hf_compute_loss; _shift_right turns it back into pad for decoder inputs
+
+
+def load_qa_dataset(name_or_path):
+    """The ``train`` split of a Hugging Face dataset, or of a local JSON/CSV file."""
+    from datasets import load_dataset
+
+    if os.path.isfile(name_or_path):
+        data_format = 'csv' if name_or_path.endswith('.csv') else 'json'
+        return load_dataset(data_format, data_files=name_or_path)['train']
+    return load_dataset(name_or_path)['train']
+
+
+def split_dataset(dataset, test_size=0.2, seed=42):
+    # One split call; the notebooks called train_test_split twice for the same result
+    splits = dataset.train_test_split(test_size=test_size, seed=seed)
+    return splits['train'], splits['test']
+
+
+def questions_and_answers(examples):
+    # Same fallbacks as the notebooks' preprocess_data
+    questions = [str(q) if q else "Unknown question" for q in examples['question']]
+    answers = [str(a) if a else "No answer available" for a in examples['answers']]
+    return questions, answers
+
+
+def tokenizer_fingerprint(tokenizer):
+    digest = hashlib.sha256()
+    digest.update(type(tokenizer).__name__.encode())
+    digest.update(str(len(tokenizer)).encode())
+    vocab_file = getattr(tokenizer, 'vocab_file', None)
+    if vocab_file and os.path.exists(vocab_file):
+        with open(vocab_file, 'rb') as f:
+            digest.update(f.read())
+    else:
+        digest.update(str(tokenizer.name_or_path).encode())
+    return digest.hexdigest()
+
+
+def cache_fingerprint(tokenizer, max_input_length, max_target_length, data_fingerprint):
+    key = {
+        'version': CACHE_VERSION,
+        'tokenizer': tokenizer_fingerprint(tokenizer),
+        'max_input_length': max_input_length,
+        'max_target_length': max_target_length,
+        'prompt': build_prompt('{q}'),
+        'data': data_fingerprint,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def data_fingerprint(dataset):
+    # datasets.Dataset tracks a content/transform hash; fall back to hashing the rows
+    fingerprint = getattr(dataset, '_fingerprint', None)
+    if fingerprint:
+        return fingerprint
+    digest = hashlib.sha256()
+    for question, answer in zip(dataset['question'], dataset['answers']):
+        digest.update(f"{question}\x00{answer}\x01".encode())
+    return digest.hexdigest()
+
+
+def token_dtype(tokenizer):
+    # T5's 32k vocabulary fits in int16, halving the files and the page cache they use
+    return np.int16 if len(tokenizer) <= np.iinfo(np.int16).max else np.int32
+
+
+def tokenize(tokenizer, questions, answers, max_input_length=128, max_target_length=128, chunk_size=2048):
+    n = len(questions)
+    dtype = token_dtype(tokenizer)
+    arrays = {
+        'input_ids': np.zeros((n, max_input_length), dtype=dtype),
+        'attention_mask': np.zeros((n, max_input_length), dtype=np.int8),
+        'labels': np.zeros((n, max_target_length), dtype=dtype),
+        'input_lengths': np.zeros(n, dtype=np.int16),
+        'label_lengths': np.zeros(n, dtype=np.int16),
+    }
+    for start in range(0, n, chunk_size):
+        end = min(n, start + chunk_size)
+        inputs = tokenizer([build_prompt(q) for q in questions[start:end]], max_length=max_input_length,
+                           truncation=True, padding='max_length', return_tensors='np')
+        labels = tokenizer(list(answers[start:end]), max_length=max_target_length,
+                           truncation=True, padding='max_length', return_tensors='np')
+        arrays['input_ids'][start:end] = inputs['input_ids']
+        arrays['attention_mask'][start:end] = inputs['attention_mask']
+        arrays['labels'][start:end] = np.where(labels['attention_mask'] == 1, labels['input_ids'], LABEL_PAD)
+        arrays['input_lengths'][start:end] = inputs['attention_mask'].sum(axis=1)
+        arrays['label_lengths'][start:end] = labels['attention_mask'].sum(axis=1)
+    return arrays
+
+
+def save_arrays(arrays, path, meta):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), array)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # Another process finished the same cache first; theirs is identical
+        for name in os.listdir(tmp):
+            os.remove(os.path.join(tmp, name))
+        os.rmdir(tmp)
+
+
+def load_arrays(path):
+    return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in FIELDS + LENGTHS}
+
+
+def build_cache(dataset, tokenizer, cache_dir, max_input_length=128, max_target_length=128):
+    """Return memory-mapped arrays for ``dataset``, tokenizing only on a cache miss."""
+    fingerprint = cache_fingerprint(tokenizer, max_input_length, max_target_length, data_fingerprint(dataset))
+    path = os.path.join(cache_dir, fingerprint)
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        questions, answers = questions_and_answers(dataset)
+        arrays = tokenize(tokenizer, questions, answers, max_input_length, max_target_length)
+        os.makedirs(cache_dir, exist_ok=True)
+        save_arrays(arrays, path, {
+            'examples': len(questions),
+            'tokenizer': str(tokenizer.name_or_path),
+            'max_input_length': max_input_length,
+            'max_target_length': max_target_length,
+        })
+    return load_arrays(path)
+
+
+def length_bucketed_batches(lengths, batch_size, rng=None, pool_batches=100):
+    """Split example indices into batches of similar length.
+
+    Indices are shuffled (when ``rng`` is given), cut into pools of
+    ``pool_batches`` batches, sorted by length inside each pool and batched;
+    the batch order is shuffled again so an epoch doesn't run short-to-long.
+    """
+    n = len(lengths)
+    order = rng.permutation(n) if rng is not None else np.arange(n)
+    pool = batch_size * pool_batches
+    batches = []
+    for start in range(0, n, pool):
+        chunk = order[start:start + pool]
+        chunk = chunk[np.argsort(lengths[chunk], kind='stable')]
+        batches.extend(chunk[i:i + batch_size] for i in range(0, len(chunk), batch_size))
+    if rng is not None:
+        batches = [batches[i] for i in rng.permutation(len(batches))]
+    return batches
+
+
+def fixed_batches(n, batch_size, rng=None):
+    order = rng.permutation(n) if rng is not None else np.arange(n)
+    return [order[i:i + batch_size] for i in range(0, n, batch_size)]
+
+
+def padded_length(length, multiple, limit):
+    return min(limit, -(-int(length) // multiple) * multiple)
+
+
+def padding_efficiency(arrays, batches, dynamic=True, pad_multiple=8):
+    """Fraction of input/label positions in ``batches`` that hold real tokens."""
+    stats = {}
+    for field, lengths in (('input', arrays['input_lengths']), ('label', arrays['label_lengths'])):
+        width = arrays['input_ids' if field == 'input' else 'labels'].shape[1]
+        real = slots = 0
+        for batch in batches:
+            batch_lengths = lengths[batch]
+            real += int(batch_lengths.sum())
+            columns = padded_length(batch_lengths.max(), pad_multiple, width) if dynamic else width
+            slots += len(batch) * columns
+        stats[field] = real / slots if slots else 1.0
+    return stats
+
+
+def padding_report(arrays, batch_size=8, pad_multiple=8, seed=0):
+    """Padding efficiency of fixed max-length batches vs length-bucketed dynamic padding."""
+    n = len(arrays['input_ids'])
+    lengths = np.asarray(arrays['input_lengths'], dtype=np.int32) + np.asarray(arrays['label_lengths'], dtype=np.int32)
+    rng = np.random.default_rng(seed)
+    return {
+        'fixed': padding_efficiency(arrays, fixed_batches(n, batch_size, rng), dynamic=False),
+        'bucketed': padding_efficiency(arrays, length_bucketed_batches(lengths, batch_size, rng),
+                                       pad_multiple=pad_multiple),
+    }
+
+
+def tf_dataset(arrays, batch_size=8, shuffle=False, seed=42, bucketed=False, pool_batches=100, pad_multiple=8,
+               start_epoch=0):
+    """Batches of ``{'input_ids', 'attention_mask', 'labels'}`` int32 tensors.
+
+    ``bucketed`` batches examples of similar length and pads each batch only
+    to its longest example, rounded up to ``pad_multiple`` to bound the number
+    of distinct shapes (and so retraces of the train step). The shuffle of
+    each epoch depends only on ``seed`` and the epoch number, so a run resumed
+    at ``start_epoch`` sees the same batches it would have seen.
+    """
+    import tensorflow as tf
+
+    n = len(arrays['input_ids'])
+    lengths = np.asarray(arrays['input_lengths'], dtype=np.int32) + np.asarray(arrays['label_lengths'], dtype=np.int32)
+    epoch = [start_epoch]
+
+    def batch_indices():
+        # Re-run by tf.data for every epoch, so shuffled epochs differ
+        rng = np.random.default_rng([seed, epoch[0]]) if shuffle else None
+        epoch[0] += 1
+        if bucketed:
+            batches = length_bucketed_batches(lengths, batch_size, rng, pool_batches)
+        else:
+            batches = fixed_batches(n, batch_size, rng)
+        for batch in batches:
+            yield np.sort(batch)  # sorted reads keep the mmap access mostly sequential
+
+    def gather(batch):
+        columns = {}
+        if bucketed:
+            columns['input_ids'] = columns['attention_mask'] = padded_length(
+                arrays['input_lengths'][batch].max(), pad_multiple, arrays['input_ids'].shape[1])
+            columns['labels'] = padded_length(arrays['label_lengths'][batch].max(), pad_multiple,
+                                              arrays['labels'].shape[1])
+        return tuple(np.asarray(arrays[name][batch, :columns.get(name)], dtype=np.int32) for name in FIELDS)
+
+    def load(batch):
+        tensors = tf.numpy_function(gather, [batch], [tf.int32] * len(FIELDS))
+        result = {}
+        for name, tensor in zip(FIELDS, tensors):
+            tensor.set_shape([None, None if bucketed else arrays[name].shape[1]])
+            result[name] = tensor
+        return result
+
+    indices = tf.data.Dataset.from_generator(batch_indices, output_signature=tf.TensorSpec([None], tf.int64))
+    return indices.map(load, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def inference_batches(tokenizer, prompts, batch_size=8, max_length=128):
+    """Yield ``(positions, input_ids, attention_mask)`` for prompts batched by length.
+
+    Each batch is padded to its own longest prompt; ``positions`` map the
+    rows back to their place in ``prompts``.
+    """
+    prompts = list(prompts)
+    if not prompts:
+        return  # length_bucketed_batches would get a pool of zero batches
+    encoded = tokenizer(prompts, max_length=max_length, truncation=True)['input_ids']
+    lengths = np.array([len(ids) for ids in encoded])
+    for batch in length_bucketed_batches(lengths, batch_size, pool_batches=len(encoded)):
+        padded = tokenizer.pad({'input_ids': [encoded[i] for i in batch]}, return_tensors='tf')
+        yield batch, padded['input_ids'], padded['attention_mask']
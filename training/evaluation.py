@@ -0,0 +1,139 @@
+"""Generate answers for the validation split and score them.
+
+Predictions are appended to a JSONL file under ``output_dir/predictions/``
+named by a fingerprint of the model files, the split and the decoding
+settings. An interrupted run picks up where it stopped, and re-scoring with
+other ``metrics`` reads the file instead of decoding again.
+
+    python -m training evaluate --config experiments/agribot.json --set metrics='["rouge"]'
+"""
+import hashlib
+import json
+import os
+import time
+
+from transformers import T5Tokenizer, TFT5ForConditionalGeneration
+
+from prompts import build_prompt
+from training.data import data_fingerprint, inference_batches, load_qa_dataset, questions_and_answers, split_dataset
+from training.scoring import score
+
+
+def iter_predictions(model, tokenizer, questions, batch_size=8, max_input_length=128, max_length=128, num_beams=4):
+    """Yield ``(positions, predictions)`` per generated batch.
+
+    Batches are length-sorted; positions index into ``questions``.
+    """
+    for positions, input_ids, attention_mask in inference_batches(
+            tokenizer, [build_prompt(q) for q in questions], batch_size, max_input_length):
+        outputs = model.generate(input_ids=input_ids, attention_mask=attention_mask, max_length=max_length,
+                                 num_beams=num_beams)
+        yield positions, tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+
+def generate_predictions(model, tokenizer, questions, batch_size=8, max_length=128, num_beams=4,
+                         max_input_length=128):
+    predictions = [None] * len(questions)
+    for positions, batch_predictions in iter_predictions(model, tokenizer, questions, batch_size, max_input_length,
+                                                         max_length, num_beams):
+        for position, prediction in zip(positions, batch_predictions):
+            predictions[position] = prediction
+    return predictions
+
+
+def model_fingerprint(model_dir):
+    if not os.path.isdir(model_dir):
+        raise SystemExit(f"No trained model in {model_dir}: run `python -m training train` with this config first, "
+                         f"or set model_output_dir")
+    # Retraining into the same directory rewrites the weights, which changes size/mtime
+    entries = []
+    for name in sorted(os.listdir(model_dir)):
+        stat = os.stat(os.path.join(model_dir, name))
+        entries.append([name, stat.st_size, stat.st_mtime_ns])
+    return entries
+
+
+def prediction_cache_path(config, model_dir, tokenizer_dir, val_split):
+    key = {
+        'model': model_fingerprint(model_dir),
+        'tokenizer': os.path.abspath(tokenizer_dir),
+        'data': data_fingerprint(val_split),
+        'prompt': build_prompt('{q}'),
+        'max_input_length': config['max_input_length'],
+        'max_target_length': config['max_target_length'],
+        'num_beams': config['num_beams'],
+    }
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+    return os.path.join(config['output_dir'], 'predictions', f'{digest}.jsonl')
+
+
+def load_cached_predictions(path):
+    predictions = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    break  # partial last line from an interrupted run
+                predictions[row['index']] = row['prediction']
+    return predictions
+
+
+def evaluate_model(config, model=None, tokenizer=None):
+    """Score the validation split (its first ``eval_samples`` examples if set) and write eval_report.json."""
+    started = time.perf_counter()
+    model_dir = config['model_output_dir'] or os.path.join(config['output_dir'], 'model')
+    tokenizer_dir = config['tokenizer_output_dir'] or os.path.join(config['output_dir'], 'tokenizer')
+
+    _, val_split = split_dataset(load_qa_dataset(config['dataset']), config['test_size'], config['seed'])
+    # Keyed on the whole split, so raising eval_samples only decodes the new examples
+    cache_path = prediction_cache_path(config, model_dir, tokenizer_dir, val_split)
+    if config['eval_samples']:
+        val_split = val_split.select(range(min(config['eval_samples'], len(val_split))))
+    questions, answers = questions_and_answers(val_split)
+
+    predictions = load_cached_predictions(cache_path)
+    missing = [i for i in range(len(questions)) if i not in predictions]
+    cached = len(questions) - len(missing)
+    print(f"{len(questions)} validation examples, {cached} cached in {cache_path}")
+
+    generation_seconds = 0.0
+    if missing:
+        tokenizer = tokenizer or T5Tokenizer.from_pretrained(tokenizer_dir)
+        model = model or TFT5ForConditionalGeneration.from_pretrained(model_dir)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        generation_started = time.perf_counter()
+        with open(cache_path, 'a') as f:
+            for positions, batch_predictions in iter_predictions(
+                    model, tokenizer, [questions[i] for i in missing], config['eval_batch_size'],
+                    config['max_input_length'], config['max_target_length'], config['num_beams']):
+                for position, prediction in zip(positions, batch_predictions):
+                    predictions[missing[position]] = prediction
+                    f.write(json.dumps({'index': missing[position], 'prediction': prediction}) + '\n')
+                f.flush()
+        generation_seconds = time.perf_counter() - generation_started
+
+    metric_started = time.perf_counter()
+    ordered = [predictions[i] for i in range(len(questions))]
+    results = score(ordered, [[a] for a in answers], config['metrics'], config['metric_workers'])
+    metric_seconds = time.perf_counter() - metric_started
+
+    report = {
+        'model_dir': model_dir,
+        'examples': len(questions),
+        'generated': len(missing),
+        'cached': cached,
+        'generation_seconds': round(generation_seconds, 3),
+        'examples_per_second': round(len(missing) / generation_seconds, 2) if generation_seconds else None,
+        'metric_seconds': round(metric_seconds, 3),
+        'total_seconds': round(time.perf_counter() - started, 3),
+        'decoding': {'batch_size': config['eval_batch_size'], 'num_beams': config['num_beams'],
+                     'max_length': config['max_target_length']},
+        'predictions_file': cache_path,
+        'metrics': results,
+    }
+    os.makedirs(config['output_dir'], exist_ok=True)
+    with open(os.path.join(config['output_dir'], 'eval_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
@@ -0,0 +1,55 @@
+"""BLEU/ROUGE scoring in a process pool.
+
+Kept apart from training/evaluation.py so spawned workers only import
+numpy and ``evaluate``, not TensorFlow and transformers.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Metrics that can score examples independently; they are split into shards
+# across workers and averaged. Corpus-level metrics (BLEU) run as one task.
+PER_EXAMPLE_METRICS = {'rouge'}
+
+
+def compute_metric(name, predictions, references, per_example=False):
+    import evaluate
+
+    metric = evaluate.load(name)
+    if per_example:
+        return metric.compute(predictions=predictions, references=references, use_aggregator=False)
+    return metric.compute(predictions=predictions, references=references)
+
+
+def shards(n, count):
+    size = max(1, -(-n // count))
+    return [(start, min(start + size, n)) for start in range(0, n, size)]
+
+
+def score(predictions, references, metrics=('bleu', 'rouge'), workers=None):
+    """``{metric: result}``, with every metric and ROUGE shard in its own process."""
+    workers = workers or min(os.cpu_count() or 1, 8)
+    # spawn, not fork: the parent usually has TensorFlow's thread pools running
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        tasks = {}
+        for name in metrics:
+            if name in PER_EXAMPLE_METRICS:
+                tasks[name] = [pool.submit(compute_metric, name, predictions[start:end], references[start:end], True)
+                               for start, end in shards(len(predictions), workers)]
+            else:
+                tasks[name] = [pool.submit(compute_metric, name, predictions, references)]
+
+        results = {}
+        for name, futures in tasks.items():
+            if name not in PER_EXAMPLE_METRICS:
+                results[name] = futures[0].result()
+                continue
+            per_example = {}
+            for future in futures:
+                for key, values in future.result().items():
+                    per_example.setdefault(key, []).extend(values)
+            results[name] = {key: float(np.mean(values)) for key, values in per_example.items()}
+    return results
@@ -0,0 +1,201 @@
+import json
+import os
+import time
+
+import tensorflow as tf
+from transformers import T5Tokenizer, TFT5ForConditionalGeneration
+
+try:
+    # Recent transformers run on tf_keras when Keras 3 is installed; older ones use tf.keras
+    from transformers.modeling_tf_utils import keras
+except ImportError:
+    keras = tf.keras
+
+from training.data import build_cache, load_qa_dataset, padding_report, split_dataset, tf_dataset
+
+OPTIMIZERS = {'adam': 'Adam', 'nadam': 'Nadam', 'sgd': 'SGD'}
+
+
+def make_optimizer(config):
+    name = config['optimizer'].lower()
+    if name not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimizer: {config['optimizer']} (expected one of {', '.join(OPTIMIZERS)})")
+    optimizer = getattr(keras.optimizers, OPTIMIZERS[name])(learning_rate=config['learning_rate'])
+    if config['mixed_precision'] == 'mixed_float16':
+        # float16 gradients underflow without loss scaling; bfloat16 has float32's range and doesn't need it
+        optimizer = keras.mixed_precision.LossScaleOptimizer(optimizer)
+    return optimizer
+
+
+def load_splits(config, tokenizer):
+    """Raw train/validation splits and their cached token arrays."""
+    train_split, val_split = split_dataset(load_qa_dataset(config['dataset']), config['test_size'], config['seed'])
+    arrays = [build_cache(split, tokenizer, config['cache_dir'], config['max_input_length'],
+                          config['max_target_length'])
+              for split in (train_split, val_split)]
+    return (train_split, val_split), arrays
+
+
+class Trainer:
+    """Custom training loop for the T5 QA model.
+
+    Adds what ``model.fit`` in the notebooks didn't have: gradient
+    accumulation (``grad_accum_steps`` micro-batches per optimizer step),
+    optional mixed precision, and ``tf.train.Checkpoint`` snapshots of the
+    model, optimizer and position in the epoch so an interrupted run resumes
+    where it stopped.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.output_dir = config['output_dir']
+        self.accum_steps = config['grad_accum_steps']
+        if config['mixed_precision']:
+            keras.mixed_precision.set_global_policy(config['mixed_precision'])
+        self.tokenizer = T5Tokenizer.from_pretrained(config['tokenizer_name'])
+        self.model = TFT5ForConditionalGeneration.from_pretrained(config['model_name'])
+        self.optimizer = make_optimizer(config)
+        self.loss_scaling = isinstance(self.optimizer, keras.mixed_precision.LossScaleOptimizer)
+        self.variables = self.model.trainable_variables
+        self.accumulators = [tf.Variable(tf.zeros_like(v), trainable=False) for v in self.variables] \
+            if self.accum_steps > 1 else []
+
+        self.epoch = tf.Variable(0, dtype=tf.int64)
+        self.step_in_epoch = tf.Variable(0, dtype=tf.int64)
+        self.checkpoint = tf.train.Checkpoint(model=self.model, optimizer=self.optimizer,
+                                              epoch=self.epoch, step_in_epoch=self.step_in_epoch)
+        self.checkpoints = tf.train.CheckpointManager(self.checkpoint, os.path.join(self.output_dir, 'checkpoints'),
+                                                      max_to_keep=config['keep_checkpoints'])
+
+        self._train_step = tf.function(self._train_step_fn, reduce_retracing=True)
+        self._apply_accumulated = tf.function(self._apply_accumulated_fn)
+        self._eval_step = tf.function(self._eval_step_fn, reduce_retracing=True)
+
+    def _loss(self, batch, training):
+        outputs = self.model(input_ids=batch['input_ids'], attention_mask=batch['attention_mask'],
+                             labels=batch['labels'], training=training)
+        return tf.cast(tf.reduce_mean(outputs.loss), tf.float32)
+
+    def _gradients(self, batch):
+        with tf.GradientTape() as tape:
+            loss = self._loss(batch, training=True)
+            scaled_loss = self.optimizer.get_scaled_loss(loss) if self.loss_scaling else loss
+        gradients = tape.gradient(scaled_loss, self.variables)
+        if self.loss_scaling:
+            gradients = self.optimizer.get_unscaled_gradients(gradients)
+        return loss, gradients
+
+    def _train_step_fn(self, batch):
+        loss, gradients = self._gradients(batch)
+        if not self.accumulators:
+            self.optimizer.apply_gradients(zip(gradients, self.variables))
+            return loss
+        for accumulator, gradient in zip(self.accumulators, gradients):
+            if gradient is not None:
+                # Embedding gradients arrive as IndexedSlices
+                accumulator.assign_add(tf.convert_to_tensor(gradient))
+        return loss
+
+    def _apply_accumulated_fn(self, micro_batches):
+        self.optimizer.apply_gradients(
+            zip([accumulator / micro_batches for accumulator in self.accumulators], self.variables))
+        for accumulator in self.accumulators:
+            accumulator.assign(tf.zeros_like(accumulator))
+
+    def _eval_step_fn(self, batch):
+        return self._loss(batch, training=False)
+
+    def _history_path(self):
+        return os.path.join(self.output_dir, 'history.json')
+
+    def _load_history(self):
+        if os.path.exists(self._history_path()):
+            with open(self._history_path()) as f:
+                return json.load(f)
+        return {'loss': [], 'val_loss': [], 'epoch_seconds': []}
+
+    def _save_history(self, history):
+        with open(self._history_path(), 'w') as f:
+            json.dump(history, f, indent=2)
+
+    def evaluate_loss(self, data):
+        total, batches = 0.0, 0
+        for batch in data:
+            total += float(self._eval_step(batch))
+            batches += 1
+        return total / max(batches, 1)
+
+    def train(self, train_arrays, val_arrays):
+        config = self.config
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, 'config.json'), 'w') as f:
+            json.dump(config, f, indent=2)
+
+        history = {'loss': [], 'val_loss': [], 'epoch_seconds': []}
+        if config['resume'] and self.checkpoints.latest_checkpoint:
+            self.checkpoint.restore(self.checkpoints.latest_checkpoint)
+            history = self._load_history()
+            print(f"Resuming from {self.checkpoints.latest_checkpoint} "
+                  f"(epoch {int(self.epoch) + 1}, step {int(self.step_in_epoch)})")
+        start_epoch, skip_steps = int(self.epoch), int(self.step_in_epoch)
+
+        print("Padding efficiency (share of real tokens per batch):",
+              padding_report(train_arrays, config['batch_size']))
+        train_data = tf_dataset(train_arrays, batch_size=config['batch_size'], shuffle=True, seed=config['seed'],
+                                bucketed=config['bucketed'], start_epoch=start_epoch)
+        val_data = tf_dataset(val_arrays, batch_size=config['batch_size'], bucketed=config['bucketed'])
+
+        optimizer_steps = 0
+        for epoch in range(start_epoch, config['epochs']):
+            started = time.perf_counter()
+            loss_sum, loss_count, pending = tf.constant(0.0), 0, 0
+            for step, batch in enumerate(train_data):
+                if epoch == start_epoch and step < skip_steps:
+                    continue  # already trained on before the checkpoint; batch order is seeded per epoch
+                loss_sum += self._train_step(batch)
+                loss_count += 1
+                if self.accumulators:
+                    pending += 1
+                    if pending < self.accum_steps:
+                        continue
+                    self._apply_accumulated(tf.constant(float(pending)))
+                    pending = 0
+                optimizer_steps += 1
+                # Only on optimizer-step boundaries, so no half-accumulated gradients are lost on resume
+                if config['checkpoint_every_steps'] and optimizer_steps % config['checkpoint_every_steps'] == 0:
+                    self.epoch.assign(epoch)
+                    self.step_in_epoch.assign(step + 1)
+                    self.checkpoints.save()
+            if pending:
+                # Leftover micro-batches at the end of the epoch
+                self._apply_accumulated(tf.constant(float(pending)))
+
+            train_loss = float(loss_sum) / max(loss_count, 1)
+            val_loss = self.evaluate_loss(val_data)
+            seconds = time.perf_counter() - started
+            history['loss'].append(train_loss)
+            history['val_loss'].append(val_loss)
+            history['epoch_seconds'].append(seconds)
+            print(f"Epoch {epoch + 1}/{config['epochs']} - {seconds:.0f}s - loss: {train_loss:.4f} - "
+                  f"val_loss: {val_loss:.4f}")
+
+            self.epoch.assign(epoch + 1)
+            self.step_in_epoch.assign(0)
+            self.checkpoints.save()
+            self._save_history(history)
+
+        self.save_pretrained()
+        return history
+
+    def save_pretrained(self):
+        model_dir = self.config['model_output_dir'] or os.path.join(self.output_dir, 'model')
+        tokenizer_dir = self.config['tokenizer_output_dir'] or os.path.join(self.output_dir, 'tokenizer')
+        self.model.save_pretrained(model_dir)
+        self.tokenizer.save_pretrained(tokenizer_dir)
+        print(f"Saved model to {model_dir} and tokenizer to {tokenizer_dir}")
+
+
+def train(config):
+    trainer = Trainer(config)
+    _, (train_arrays, val_arrays) = load_splits(config, trainer.tokenizer)
+    return trainer.train(train_arrays, val_arrays)
@@ -0,0 +1,47 @@
+"""Short-lived per-worker copies of user rows, so authenticated requests skip the user SELECT.
+
+Flask-Login loads the user on every request. ``load_user`` keeps the row's
+column values here for ``ttl`` seconds and rebuilds the User from them,
+attached to the request's session without a query, so changes made to
+``current_user`` are still flushed. This worker drops a user's entry when it
+changes the row (``forget``); changes made by other workers show up once the
+entry expires.
+"""
+import json
+import threading
+
+from answer_cache import MemoryBackend
+
+
+class UserCache:
+
+    def __init__(self, ttl=5, max_entries=10000):
+        self.backend = MemoryBackend(ttl=ttl, max_bytes=max_entries * 1024, max_entries=max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(ttl=config['USER_CACHE_TTL'], max_entries=config['USER_CACHE_MAX_ENTRIES'])
+
+    def get(self, user_id):
+        """The cached column values of the user's row, or None."""
+        values = self.backend.get(str(user_id))
+        with self._lock:
+            if values is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return json.loads(values) if values is not None else None
+
+    def set(self, user_id, values):
+        self.backend.set(str(user_id), json.dumps(values))
+
+    def forget(self, user_id):
+        self.backend.delete(str(user_id))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.backend._entries)}